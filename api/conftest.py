@@ -0,0 +1 @@
+# pytest loads this first and puts api/ on sys.path, so the tests import modules the way main.py does
@@ -0,0 +1,335 @@
+"""
+Asyncio client for the Emotiv Cortex API.
+
+Runs on the caller's event loop (FastAPI's, in the API) without threads of its own:
+every JSON-RPC call is awaitable and matched to its response by a unique id, stream
+samples are read with `async for`, and waiting on the headset or on access approval
+backs off with asyncio.sleep instead of blocking.
+
+    cortex = AsyncCortex(client_id, client_secret)
+    await cortex.open()
+    await cortex.authorize()
+    headset = await cortex.connect_headset()
+    session = await cortex.create_session(headset)
+    async with cortex.stream(session, 'pow') as samples:
+        await cortex.subscribe(session, ['pow'])
+        async for sample in samples:
+            ...
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import ssl
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+import websockets
+
+from .cortex_protocol import data_labels, CORTEX_STOP_ALL_STREAMS, CORTEX_CLOSE_SESSION, HEADSET_DISCONNECTED_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+CORTEX_URL = os.getenv("CORTEX_URL", "wss://localhost:6868")
+# seconds to wait for the response to one call
+CORTEX_CALL_TIMEOUT = float(os.getenv("CORTEX_CALL_TIMEOUT", "10"))
+# attempts for the steps that wait on something outside the API (Cortex starting, the headset, the user)
+CORTEX_RETRIES = int(os.getenv("CORTEX_RETRIES", "6"))
+# samples waiting in one stream iterator; a consumer that falls behind loses the oldest
+CORTEX_STREAM_QUEUE = int(os.getenv("CORTEX_STREAM_QUEUE", "256"))
+
+# keys that name the stream of a data message
+STREAM_KEYS = ('eeg', 'mot', 'dev', 'met', 'pow', 'com', 'fac', 'sys')
+
+
+class CortexError(Exception):
+    """Error response to a Cortex call"""
+
+    def __init__(self, method: str, error: dict):
+        super().__init__(f"{method}: {error.get('message')} ({error.get('code')})")
+        self.code = error.get('code')
+        self.data = error.get('data')
+
+
+class CortexConnectionError(ConnectionError):
+    """The Cortex WebSocket is not open or closed while waiting"""
+
+
+class NotReady(Exception):
+    """Raised by a retried step that should be tried again later"""
+
+
+async def retry(step: Callable[[], Awaitable], attempts: int = CORTEX_RETRIES, base_delay: float = 0.5,
+                max_delay: float = 8.0, retry_on: tuple = (NotReady, OSError, CortexConnectionError)):
+    """Await step until it succeeds, sleeping with exponential backoff and jitter between attempts"""
+    for attempt in range(attempts):
+        try:
+            return await step()
+        except retry_on as e:
+            if attempt == attempts - 1:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.info("%s, retrying in %.1fs", e, delay)
+            await asyncio.sleep(delay)
+
+
+@dataclass
+class Sample:
+    time: float
+    values: list
+
+
+def message_kind(message: dict) -> str:
+    """Stream name of a data message, result / error / warning otherwise"""
+    if 'sid' in message:
+        return next((key for key in STREAM_KEYS if key in message), 'stream')
+    return next((key for key in ('result', 'error', 'warning') if key in message), 'unknown')
+
+
+def sample_values(stream: str, message: dict) -> list:
+    """Values of a stream message in the order of its data_labels"""
+    if stream == 'eeg':
+        # remove MARKERS
+        return message['eeg'][:-1]
+    if stream == 'dev':
+        return message['dev'][2]
+    return message[stream]
+
+
+class StreamIterator:
+    """Samples of one stream of one session, for `async for`; ends when the session or connection closes"""
+
+    def __init__(self, cortex: "AsyncCortex", session_id: str, stream: str, queue_size: int):
+        self.cortex = cortex
+        self.key = (session_id, stream)
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def put(self, sample: Optional[Sample]):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(sample)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Sample:
+        sample = await self.queue.get()
+        if sample is None:
+            raise StopAsyncIteration
+        return sample
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.cortex._remove_iterator(self)
+
+
+class AsyncCortex:
+    # optional callable(kind) run for every message received, with the message_kind; the API counts messages with it
+    message_hook = None
+
+    def __init__(self, client_id: str, client_secret: str, url: str = CORTEX_URL, debit: int = 10):
+        if not client_id or not client_secret:
+            raise ValueError("Cortex client id and secret are required")
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.url = url
+        self.debit = debit
+        self.token = None
+        self.ws = None
+        self.reader = None
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.iterators = {}
+        self.labels = {}
+        # optional callable(code, message) for Cortex warnings
+        self.on_warning = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.reader is not None and not self.reader.done()
+
+    async def open(self):
+        """Connect to Cortex, retrying while it is not reachable yet"""
+        if self.is_open:
+            return
+        # Cortex serves a self-signed certificate on localhost
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+        async def connect():
+            return await websockets.connect(self.url, ssl=context if self.url.startswith("wss") else None,
+                                            max_size=None)
+
+        self.ws = await retry(connect)
+        self.reader = asyncio.create_task(self._read())
+        logger.info("Cortex WebSocket open at %s", self.url)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self.reader is not None:
+            await asyncio.gather(self.reader, return_exceptions=True)
+        self.token = None
+
+    async def call(self, method: str, params: Optional[dict] = None, timeout: float = CORTEX_CALL_TIMEOUT):
+        """Send one JSON-RPC request and wait for its result"""
+        if not self.is_open:
+            raise CortexConnectionError("Cortex WebSocket is not open")
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = (method, future)
+        try:
+            await self.ws.send(json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method,
+                                           "params": params or {}}))
+            return await asyncio.wait_for(future, timeout)
+        except websockets.ConnectionClosed as e:
+            raise CortexConnectionError(f"Cortex WebSocket closed during {method}") from e
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def _read(self):
+        try:
+            async for raw in self.ws:
+                message = json.loads(raw)
+                if self.message_hook is not None:
+                    self.message_hook(message_kind(message))
+                if 'sid' in message:
+                    self._dispatch_sample(message)
+                elif 'warning' in message:
+                    self._handle_warning(message['warning'])
+                elif message.get('id') in self.pending:
+                    method, future = self.pending[message['id']]
+                    if future.done():
+                        continue
+                    if 'error' in message:
+                        future.set_exception(CortexError(method, message['error']))
+                    else:
+                        future.set_result(message.get('result'))
+        except websockets.ConnectionClosed:
+            pass
+        except Exception:
+            logger.exception("Cortex reader stopped")
+        finally:
+            logger.info("Cortex WebSocket closed")
+            for method, future in list(self.pending.values()):
+                if not future.done():
+                    future.set_exception(CortexConnectionError(f"Cortex WebSocket closed during {method}"))
+            for iterator in [it for its in self.iterators.values() for it in its]:
+                iterator.put(None)
+            self.iterators.clear()
+
+    def _dispatch_sample(self, message: dict):
+        stream = next((key for key in STREAM_KEYS if key in message), None)
+        iterators = self.iterators.get((message['sid'], stream))
+        if iterators:
+            sample = Sample(message['time'], sample_values(stream, message))
+            for iterator in iterators:
+                iterator.put(sample)
+
+    def _handle_warning(self, warning: dict):
+        code, payload = warning.get('code'), warning.get('message')
+        if code in (CORTEX_STOP_ALL_STREAMS, CORTEX_CLOSE_SESSION) and isinstance(payload, dict):
+            self._end_session(payload.get('sessionId'))
+        if code == HEADSET_DISCONNECTED_TIMEOUT:
+            logger.warning("Headset disconnected: %s", payload)
+        if self.on_warning is not None:
+            self.on_warning(code, payload)
+
+    def _end_session(self, session_id: str):
+        for key in [key for key in self.iterators if key[0] == session_id]:
+            for iterator in self.iterators.pop(key):
+                iterator.put(None)
+
+    def _remove_iterator(self, iterator: StreamIterator):
+        iterators = self.iterators.get(iterator.key, [])
+        if iterator in iterators:
+            iterators.remove(iterator)
+
+    def stream(self, session_id: str, stream: str, queue_size: int = CORTEX_STREAM_QUEUE) -> StreamIterator:
+        """Iterator over the samples of a stream; open it before subscribing so no sample is missed"""
+        iterator = StreamIterator(self, session_id, stream, queue_size)
+        self.iterators.setdefault(iterator.key, []).append(iterator)
+        return iterator
+
+    # Cortex API
+
+    async def authorize(self) -> str:
+        """Get a Cortex token, waiting (with backoff) while the user approves the app in the Emotiv Launcher"""
+        credentials = {"clientId": self.client_id, "clientSecret": self.client_secret}
+
+        async def granted():
+            result = await self.call("hasAccessRight", credentials)
+            if not result['accessGranted']:
+                result = await self.call("requestAccess", credentials)
+                if not result['accessGranted']:
+                    raise NotReady(result.get('message', "Access not granted yet"))
+
+        await retry(granted)
+        result = await self.call("authorize", {**credentials, "debit": self.debit})
+        self.token = result['cortexToken']
+        return self.token
+
+    async def query_headsets(self) -> list:
+        return await self.call("queryHeadsets")
+
+    async def connect_headset(self, headset_id: Optional[str] = None) -> str:
+        """Connect a headset (the first one found when no id is given) and wait until it is connected"""
+        await self.call("controlDevice", {"command": "refresh"})
+
+        async def connected():
+            headsets = await self.query_headsets()
+            headset = next((h for h in headsets if headset_id in (None, h['id'])), None)
+            if headset is None:
+                raise NotReady(f"Headset {headset_id} not found" if headset_id else "No headset found")
+            if headset['status'] == 'discovered':
+                await self.call("controlDevice", {"command": "connect", "headset": headset['id']})
+            if headset['status'] != 'connected':
+                raise NotReady(f"Headset {headset['id']} is {headset['status']}")
+            return headset['id']
+
+        return await retry(connected)
+
+    async def disconnect_headset(self, headset_id: str):
+        await self.call("controlDevice", {"command": "disconnect", "headset": headset_id})
+
+    async def create_session(self, headset_id: str) -> str:
+        result = await self.call("createSession", {"cortexToken": self.token, "headset": headset_id,
+                                                   "status": "active"})
+        return result['id']
+
+    async def close_session(self, session_id: str):
+        try:
+            await self.call("updateSession", {"cortexToken": self.token, "session": session_id,
+                                              "status": "close"})
+        finally:
+            self._end_session(session_id)
+            for key in [key for key in self.labels if key[0] == session_id]:
+                del self.labels[key]
+
+    async def subscribe(self, session_id: str, streams: list) -> dict:
+        """Subscribe to streams of a session, returns {stream: labels} of the ones that succeeded"""
+        result = await self.call("subscribe", {"cortexToken": self.token, "session": session_id,
+                                               "streams": streams})
+        for failure in result['failure']:
+            logger.warning("Could not subscribe to %s: %s", failure['streamName'], failure['message'])
+        subscribed = {}
+        for stream in result['success']:
+            name = stream['streamName']
+            subscribed[name] = data_labels(name, stream['cols'])
+            self.labels[(session_id, name)] = subscribed[name]
+        return subscribed
+
+    async def unsubscribe(self, session_id: str, streams: list):
+        await self.call("unsubscribe", {"cortexToken": self.token, "session": session_id, "streams": streams})
+        for stream in streams:
+            self.labels.pop((session_id, stream), None)
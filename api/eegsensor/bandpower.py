@@ -0,0 +1,118 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+from .ringbuffer import RingBuffer
+
+# Band power frames kept for windowed statistics (Cortex sends pow at 8 Hz, 4096 frames ~ 8.5 minutes)
+EEG_POW_BUFFER_FRAMES = int(os.getenv("EEG_POW_BUFFER_FRAMES", "4096"))
+# longest window /eeg/bandpower/window accepts, in seconds
+MAX_WINDOW_SECONDS = float(os.getenv("EEG_MAX_WINDOW_SECONDS", "300"))
+
+# bands reported by the API, in order
+BANDS = ('theta', 'alpha', 'lowbeta', 'highbeta', 'gamma')
+BAND_DESCRIPTIONS = {
+    'theta': 'Drowsiness, meditation',
+    'alpha': 'Relaxation, creativity',
+    'lowbeta': 'Focus, alertness',
+    'highbeta': 'Anxiety, engagement',
+    'gamma': 'Information processing'
+}
+# Cortex pow columns are "<channel>/<band>"
+CORTEX_BANDS = {'theta': 'theta', 'alpha': 'alpha', 'betaL': 'lowbeta', 'betaH': 'highbeta', 'gamma': 'gamma'}
+
+
+def column_bands(labels: list) -> np.ndarray:
+    """Band index of every pow column, from the labels Cortex sends when the stream is subscribed"""
+    bands = []
+    for label in labels:
+        band = CORTEX_BANDS.get(label.split('/')[-1])
+        bands.append(BANDS.index(band) if band else -1)
+    return np.array(bands, dtype=np.int64)
+
+
+def band_frame(bands: np.ndarray, timestamp: float, source: str, descriptions: dict) -> dict:
+    """One frame of /eeg/stream: the share of each band in the total power, in %"""
+    total = float(bands.sum())
+    percentages = bands * (100.0 / total) if total > 0 else np.zeros_like(bands)
+    return {
+        "time": timestamp,
+        "source": source,
+        "bands": [
+            {"band": band, "percentage": round(float(percentages[i]), 2), "description": descriptions[band]}
+            for i, band in enumerate(BANDS)
+        ],
+    }
+
+
+class BandPowerBuffer:
+    """
+    Band power frames reduced to one row per frame with the power of each band
+    averaged over all channels, kept in a RingBuffer of the last capacity frames
+    so windowed statistics see every frame instead of only the latest one.
+    Frames come from one source at a time (headset or simulated): a frame from
+    another source than the buffered ones starts the buffer over.
+    """
+
+    def __init__(self, capacity: int = EEG_POW_BUFFER_FRAMES):
+        self.frames = RingBuffer(BANDS, capacity)
+        self.columns: Optional[np.ndarray] = None
+        self.source: Optional[str] = None
+
+    def set_columns(self, labels: list):
+        self.columns = column_bands(labels)
+
+    def _band_means(self, pow_values) -> np.ndarray:
+        pow_values = np.asarray(pow_values, dtype=np.float64)
+        columns = self.columns
+        if columns is None or len(columns) != len(pow_values):
+            # labels not received yet: Cortex orders the bands the same way for every channel
+            columns = np.arange(len(pow_values)) % len(BANDS)
+        valid = columns >= 0
+        sums = np.bincount(columns[valid], weights=pow_values[valid], minlength=len(BANDS))
+        counts = np.bincount(columns[valid], minlength=len(BANDS))
+        return sums / np.maximum(counts, 1)
+
+    def _append(self, row: np.ndarray, timestamp: Optional[float], source: str):
+        if source != self.source:
+            # a window never mixes simulated and headset frames
+            self.frames.clear()
+            self.source = source
+        self.frames.append(row, timestamp)
+
+    def append_pow(self, pow_values, timestamp: Optional[float] = None, source: str = "headset") -> np.ndarray:
+        """Add one Cortex pow frame (all channels x bands), returns its per-band power"""
+        bands = self._band_means(pow_values)
+        self._append(bands, timestamp, source)
+        return bands
+
+    def append_bands(self, bands: dict, timestamp: Optional[float] = None, source: str = "simulated") -> np.ndarray:
+        """Add one frame given as {band: power}"""
+        row = np.array([bands.get(band, 0.0) for band in BANDS], dtype=np.float64)
+        self._append(row, timestamp, source)
+        return row
+
+    def stats(self, seconds: float, now: Optional[float] = None) -> dict:
+        """Per-band mean / median / variance of the relative band power (in %) over the window"""
+        times, values = self.frames.window(seconds, now)
+        result = {"seconds": seconds, "frames": int(len(times)), "source": self.source, "bands": {}}
+        if len(times) == 0:
+            return result
+
+        totals = values.sum(axis=1, keepdims=True)
+        percentages = np.divide(values * 100.0, totals, out=np.zeros_like(values), where=totals > 0)
+        mean = percentages.mean(axis=0)
+        median = np.median(percentages, axis=0)
+        variance = percentages.var(axis=0)
+        result["start"] = float(times[0])
+        result["end"] = float(times[-1])
+        result["bands"] = {
+            band: {
+                "mean": round(float(mean[i]), 2),
+                "median": round(float(median[i]), 2),
+                "variance": round(float(variance[i]), 4),
+            }
+            for i, band in enumerate(BANDS)
+        }
+        return result
@@ -0,0 +1,100 @@
+import asyncio
+import collections
+import logging
+import os
+import threading
+import time
+
+from metrics import eeg_stream_dropped
+
+logger = logging.getLogger(__name__)
+
+# Highest rate a /eeg/stream client can ask for, in frames per second (Cortex sends pow at 8 Hz)
+EEG_STREAM_MAX_RATE = float(os.getenv("EEG_STREAM_MAX_RATE", "8"))
+# Frames waiting to be sent to one client; when a slow client falls further behind the oldest are dropped
+EEG_STREAM_QUEUE = int(os.getenv("EEG_STREAM_QUEUE", "16"))
+
+
+class StreamClosed(Exception):
+    pass
+
+
+class Subscriber:
+    """
+    One /eeg/stream client. Frames are offered on its event loop; frames closer together
+    than 1 / rate are skipped, and when the queue is full the oldest frame is dropped so the
+    client always catches up to the newest data instead of slowing the others down.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, rate: float, queue_size: int = EEG_STREAM_QUEUE):
+        self.loop = loop
+        self.interval = 1.0 / rate
+        self.frames = collections.deque(maxlen=queue_size)
+        self.ready = asyncio.Event()
+        self.last_accepted = float("-inf")
+        self.sent = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.closed = False
+
+    def offer(self, frame: dict):
+        # runs on the subscriber's loop, called through call_soon_threadsafe
+        now = time.monotonic()
+        if now - self.last_accepted < self.interval:
+            self.skipped += 1
+            return
+        self.last_accepted = now
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+            eeg_stream_dropped.inc()
+        self.frames.append(frame)
+        self.ready.set()
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    async def get(self) -> dict:
+        while not self.frames:
+            if self.closed:
+                raise StreamClosed()
+            self.ready.clear()
+            await self.ready.wait()
+        return self.frames.popleft()
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "skipped": self.skipped, "dropped": self.dropped}
+
+
+class Broadcaster:
+    """Fans every published frame out to all subscribers; publish can be called from any thread"""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self, rate: float) -> Subscriber:
+        subscriber = Subscriber(asyncio.get_running_loop(), rate)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+        subscriber.close()
+
+    def publish(self, frame: dict):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, frame)
+            except RuntimeError:
+                # the client's loop has shut down
+                logger.debug("Dropping subscriber of a closed event loop")
+                with self.lock:
+                    self.subscribers.discard(subscriber)
+
+    def __len__(self) -> int:
+        return len(self.subscribers)
@@ -6,6 +6,9 @@ import time
 from pydispatch import Dispatcher #pip install python-dispatch
 import warnings
 import threading
+# warning codes and data_labels, shared with aiocortex
+from cortex_protocol import (ACCESS_RIGHT_GRANTED, CORTEX_AUTO_UNLOAD_PROFILE, CORTEX_RECORD_POST_PROCESSING_DONE,
+                             CORTEX_STOP_ALL_STREAMS, HEADSET_CONNECTED, HEADSET_SCANNING_FINISHED, data_labels)
 
 
 # define request id
@@ -35,30 +38,6 @@ UPDATE_MARKER_REQUEST_ID            =   23
 UNSUB_REQUEST_ID                    =   24
 REFRESH_HEADSET_LIST_ID             =   25
 
-#define error_code
-ERR_PROFILE_ACCESS_DENIED = -32046
-
-# define warning code
-CORTEX_STOP_ALL_STREAMS = 0
-CORTEX_CLOSE_SESSION = 1
-USER_LOGIN = 2
-USER_LOGOUT = 3
-ACCESS_RIGHT_GRANTED = 9
-ACCESS_RIGHT_REJECTED = 10
-PROFILE_LOADED = 13
-PROFILE_UNLOADED = 14
-CORTEX_AUTO_UNLOAD_PROFILE = 15
-EULA_ACCEPTED = 17
-DISKSPACE_LOW = 19
-DISKSPACE_CRITICAL = 20
-CORTEX_RECORD_POST_PROCESSING_DONE = 30
-HEADSET_CANNOT_CONNECT_TIMEOUT = 102
-HEADSET_DISCONNECTED_TIMEOUT = 103
-HEADSET_CONNECTED = 104
-HEADSET_CANNOT_WORK_WITH_BTLE = 112
-HEADSET_CANNOT_CONNECT_DISABLE_MOTION = 113
-HEADSET_SCANNING_FINISHED = 142
-
 class Cortex(Dispatcher):
 
     _events_ = ['inform_error','create_session_done', 'query_profile_done', 'load_unload_profile_done', 
@@ -592,18 +571,7 @@ class Cortex(Dispatcher):
     def extract_data_labels(self, stream_name, stream_cols):
         labels = {}
         labels['streamName'] = stream_name
-
-        data_labels = []
-        if stream_name == 'eeg':
-            # remove MARKERS
-            data_labels = stream_cols[:-1]
-        elif stream_name == 'dev':
-            # get cq header column except battery, signal and battery percent
-            data_labels = stream_cols[2]
-        else:
-            data_labels = stream_cols
-
-        labels['labels'] = data_labels
+        labels['labels'] = data_labels(stream_name, stream_cols)
         print(labels)
         self.emit('new_data_labels', data=labels)
 
@@ -0,0 +1,39 @@
+"""
+Parts of the Cortex API shared by the threaded client (cortex.py) and the asyncio one
+(aiocortex.py): warning and error codes, and the column names of each stream.
+No dependencies, so importing it does not pull in either client.
+"""
+
+#define error_code
+ERR_PROFILE_ACCESS_DENIED = -32046
+
+# define warning code
+CORTEX_STOP_ALL_STREAMS = 0
+CORTEX_CLOSE_SESSION = 1
+USER_LOGIN = 2
+USER_LOGOUT = 3
+ACCESS_RIGHT_GRANTED = 9
+ACCESS_RIGHT_REJECTED = 10
+PROFILE_LOADED = 13
+PROFILE_UNLOADED = 14
+CORTEX_AUTO_UNLOAD_PROFILE = 15
+EULA_ACCEPTED = 17
+DISKSPACE_LOW = 19
+DISKSPACE_CRITICAL = 20
+CORTEX_RECORD_POST_PROCESSING_DONE = 30
+HEADSET_CANNOT_CONNECT_TIMEOUT = 102
+HEADSET_DISCONNECTED_TIMEOUT = 103
+HEADSET_CONNECTED = 104
+HEADSET_CANNOT_WORK_WITH_BTLE = 112
+HEADSET_CANNOT_CONNECT_DISABLE_MOTION = 113
+HEADSET_SCANNING_FINISHED = 142
+
+def data_labels(stream_name, stream_cols):
+    """Column names of the samples of a stream, from the cols of its subscribe result"""
+    if stream_name == 'eeg':
+        # remove MARKERS
+        return stream_cols[:-1]
+    elif stream_name == 'dev':
+        # get cq header column except battery, signal and battery percent
+        return stream_cols[2]
+    return stream_cols
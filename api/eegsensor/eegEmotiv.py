@@ -1,13 +1,27 @@
 # eegsensor.py stay in eegsensor folder to connect with cortex
+import asyncio
+import logging
+import os
 import random
 import threading
 import time
-import socket
-from typing import List, Dict, Any, Optional
-from fastapi import APIRouter, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
-import websocket
-from .cortex import Cortex
+from .aiocortex import AsyncCortex
+from .bandpower import BAND_DESCRIPTIONS, MAX_WINDOW_SECONDS, band_frame
+from .broadcast import StreamClosed, EEG_STREAM_MAX_RATE
+from .sessions import EEGSession, SessionError, SessionManager
+from startup import startup_timer
+from metrics import eeg_messages
+
+# count every Cortex message by stream / kind for GET /metrics
+def count_cortex_message(kind: str):
+    eeg_messages.labels(kind).inc()
+
+AsyncCortex.message_hook = staticmethod(count_cortex_message)
+
+logger = logging.getLogger(__name__)
 
 
 router = APIRouter()
@@ -16,148 +30,18 @@ router = APIRouter()
 lock = threading.Lock()
 band_power_data = {}
 eeg_subscriber = None
+simulation_thread = None
+init_lock = threading.Lock()
+# every user's headset, Cortex session and buffers; the endpoints without a user id use DEFAULT_USER,
+# which is outside EEG_MAX_SESSIONS so they keep working when the other users fill it
+DEFAULT_USER = os.getenv("EEG_DEFAULT_USER", "default")
+manager = SessionManager(reserved=(DEFAULT_USER,))
 
 # Band labels and descriptions
-band_labels = {
-    'theta': 'Drowsiness, meditation',
-    'alpha': 'Relaxation, creativity',
-    'lowbeta': 'Focus, alertness',
-    'highbeta': 'Anxiety, engagement', 
-    'gamma': 'Information processing'
-}
-
-# EEG Subscriber class
-class EEGSubscribe:
-    def __init__(self, client_id: str, client_secret: str):
-        self.cortex = Cortex(client_id, client_secret, debug_mode=True)
-        self.latest_pow_data = None
-        self.lock = threading.Lock()
-        self.subscribed = False
-        self.connected = False
-        self.session_created = False
-        self.is_collecting = False
-        self.connection_thread = None
-        
-        # Bind Cortex events
-        self.cortex.bind(new_pow_data=self.on_new_pow_data)
-        self.cortex.bind(create_session_done=self.on_create_session_done)
-        self.cortex.bind(inform_error=self.on_inform_error)
-
-    def on_new_pow_data(self, *args, **kwargs):
-        """Handle new band power data from Cortex"""
-        if not self.is_collecting:
-            return
-            
-        data = kwargs.get('data')
-        if data:
-            with self.lock:
-                self.latest_pow_data = data
-                print(f"New EEG data received: {data}")
-
-    def on_create_session_done(self, *args, **kwargs):
-        """Handle session creation completion"""
-        print("Session created successfully")
-        self.session_created = True
-
-    def on_inform_error(self, *args, **kwargs):
-        """Handle Cortex errors"""
-        error_data = kwargs.get('error_data')
-        print(f"Cortex error: {error_data}")
-        self.connected = False
-
-    def _connect_worker(self):
-        """Worker method to handle connection in separate thread"""
-        try:
-            print("Opening Cortex WebSocket...")
-            self.cortex.open()
-            time.sleep(2)  # Give more time for connection
-            
-            if self.cortex.ws and self.cortex.ws.sock and self.cortex.ws.sock.connected:
-                print("WebSocket connected, querying headsets...")
-                headsets = self.cortex.query_headset()
-                if headsets:
-                    self.connected = True
-                    print("Headset found:", headsets)
-                    headset_id = headsets[0]['id']
-                    self.cortex.create_session(activate=True, headset_id=headset_id)
-                    print("Session creation initiated")
-                else:
-                    self.connected = False
-                    print("No headset found")
-            else:
-                self.connected = False
-                print("WebSocket not connected")
-                
-        except websocket._exceptions.WebSocketConnectionClosedException:
-            print("WebSocket closed unexpectedly")
-            self.connected = False
-        except Exception as e:
-            print(f"Connection failed: {e}")
-            self.connected = False
-
-    def connect(self):
-        """Start connection in background thread"""
-        if self.connection_thread and self.connection_thread.is_alive():
-            print("Connection already in progress")
-            return
-            
-        self.connection_thread = threading.Thread(target=self._connect_worker, daemon=True)
-        self.connection_thread.start()
-
-    def start_data_collection(self):
-        """Start collecting EEG data"""
-        if not self.connected:
-            raise Exception("Device not connected")
-            
-        if not self.session_created:
-            raise Exception("Session not created")
-            
-        self.is_collecting = True
-        if not self.subscribed:
-            try:
-                self.cortex.sub_request(['pow'])
-                self.subscribed = True
-                print("Started EEG data collection")
-            except Exception as e:
-                self.is_collecting = False
-                raise Exception(f"Failed to start data collection: {e}")
-
-    def stop_data_collection(self):
-        """Stop collecting EEG data"""
-        self.is_collecting = False
-        if self.subscribed:
-            try:
-                self.cortex.unsub_request(['pow'])
-                self.subscribed = False
-                print("Stopped EEG data collection")
-            except Exception as e:
-                print(f"Failed to stop data collection: {e}")
-
-    def disconnect(self):
-        """Disconnect from Emotiv device"""
-        try:
-            self.is_collecting = False
-            if self.subscribed:
-                self.cortex.unsub_request(['pow'])
-                self.subscribed = False
-            if self.session_created:
-                self.cortex.close_session()
-                self.session_created = False
-            if self.cortex.ws:
-                self.cortex.close()
-            self.connected = False
-            print("Disconnected from Emotiv device")
-        except Exception as e:
-            print(f"Disconnect error: {e}")
-
-    def get_band_power(self):
-        """Get latest band power data"""
-        with self.lock:
-            return self.latest_pow_data
+band_labels = BAND_DESCRIPTIONS
 
 def update_band_power():
     """Background thread to generate simulated data"""
-    global band_power_data, eeg_subscriber
     while True:
         with lock:
             if not eeg_subscriber or not eeg_subscriber.connected or not eeg_subscriber.is_collecting:
@@ -165,27 +49,35 @@ def update_band_power():
                 band_power_data.clear()
                 for band in band_labels:
                     band_power_data[band] = round(random.uniform(5, 40), 2)
+                if eeg_subscriber:
+                    bands = eeg_subscriber.band_power.append_bands(band_power_data, source="simulated")
+                    if len(eeg_subscriber.broadcaster):
+                        eeg_subscriber.broadcaster.publish(band_frame(bands, time.time(), "simulated", band_labels))
         time.sleep(1)
 
-# Start background thread
-threading.Thread(target=update_band_power, daemon=True).start()
-
-# Initialize EEG subscriber
-eeg_subscriber = EEGSubscribe(
-    client_id="YOUR_CLIENT_ID",
-    client_secret="YOUR_CLIENT_SECRET_KEY"
-)
+def get_eeg_subscriber() -> EEGSession:
+    """Create the default EEG session and start the simulated data thread on first use"""
+    global eeg_subscriber, simulation_thread
+    with init_lock:
+        if simulation_thread is None:
+            simulation_thread = threading.Thread(target=update_band_power, daemon=True)
+            simulation_thread.start()
+        if eeg_subscriber is None:
+            with startup_timer.phase("eeg client", lazy=True):
+                eeg_subscriber = manager.session(DEFAULT_USER)
+    return eeg_subscriber
 
 # API Endpoints
 @router.post("/connect")
 async def connect_device():
     """Connect to EEG device"""
-    threading.Thread(target=eeg_subscriber.connect, daemon=True).start()
+    get_eeg_subscriber().start_connect()
     return {"status": "connection started"}
 
 @router.get("/bandpower")
 def get_bandpower():
     """Get band power data"""
+    get_eeg_subscriber()
     with lock:
         total = sum(band_power_data.values())
         response = []
@@ -198,14 +90,79 @@ def get_bandpower():
             })
         return response
 
+def bandpower_window(session: EEGSession, seconds: float) -> dict:
+    if not 0 < seconds <= MAX_WINDOW_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {MAX_WINDOW_SECONDS:g}")
+    stats = session.band_power.stats(seconds)
+    if stats["frames"] == 0:
+        raise HTTPException(status_code=404, detail=f"No band power received in the last {seconds:g} seconds")
+
+    stats["bands"] = [
+        {
+            "band": band,
+            "percentage": values["mean"],
+            "median": values["median"],
+            "variance": values["variance"],
+            "description": band_labels[band],
+        }
+        for band, values in stats["bands"].items()
+    ]
+    return stats
+
+@router.get("/bandpower/window")
+def get_bandpower_window(seconds: float = 10):
+    """
+    Band power statistics over the last `seconds`, from every frame received in that time:
+    per band the mean, median and variance of its share of the total power (in %).
+    Replaces polling /bandpower once a second and averaging on the client. `source` says
+    whether the frames came from the headset or the simulator, a window never mixes them.
+    """
+    return bandpower_window(get_eeg_subscriber(), seconds)
+
+async def wait_for_disconnect(websocket: WebSocket):
+    # the client only listens; anything it sends is ignored until it disconnects
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+
+async def stream_to(websocket: WebSocket, session: EEGSession, rate: float):
+    subscriber = session.broadcaster.subscribe(rate)
+    listener = asyncio.create_task(wait_for_disconnect(websocket))
+    listener.add_done_callback(lambda _: subscriber.close())
+
+    try:
+        while True:
+            frame = await subscriber.get()
+            await websocket.send_json({**frame, "stats": subscriber.stats()})
+            subscriber.sent += 1
+    except (StreamClosed, WebSocketDisconnect, RuntimeError):
+        # RuntimeError: starlette refuses to send once the socket is closed
+        pass
+    finally:
+        session.broadcaster.unsubscribe(subscriber)
+        listener.cancel()
+
+@router.websocket("/stream")
+async def stream_bandpower(websocket: WebSocket, rate: float = EEG_STREAM_MAX_RATE):
+    """
+    Live band power, pushed as each frame arrives from the headset (or the simulator when
+    no headset is collecting). `rate` caps the frames per second sent to this client;
+    a client that cannot keep up loses its oldest queued frames, never the newest.
+    """
+    await websocket.accept()
+    if not 0 < rate <= EEG_STREAM_MAX_RATE:
+        await websocket.close(code=1008, reason=f"rate must be between 0 and {EEG_STREAM_MAX_RATE:g}")
+        return
+    await stream_to(websocket, get_eeg_subscriber(), rate)
+
 @router.post("/start-collection")
 async def start_data_collection():
     """Start EEG data collection"""
-    global eeg_subscriber
-    
     try:
         if eeg_subscriber and eeg_subscriber.connected:
-            eeg_subscriber.start_data_collection()
+            await eeg_subscriber.start()
             return {"status": "success", "message": "Data collection started"}
         else:
             return {"status": "error", "message": "EEG device not connected"}
@@ -215,11 +172,9 @@ async def start_data_collection():
 @router.post("/stop-collection")
 async def stop_data_collection():
     """Stop EEG data collection"""
-    global eeg_subscriber
-    
     try:
         if eeg_subscriber:
-            eeg_subscriber.stop_data_collection()
+            await eeg_subscriber.stop()
             return {"status": "success", "message": "Data collection stopped"}
         else:
             return {"status": "error", "message": "EEG subscriber not initialized"}
@@ -229,8 +184,6 @@ async def stop_data_collection():
 @router.get("/status")
 async def get_eeg_status():
     """Get current EEG connection status"""
-    global eeg_subscriber
-    
     if eeg_subscriber:
         return {
             "connected": eeg_subscriber.connected,
@@ -249,11 +202,86 @@ async def get_eeg_status():
 @router.get("/disconnect")
 async def disconnect_eeg_device():
     """Disconnect from EEG device"""
-    global eeg_subscriber
-    
     try:
         if eeg_subscriber:
-            eeg_subscriber.disconnect()
+            await eeg_subscriber.disconnect()
         return {"status": "disconnected", "message": "EEG device disconnected"}
     except Exception as e:
         return {"status": "error", "message": f"Failed to disconnect: {str(e)}"}
+
+# Per-user sessions: each user gets a headset and Cortex session of their own, with separate buffers
+
+class StartRequest(BaseModel):
+    streams: List[str] = ['pow']
+
+def user_session(user_id: str) -> EEGSession:
+    session = manager.get(user_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"No EEG session for user {user_id}")
+    return session
+
+@router.get("/sessions")
+async def list_sessions():
+    """Every EEG session with its headset, state and buffers"""
+    return manager.status()
+
+@router.post("/sessions/{user_id}/connect", status_code=202)
+async def connect_session(user_id: str, headset_id: Optional[str] = None):
+    """Connect a headset for the user, the given one or the first one nobody else holds; poll the session for the result"""
+    try:
+        session = manager.session(user_id, headset_id)
+    except SessionError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    session.start_connect()
+    return session.status()
+
+@router.get("/sessions/{user_id}")
+async def get_session(user_id: str):
+    return user_session(user_id).status()
+
+@router.post("/sessions/{user_id}/start")
+async def start_session(user_id: str, request: Optional[StartRequest] = None):
+    """Subscribe the user's session to streams (pow by default) and start buffering them"""
+    session = user_session(user_id)
+    try:
+        await session.start(tuple(request.streams) if request else ('pow',))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SessionError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Failed to start collection: {e}")
+    return session.status()
+
+@router.post("/sessions/{user_id}/stop")
+async def stop_session(user_id: str):
+    session = user_session(user_id)
+    await session.stop()
+    return session.status()
+
+@router.delete("/sessions/{user_id}")
+async def delete_session(user_id: str):
+    """Close the user's Cortex session and free the headset"""
+    session = user_session(user_id)
+    if user_id == DEFAULT_USER:
+        # the endpoints without a user id keep using it
+        await session.disconnect()
+    else:
+        await manager.remove(user_id)
+    return {"status": "disconnected", "user_id": user_id}
+
+@router.get("/sessions/{user_id}/bandpower/window")
+def get_session_bandpower_window(user_id: str, seconds: float = 10):
+    return bandpower_window(user_session(user_id), seconds)
+
+@router.websocket("/sessions/{user_id}/stream")
+async def stream_session_bandpower(websocket: WebSocket, user_id: str, rate: float = EEG_STREAM_MAX_RATE):
+    await websocket.accept()
+    session = manager.get(user_id)
+    if session is None:
+        await websocket.close(code=1008, reason=f"No EEG session for user {user_id}")
+        return
+    if not 0 < rate <= EEG_STREAM_MAX_RATE:
+        await websocket.close(code=1008, reason=f"rate must be between 0 and {EEG_STREAM_MAX_RATE:g}")
+        return
+    await stream_to(websocket, session, rate)
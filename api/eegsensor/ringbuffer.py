@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+# Seconds of samples kept per stream
+EEG_BUFFER_SECONDS = float(os.getenv("EEG_BUFFER_SECONDS", "60"))
+
+# Highest sample rate of each Cortex stream in Hz, sizes the buffers (eeg is 128 or 256 depending on the headset)
+STREAM_RATES = {'eeg': 256, 'mot': 128, 'dev': 2, 'met': 2, 'pow': 8, 'com': 8, 'fac': 32}
+
+
+class RingBuffer:
+    """
+    Fixed-size buffer of the last `capacity` samples of one stream, one column per label.
+
+    Storage is preallocated and mirrored: every row is written twice, capacity rows apart,
+    so the most recent n samples are always one contiguous slice and windows are returned
+    as NumPy views without copying. Writers are serialised by a lock; readers take no lock,
+    they only look at rows published through `written`, which is updated after the row.
+    A view reads the live storage: copy it if it is kept while more than capacity - n
+    new samples come in.
+    """
+
+    def __init__(self, labels: list, capacity: int):
+        self.labels = list(labels)
+        self.capacity = capacity
+        self.times = np.zeros(2 * capacity, dtype=np.float64)
+        self.values = np.full((2 * capacity, len(self.labels)), np.nan, dtype=np.float64)
+        self.written = 0
+        self.write_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return min(self.written, self.capacity)
+
+    def column(self, label: str) -> int:
+        return self.labels.index(label)
+
+    def append(self, values, timestamp: Optional[float] = None):
+        """Add one sample, values in the order of labels"""
+        row = np.asarray(values, dtype=np.float64)
+        timestamp = timestamp if timestamp is not None else time.time()
+        with self.write_lock:
+            slot = self.written % self.capacity
+            self.values[slot] = row
+            self.values[slot + self.capacity] = row
+            self.times[slot] = timestamp
+            self.times[slot + self.capacity] = timestamp
+            self.written += 1
+
+    def clear(self):
+        with self.write_lock:
+            self.written = 0
+
+    def latest(self, count: Optional[int] = None) -> tuple:
+        """Views (times, values) of the last count samples, oldest first"""
+        written = self.written
+        if written == 0:
+            return self.times[:0], self.values[:0]
+        available = min(written, self.capacity)
+        count = available if count is None else max(0, min(count, available))
+        # end on the mirrored copy of the newest row, the count rows before it are always in range
+        end = (written - 1) % self.capacity + 1 + self.capacity
+        return self.times[end - count:end], self.values[end - count:end]
+
+    def window(self, seconds: float, now: Optional[float] = None) -> tuple:
+        """Views (times, values) of the samples from the last seconds, oldest first"""
+        times, values = self.latest()
+        now = now if now is not None else time.time()
+        first = int(np.searchsorted(times, now - seconds, side="left"))
+        return times[first:], values[first:]
+
+
+class StreamBuffers:
+    """One RingBuffer per subscribed stream, created from the labels Cortex sends on subscribe"""
+
+    def __init__(self, seconds: float = EEG_BUFFER_SECONDS):
+        self.seconds = seconds
+        self.buffers = {}
+
+    def create(self, stream: str, labels: list) -> RingBuffer:
+        capacity = max(1, int(self.seconds * STREAM_RATES.get(stream, 8)))
+        self.buffers[stream] = RingBuffer(labels, capacity)
+        return self.buffers[stream]
+
+    def on_new_data_labels(self, *args, **kwargs):
+        """Bind to Cortex new_data_labels"""
+        labels = kwargs.get('data')
+        self.create(labels['streamName'], labels['labels'])
+
+    def get(self, stream: str) -> Optional[RingBuffer]:
+        return self.buffers.get(stream)
+
+    def append(self, stream: str, values, timestamp: Optional[float] = None):
+        """Add one sample; samples of a stream whose labels have not come in yet are dropped"""
+        buffer = self.buffers.get(stream)
+        if buffer is not None:
+            buffer.append(values, timestamp)
@@ -0,0 +1,305 @@
+"""
+EEG sessions of several users at once: user -> headset -> Cortex session.
+
+All sessions share one AsyncCortex WebSocket and token, opened by the first session that
+connects and closed when the last one disconnects; Cortex keeps each session's streams apart
+by session id. Every session has its own buffers and live stream and is driven through
+connect / start / stop / disconnect. Everything runs as tasks on the event loop, so a
+session costs its buffers and a few tasks, not threads.
+"""
+import asyncio
+import functools
+import logging
+import os
+from typing import Optional
+
+from .aiocortex import AsyncCortex, NotReady, Sample, StreamIterator, retry
+from .bandpower import BAND_DESCRIPTIONS, BandPowerBuffer, band_frame
+from .broadcast import Broadcaster
+from .ringbuffer import StreamBuffers
+
+logger = logging.getLogger(__name__)
+# per-frame events go to their own logger, sampled by LOG_SAMPLING
+stream_logger = logging.getLogger("eegsensor.stream")
+
+CORTEX_CLIENT_ID = os.getenv("CORTEX_CLIENT_ID", "")
+CORTEX_CLIENT_SECRET = os.getenv("CORTEX_CLIENT_SECRET", "")
+# sessions one process accepts
+EEG_MAX_SESSIONS = int(os.getenv("EEG_MAX_SESSIONS", "64"))
+
+# streams whose samples are all numbers and fit a RingBuffer; com and fac samples carry action names
+NUMERIC_STREAMS = ('pow', 'met', 'mot', 'dev', 'eeg')
+
+# session states
+IDLE = "idle"
+CONNECTING = "connecting"
+CONNECTED = "connected"
+COLLECTING = "collecting"
+DISCONNECTED = "disconnected"
+FAILED = "failed"
+
+
+class SessionError(Exception):
+    """Request that conflicts with the state of a session or of the headsets"""
+
+
+class EEGSession:
+    def __init__(self, manager: "SessionManager", user_id: str, headset_id: Optional[str] = None):
+        self.manager = manager
+        self.user_id = user_id
+        self.wanted_headset = headset_id
+        self.headset_id = None
+        self.session_id = None
+        self.state = IDLE
+        self.error = None
+        self.streams = []
+        self.latest_pow_data = None
+        # buffers and live stream of this session only
+        self.buffers = StreamBuffers()
+        self.band_power = BandPowerBuffer()
+        self.broadcaster = Broadcaster()
+        self.connect_task = None
+        self.pumps = {}
+
+    @property
+    def connected(self) -> bool:
+        return self.state in (CONNECTED, COLLECTING)
+
+    @property
+    def session_created(self) -> bool:
+        return self.session_id is not None
+
+    @property
+    def is_collecting(self) -> bool:
+        return self.state == COLLECTING
+
+    @property
+    def subscribed(self) -> bool:
+        return bool(self.pumps)
+
+    def status(self) -> dict:
+        return {
+            "user_id": self.user_id,
+            "state": self.state,
+            "headset_id": self.headset_id,
+            "session_id": self.session_id,
+            "streams": self.streams,
+            "error": self.error,
+            "buffered": {stream: len(buffer) for stream, buffer in self.buffers.buffers.items()},
+            "listeners": len(self.broadcaster),
+        }
+
+    async def connect(self):
+        """Open (or reuse) the shared Cortex connection, claim a headset and create a session on it"""
+        self.state = CONNECTING
+        self.error = None
+        try:
+            cortex = await self.manager.client()
+            self.headset_id = await self.manager.claim_headset(self, self.wanted_headset)
+            await cortex.connect_headset(self.headset_id)
+            self.session_id = await cortex.create_session(self.headset_id)
+            self.state = CONNECTED
+            logger.info("Session %s created for user %s on headset %s", self.session_id, self.user_id,
+                        self.headset_id)
+        except Exception as e:
+            logger.error("Connection failed for user %s: %s", self.user_id, e)
+            self.manager.release_headset(self)
+            self.headset_id = None
+            self.state = FAILED
+            self.error = str(e)
+
+    def start_connect(self):
+        """Connect in the background; callers poll the state"""
+        if self.connect_task and not self.connect_task.done():
+            logger.info("Connection already in progress for user %s", self.user_id)
+            return
+        if self.connected:
+            return
+        self.state = CONNECTING
+        self.connect_task = asyncio.create_task(self.connect())
+
+    def on_pow(self, sample: Sample):
+        data = {'pow': sample.values, 'time': sample.time}
+        self.latest_pow_data = data
+        bands = self.band_power.append_pow(sample.values, sample.time)
+        if len(self.broadcaster):
+            self.broadcaster.publish(band_frame(bands, sample.time, "headset", BAND_DESCRIPTIONS))
+        stream_logger.debug("New EEG data received", extra={"data": data, "user_id": self.user_id})
+
+    async def _pump(self, stream: str, samples: StreamIterator):
+        """Move the samples of one stream into the session's buffers until unsubscribed or disconnected"""
+        try:
+            async with samples:
+                async for sample in samples:
+                    self.buffers.append(stream, sample.values, sample.time)
+                    if stream == 'pow':
+                        self.on_pow(sample)
+        finally:
+            if self.connected and not self.manager.is_open:
+                logger.warning("Cortex connection lost, session of user %s ended", self.user_id)
+                self.manager.release_headset(self)
+                self.session_id = None
+                self.state = DISCONNECTED
+
+    def _pump_done(self, stream: str, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Stream %s of user %s stopped: %r", stream, self.user_id, task.exception())
+        if self.pumps.get(stream) is task:
+            del self.pumps[stream]
+            self.streams = sorted(self.pumps)
+            if not self.pumps and self.state == COLLECTING:
+                self.state = CONNECTED
+
+    async def start(self, streams: tuple = ('pow',)):
+        """Subscribe to streams and start buffering them"""
+        unsupported = [stream for stream in streams if stream not in NUMERIC_STREAMS]
+        if unsupported:
+            raise ValueError(f"Unsupported streams {unsupported}, use any of {list(NUMERIC_STREAMS)}")
+        if not self.connected:
+            raise SessionError("Device not connected")
+        cortex = await self.manager.client()
+        streams = [stream for stream in streams if stream not in self.pumps]
+        if streams:
+            # open the iterators first so no sample is missed
+            iterators = {stream: cortex.stream(self.session_id, stream) for stream in streams}
+            try:
+                labels = await cortex.subscribe(self.session_id, streams)
+            except Exception:
+                for iterator in iterators.values():
+                    iterator.close()
+                raise
+            for stream, iterator in iterators.items():
+                if stream not in labels:
+                    iterator.close()
+                    continue
+                self.buffers.create(stream, labels[stream])
+                if stream == 'pow':
+                    self.band_power.set_columns(labels[stream])
+                task = self.pumps[stream] = asyncio.create_task(self._pump(stream, iterator))
+                task.add_done_callback(functools.partial(self._pump_done, stream))
+        self.streams = sorted(self.pumps)
+        self.state = COLLECTING
+        logger.info("Started EEG data collection for user %s: %s", self.user_id, self.streams)
+
+    async def stop(self):
+        """Unsubscribe from every stream; buffered data stays readable"""
+        if self.state == COLLECTING:
+            self.state = CONNECTED
+        if not self.pumps:
+            return
+        streams = list(self.pumps)
+        try:
+            await self.manager.cortex.unsubscribe(self.session_id, streams)
+            logger.info("Stopped EEG data collection for user %s", self.user_id)
+        except Exception as e:
+            logger.error("Failed to stop data collection for user %s: %s", self.user_id, e)
+        for task in list(self.pumps.values()):
+            task.cancel()
+        self.pumps.clear()
+        self.streams = []
+
+    async def disconnect(self):
+        """Close the Cortex session and free the headset for other users"""
+        if self.connect_task and not self.connect_task.done():
+            self.connect_task.cancel()
+        try:
+            await self.stop()
+            if self.session_id and self.manager.is_open:
+                await self.manager.cortex.close_session(self.session_id)
+            logger.info("Disconnected user %s from headset %s", self.user_id, self.headset_id)
+        except Exception as e:
+            logger.error("Disconnect error for user %s: %s", self.user_id, e)
+        finally:
+            self.manager.release_headset(self)
+            self.session_id = None
+            self.headset_id = None
+            self.state = DISCONNECTED
+        await self.manager.close_if_unused()
+
+
+class SessionManager:
+    """Sessions by user id, the headsets they hold and the Cortex connection they share"""
+
+    def __init__(self, client_id: str = CORTEX_CLIENT_ID, client_secret: str = CORTEX_CLIENT_SECRET,
+                 max_sessions: int = EEG_MAX_SESSIONS, reserved: tuple = ()):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.max_sessions = max_sessions
+        # user ids that always get a session and do not count against max_sessions
+        self.reserved = tuple(reserved)
+        self.sessions = {}
+        self.claims = {}
+        self.cortex = None
+        self.lock = asyncio.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.cortex is not None and self.cortex.is_open
+
+    def get(self, user_id: str) -> Optional[EEGSession]:
+        return self.sessions.get(user_id)
+
+    def session(self, user_id: str, headset_id: Optional[str] = None) -> EEGSession:
+        """The session of a user, created on first use"""
+        session = self.sessions.get(user_id)
+        if session is None:
+            counted = sum(1 for user in self.sessions if user not in self.reserved)
+            if user_id not in self.reserved and counted >= self.max_sessions:
+                raise SessionError(f"Too many EEG sessions, the limit is {self.max_sessions}")
+            session = self.sessions[user_id] = EEGSession(self, user_id, headset_id)
+        elif headset_id and not session.connected:
+            session.wanted_headset = headset_id
+        return session
+
+    async def remove(self, user_id: str):
+        session = self.sessions.pop(user_id, None)
+        if session is not None:
+            await session.disconnect()
+
+    async def client(self) -> AsyncCortex:
+        """The shared Cortex connection, opened and authorized on first use"""
+        async with self.lock:
+            if self.cortex is None:
+                self.cortex = AsyncCortex(self.client_id, self.client_secret)
+            if not self.cortex.is_open:
+                await self.cortex.open()
+                await self.cortex.authorize()
+            return self.cortex
+
+    async def close_if_unused(self):
+        async with self.lock:
+            if self.is_open and not any(s.connected or s.state == CONNECTING for s in self.sessions.values()):
+                logger.info("No EEG session left, closing the Cortex connection")
+                await self.cortex.close()
+
+    async def claim_headset(self, session: EEGSession, headset_id: Optional[str] = None) -> str:
+        """Reserve a headset for a session: the one asked for, or the first one no other session holds"""
+        if headset_id is None:
+            cortex = await self.client()
+
+            async def free_headset():
+                await cortex.call("controlDevice", {"command": "refresh"})
+                headsets = await cortex.query_headsets()
+                free = [h['id'] for h in headsets if self.claims.get(h['id'], session) is session]
+                if not free:
+                    raise NotReady("No free headset")
+                return free[0]
+
+            headset_id = await retry(free_headset)
+        # no await between the check and the claim, so two sessions never get the same headset
+        owner = self.claims.get(headset_id)
+        if owner is not None and owner is not session:
+            raise SessionError(f"Headset {headset_id} is in use by user {owner.user_id}")
+        self.claims[headset_id] = session
+        return headset_id
+
+    def release_headset(self, session: EEGSession):
+        for headset_id in [h for h, owner in self.claims.items() if owner is session]:
+            del self.claims[headset_id]
+
+    def status(self) -> dict:
+        return {
+            "cortex_open": self.is_open,
+            "max_sessions": self.max_sessions,
+            "sessions": [session.status() for session in self.sessions.values()],
+        }
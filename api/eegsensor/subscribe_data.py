@@ -1,4 +1,5 @@
 from cortex import Cortex
+from ringbuffer import StreamBuffers
 import time
 import threading
 
@@ -6,8 +7,10 @@ class Subscribe():
     def __init__(self, app_client_id, app_client_secret, **kwargs):
         print("Subscribe __init__")
         self.c = Cortex(app_client_id, app_client_secret, debug_mode=True, **kwargs)
+        # preallocated buffer per stream, sized from the labels Cortex sends on subscribe
+        self.buffers = StreamBuffers()
         self.c.bind(create_session_done=self.on_create_session_done)
-        self.c.bind(new_data_labels=self.on_new_data_labels)
+        self.c.bind(new_data_labels=self.buffers.on_new_data_labels)
         self.c.bind(new_eeg_data=self.on_new_eeg_data)
         self.c.bind(new_mot_data=self.on_new_mot_data)
         self.c.bind(new_dev_data=self.on_new_dev_data)
@@ -16,7 +19,6 @@ class Subscribe():
         self.c.bind(inform_error=self.on_inform_error)
 
         self.streams = []
-        self.data_buffer = []  # to store received data
         self.collecting = False
 
     def start(self, streams, headsetId=''):
@@ -39,11 +41,12 @@ class Subscribe():
         print("Stopping subscription...")
         self.unsub(self.streams)
         self.c.close()
-        print(f"Collected {len(self.data_buffer)} data points.")
-
-        # you can process self.data_buffer here or print it
-        for d in self.data_buffer:
-            print(d)
+        # you can process the buffers here, latest() and window() return NumPy views
+        for stream, buffer in self.buffers.buffers.items():
+            times, values = buffer.latest()
+            print(f"Collected {len(buffer)} {stream} samples, columns {buffer.labels}")
+            if len(values):
+                print(f"  latest at {times[-1]}: {values[-1]}")
 
     def sub(self, streams):
         self.c.sub_request(streams)
@@ -51,22 +54,31 @@ class Subscribe():
     def unsub(self, streams):
         self.c.unsub_request(streams)
 
-    # Example: collect EEG and pow data only, you can add others if needed
     def on_new_eeg_data(self, *args, **kwargs):
         data = kwargs.get('data')
         if self.collecting:
-            self.data_buffer.append({'stream': 'eeg', 'data': data})
+            self.buffers.append('eeg', data['eeg'], data['time'])
 
     def on_new_pow_data(self, *args, **kwargs):
         data = kwargs.get('data')
         if self.collecting:
-            self.data_buffer.append({'stream': 'pow', 'data': data})
+            self.buffers.append('pow', data['pow'], data['time'])
 
-    # Add other handlers as you want to collect data
     def on_new_mot_data(self, *args, **kwargs):
         data = kwargs.get('data')
         if self.collecting:
-            self.data_buffer.append({'stream': 'mot', 'data': data})
+            self.buffers.append('mot', data['mot'], data['time'])
+
+    def on_new_dev_data(self, *args, **kwargs):
+        data = kwargs.get('data')
+        if self.collecting:
+            # contact quality per sensor, the columns of the dev labels
+            self.buffers.append('dev', data['dev'], data['time'])
+
+    def on_new_met_data(self, *args, **kwargs):
+        data = kwargs.get('data')
+        if self.collecting:
+            self.buffers.append('met', data['met'], data['time'])
 
     def on_create_session_done(self, *args, **kwargs):
         print('Session created, subscribing now...')
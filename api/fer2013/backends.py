@@ -0,0 +1,182 @@
+import json
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+
+# Inference engine used by the service: keras, tflite, tflite_int8 or onnx
+# tflite and onnx run without importing TensorFlow when their lean runtimes are installed
+FER_ENGINE = os.getenv("FER_ENGINE", "keras").lower()
+# Optional override for the model file of the selected engine
+FER_MODEL_PATH = os.getenv("FER_MODEL_PATH")
+# Threads used inside one forward pass by the tflite / onnx engines (0 = runtime default)
+FER_ENGINE_THREADS = int(os.getenv("FER_ENGINE_THREADS", "0"))
+# Largest accuracy drop (float accuracy - int8 accuracy, as a fraction) accepted for the int8 model
+FER_INT8_MAX_ACCURACY_DROP = float(os.getenv("FER_INT8_MAX_ACCURACY_DROP", "0.01"))
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model")
+MODEL_PATHS = {
+    "keras": os.path.join(MODEL_DIR, "fer_emotion_model.h5"),
+    "tflite": os.path.join(MODEL_DIR, "fer_emotion_model.tflite"),
+    "tflite_int8": os.path.join(MODEL_DIR, "fer_emotion_model_int8.tflite"),
+    "onnx": os.path.join(MODEL_DIR, "fer_emotion_model.onnx"),
+}
+
+
+class ModelRejectedError(RuntimeError):
+    """Raised when a model file exists but fails its quality gate"""
+
+
+def quantization_report_path(model_path: str) -> str:
+    # the quantization script writes its accuracy report next to the model
+    return os.path.splitext(model_path)[0] + ".json"
+
+
+class InferenceBackend:
+    """Runs a batch of (N, 48, 48, 1) float32 images and returns the (N, 7) softmax output"""
+
+    name = ""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def predict(self, input_batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class KerasBackend(InferenceBackend):
+    name = "keras"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        import tensorflow as tf
+        self.model = tf.keras.models.load_model(path)
+
+    def predict(self, input_batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model.predict_on_batch(input_batch))
+
+
+def _tflite_interpreter_class():
+    # prefer the standalone runtimes so serving doesn't pull in TensorFlow
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+class TFLiteBackend(InferenceBackend):
+    name = "tflite"
+
+    def __init__(self, path: str, num_threads: int = FER_ENGINE_THREADS):
+        super().__init__(path)
+        interpreter_class = _tflite_interpreter_class()
+        self.interpreter = interpreter_class(model_path=path, num_threads=num_threads or None)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.batch_size = int(self.input_details["shape"][0])
+        # an interpreter holds its tensors in place, so calls must not overlap
+        self.lock = threading.Lock()
+
+    def _quantize_input(self, input_batch: np.ndarray) -> np.ndarray:
+        dtype = self.input_details["dtype"]
+        if np.issubdtype(dtype, np.integer):
+            # integer-only models take quantized input: q = x / scale + zero_point
+            scale, zero_point = self.input_details["quantization"]
+            info = np.iinfo(dtype)
+            input_batch = np.clip(np.round(input_batch / scale + zero_point), info.min, info.max)
+        return np.ascontiguousarray(input_batch, dtype=dtype)
+
+    def _dequantize_output(self, output: np.ndarray) -> np.ndarray:
+        if np.issubdtype(output.dtype, np.integer):
+            scale, zero_point = self.output_details["quantization"]
+            return (output.astype(np.float32) - zero_point) * scale
+        return output.copy()
+
+    def predict(self, input_batch: np.ndarray) -> np.ndarray:
+        input_batch = self._quantize_input(input_batch)
+        with self.lock:
+            if input_batch.shape[0] != self.batch_size:
+                self.interpreter.resize_tensor_input(self.input_details["index"], input_batch.shape)
+                self.interpreter.allocate_tensors()
+                self.batch_size = input_batch.shape[0]
+            self.interpreter.set_tensor(self.input_details["index"], input_batch)
+            self.interpreter.invoke()
+            return self._dequantize_output(self.interpreter.get_tensor(self.output_details["index"]))
+
+
+class QuantizedTFLiteBackend(TFLiteBackend):
+    """
+    int8 model written by fer2013.quantize.
+
+    Refuses to load unless the quantization report next to the model shows an
+    accuracy drop within max_accuracy_drop of the float model.
+    """
+
+    name = "tflite_int8"
+
+    def __init__(self, path: str, num_threads: int = FER_ENGINE_THREADS,
+                 max_accuracy_drop: float = FER_INT8_MAX_ACCURACY_DROP):
+        report_path = quantization_report_path(path)
+        if not os.path.exists(report_path):
+            raise ModelRejectedError(f"No quantization report at {report_path}, run python -m fer2013.quantize")
+        with open(report_path) as f:
+            self.report = json.load(f)
+
+        accuracy_drop = self.report["accuracy_delta"]
+        if accuracy_drop > max_accuracy_drop:
+            raise ModelRejectedError(
+                f"int8 model loses {accuracy_drop:.2%} accuracy, more than the allowed {max_accuracy_drop:.2%}"
+            )
+        super().__init__(path, num_threads)
+
+
+class OnnxBackend(InferenceBackend):
+    name = "onnx"
+
+    def __init__(self, path: str, num_threads: int = FER_ENGINE_THREADS):
+        super().__init__(path)
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, input_batch: np.ndarray) -> np.ndarray:
+        input_batch = np.ascontiguousarray(input_batch, dtype=np.float32)
+        return self.session.run(None, {self.input_name: input_batch})[0]
+
+
+BACKENDS = {
+    KerasBackend.name: KerasBackend,
+    TFLiteBackend.name: TFLiteBackend,
+    QuantizedTFLiteBackend.name: QuantizedTFLiteBackend,
+    OnnxBackend.name: OnnxBackend,
+}
+
+
+def load_backend(engine: str = FER_ENGINE, path: Optional[str] = None,
+                 num_threads: Optional[int] = None) -> InferenceBackend:
+    """
+    Create the inference backend for engine, loading its default model file unless path is given.
+    num_threads overrides FER_ENGINE_THREADS for the engines that take it (not keras).
+    """
+    if engine not in BACKENDS:
+        raise ValueError(f"Unknown FER engine '{engine}', expected one of {sorted(BACKENDS)}")
+    if path is None:
+        path = FER_MODEL_PATH if engine == FER_ENGINE and FER_MODEL_PATH else MODEL_PATHS[engine]
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"FER model for engine '{engine}' not found at {path}")
+    if num_threads is not None and BACKENDS[engine] is not KerasBackend:
+        return BACKENDS[engine](path, num_threads=num_threads)
+    return BACKENDS[engine](path)
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import numpy as np
+
+# Micro-batching settings, override with environment variables
+BATCH_WINDOW_MS = float(os.getenv("FER_BATCH_WINDOW_MS", "5"))
+MAX_BATCH_SIZE = int(os.getenv("FER_MAX_BATCH_SIZE", "32"))
+
+# Keep the last N batches for the metrics snapshot
+METRICS_WINDOW = 1024
+
+
+class BatchMetrics:
+    """Running batch size and queue wait statistics"""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self.batch_sizes = deque(maxlen=window)
+        self.queue_waits_ms = deque(maxlen=window)
+        self.inference_ms = deque(maxlen=window)
+
+    def record(self, batch_size: int, waits_ms: list, inference_ms: float):
+        self.batches += 1
+        self.items += batch_size
+        self.batch_sizes.append(batch_size)
+        self.queue_waits_ms.extend(waits_ms)
+        self.inference_ms.append(inference_ms)
+
+    @staticmethod
+    def _summary(values) -> dict:
+        if not values:
+            return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+        arr = np.fromiter(values, dtype=np.float64, count=len(values))
+        p50, p95 = np.percentile(arr, [50, 95])
+        return {
+            "mean": round(float(arr.mean()), 3),
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "max": round(float(arr.max()), 3),
+        }
+
+    def snapshot(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "errors": self.errors,
+            "batch_size": self._summary(self.batch_sizes),
+            "queue_wait_ms": self._summary(self.queue_waits_ms),
+            "inference_ms": self._summary(self.inference_ms),
+        }
+
+
+class BatchScheduler:
+    """
+    Collects single images submitted by concurrent requests and runs them
+    through the model as one batch.
+
+    A batch is closed when it reaches max_batch_size or when window_ms has
+    passed since its first image arrived, whichever comes first.
+    """
+
+    def __init__(self, predict_fn: Callable[[np.ndarray], np.ndarray],
+                 window_ms: float = BATCH_WINDOW_MS, max_batch_size: int = MAX_BATCH_SIZE):
+        self.predict_fn = predict_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self.metrics = BatchMetrics()
+        # one dedicated thread for the forward pass, separate from the preprocessing pool
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fer-infer")
+        self._queue = None
+        self._worker = None
+
+    def _ensure_worker(self):
+        # the worker is started on the first request so it binds to uvicorn's loop
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, image: np.ndarray) -> tuple:
+        """
+        Queue one preprocessed (48, 48, 1) float image and wait for its result,
+        returns (probability vector, forward pass time in ms)
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((image, future, time.perf_counter()))
+        return await future
+
+    async def run_batch(self, input_batch: np.ndarray) -> tuple:
+        """
+        Run an already assembled (N, 48, 48, 1) batch as one forward pass on the inference thread,
+        returns (probabilities, forward pass time in ms)
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            predictions = await loop.run_in_executor(self._executor, self.predict_fn, input_batch)
+        except Exception:
+            self.metrics.errors += 1
+            raise
+        inference_ms = (time.perf_counter() - started) * 1000.0
+        # the images never waited in the queue, recording zero waits would hide real queueing
+        self.metrics.record(len(input_batch), [], inference_ms)
+        return predictions, inference_ms
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window
+
+        while len(batch) < self.max_batch_size:
+            # take whatever is already waiting without yielding
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if len(batch) >= self.max_batch_size:
+                break
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # drop requests whose client already went away
+            batch = [item for item in batch if not item[1].done()]
+            if batch:
+                await self._process(batch)
+
+    async def _process(self, batch: list):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        waits_ms = [(started - queued_at) * 1000.0 for _, _, queued_at in batch]
+        input_batch = np.stack([image for image, _, _ in batch])
+
+        try:
+            # run the forward pass off the event loop so other endpoints keep serving
+            predictions = await loop.run_in_executor(self._executor, self.predict_fn, input_batch)
+        except Exception as e:
+            self.metrics.errors += 1
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        inference_ms = (time.perf_counter() - started) * 1000.0
+        self.metrics.record(len(batch), waits_ms, inference_ms)
+        for (_, future, _), prediction in zip(batch, predictions):
+            if not future.done():
+                future.set_result((prediction, inference_ms))
@@ -0,0 +1,243 @@
+"""
+Offline benchmark and accuracy harness for the production FER inference path.
+
+Two parts, both written to one JSON report so builds can be compared:
+
+preprocessing - decode, face detection and resize (the stages of
+    preprocess_bytes) on camera photos from --images, or, without photos, on
+    FER2013 test faces upscaled and padded into a larger frame and JPEG encoded
+    (--synthetic-size), so the cascade has something realistic to search.
+inference - every engine x thread count x batch size: p50/p95/p99 latency,
+    images/sec, accuracy and macro F1 on the FER2013 test set.
+
+Peak RSS is the process high-water mark after each run, so it only grows;
+the increase over the previous run is reported too. Thread counts apply to
+the tflite and onnx engines, keras uses TensorFlow's own thread pool.
+
+Run from the api/ folder:
+    python -m fer2013.benchmark --engines keras tflite onnx --batch-sizes 1 8 32 --threads 1 4 --json bench.json
+Compare with an earlier report, exit code 1 on a regression:
+    python -m fer2013.benchmark --baseline bench_main.json --max-regression 0.1
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from .backends import BACKENDS, FER_ENGINE, load_backend
+from .benchmark_preprocessing import load_images, run_pipeline
+from .dataset import IMAGE_SIZE, load_samples
+from .predict import calibrate, emotion_labels
+from .train import peak_rss_mb
+
+PERCENTILES = (50, 95, 99)
+
+
+def summarise(timings_ms: list, images_per_call: int = 1) -> dict:
+    timings_ms = np.asarray(timings_ms, dtype=np.float64)
+    summary = {f"p{p}_ms": round(float(np.percentile(timings_ms, p)), 3) for p in PERCENTILES}
+    summary["mean_ms"] = round(float(timings_ms.mean()), 3)
+    summary["images_per_sec"] = round(images_per_call * 1000.0 / float(timings_ms.mean()), 1)
+    return summary
+
+
+def macro_f1(predicted: np.ndarray, labels: np.ndarray, classes: int = len(emotion_labels)) -> float:
+    confusion = np.bincount(labels * classes + predicted, minlength=classes * classes).reshape(classes, classes)
+    true_positives = np.diag(confusion).astype(np.float64)
+    precision = true_positives / np.maximum(confusion.sum(axis=0), 1)
+    recall = true_positives / np.maximum(confusion.sum(axis=1), 1)
+    f1 = np.where(precision + recall > 0, 2 * precision * recall / np.maximum(precision + recall, 1e-12), 0.0)
+    # classes missing from the sample would drag the mean to zero, leave them out
+    present = confusion.sum(axis=1) > 0
+    return float(f1[present].mean())
+
+
+def synthetic_photos(images: np.ndarray, size: int) -> list:
+    """FER2013 faces upscaled and centred on a grey frame, JPEG encoded like a camera upload"""
+    face_size = size // 2
+    photos = []
+    for image in images:
+        face = cv2.resize((image[:, :, 0] * 255).astype(np.uint8), (face_size, face_size),
+                          interpolation=cv2.INTER_CUBIC)
+        frame = np.full((size, size), 128, dtype=np.uint8)
+        offset = (size - face_size) // 2
+        frame[offset:offset + face_size, offset:offset + face_size] = face
+        ok, encoded = cv2.imencode(".jpg", cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+        if ok:
+            photos.append(encoded.tobytes())
+    return photos
+
+
+def benchmark_preprocessing(photos: list, repeats: int) -> dict:
+    """Per-stage timings of preprocess_bytes: decode, detect, resize"""
+    stages = {}
+    detected = 0
+    for image_bytes in photos:
+        # warm-up pass, also counts detections
+        detected += int(run_pipeline(image_bytes, 1, 1.0) is not None)
+        for _ in range(repeats):
+            run_pipeline(image_bytes, 1, 1.0, stages)
+
+    result = {name: summarise(timings) for name, timings in stages.items()}
+    result["images"] = len(photos)
+    result["detection_rate"] = round(detected / len(photos), 4) if photos else 0.0
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def benchmark_inference(backend, images: np.ndarray, labels: np.ndarray, batch_size: int,
+                        repeats: int) -> dict:
+    """Latency over repeated batches, accuracy and F1 over the whole sample at this batch size"""
+    batch = images[:batch_size]
+    backend.predict(batch)  # warm-up, first call builds the graph / resizes tensors
+    timings_ms = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        backend.predict(batch)
+        timings_ms.append((time.perf_counter() - started) * 1000.0)
+
+    probabilities = np.concatenate([
+        calibrate(backend.predict(images[start:start + batch_size]))
+        for start in range(0, len(images), batch_size)
+    ])
+    predicted = np.argmax(probabilities, axis=1)
+    return {
+        "batch_size": len(batch),
+        **summarise(timings_ms, len(batch)),
+        "accuracy": round(float(np.mean(predicted == labels)), 5),
+        "macro_f1": round(macro_f1(predicted, labels), 5),
+    }
+
+
+def run_key(run: dict) -> tuple:
+    return run["engine"], run["threads"], run["batch_size"]
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> list:
+    """Runs whose p50 latency or accuracy got worse than the baseline by more than max_regression"""
+    regressions = []
+    previous = {run_key(run): run for run in baseline.get("inference", [])}
+    for run in report["inference"]:
+        old = previous.get(run_key(run))
+        if old is None:
+            continue
+        slowdown = run["p50_ms"] / old["p50_ms"] - 1.0 if old["p50_ms"] else 0.0
+        accuracy_drop = old["accuracy"] - run["accuracy"]
+        label = "{} threads={} batch={}".format(*run_key(run))
+        print(f"{label:>32}: p50 {old['p50_ms']:.2f} -> {run['p50_ms']:.2f} ms ({slowdown:+.1%}), "
+              f"accuracy {old['accuracy']:.4f} -> {run['accuracy']:.4f}")
+        if slowdown > max_regression or accuracy_drop > max_regression:
+            regressions.append(label)
+
+    old_total = baseline.get("preprocessing", {}).get("total")
+    new_total = report.get("preprocessing", {}).get("total")
+    if old_total and new_total:
+        slowdown = new_total["p50_ms"] / old_total["p50_ms"] - 1.0
+        print(f"{'preprocessing':>32}: p50 {old_total['p50_ms']:.2f} -> {new_total['p50_ms']:.2f} ms ({slowdown:+.1%})")
+        if slowdown > max_regression:
+            regressions.append("preprocessing")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark FER preprocessing and inference, with accuracy")
+    parser.add_argument("--csv", default=None, help="dataset store or notebook CSV (default: data/fer2013_test store if built, else the CSV)")
+    parser.add_argument("--samples", type=int, default=1000, help="random subset of the CSV (0 = all)")
+    parser.add_argument("--engines", nargs="+", default=[FER_ENGINE], choices=sorted(BACKENDS))
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--threads", nargs="+", type=int, default=[0],
+                        help="intra-op threads for tflite/onnx (0 = runtime default)")
+    parser.add_argument("--repeats", type=int, default=50, help="timed calls per inference run")
+    parser.add_argument("--images", help="folder of camera photos for the preprocessing stages")
+    parser.add_argument("--synthetic-size", type=int, default=8 * IMAGE_SIZE,
+                        help="frame size of the synthetic photos used without --images")
+    parser.add_argument("--preprocess-repeats", type=int, default=3)
+    parser.add_argument("--skip-preprocessing", action="store_true")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.1,
+                        help="relative slowdown or absolute accuracy drop that fails the comparison")
+    args = parser.parse_args(argv)
+
+    images, labels = load_samples(args.csv, limit=args.samples or None, seed=0)
+    report = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "cpus": os.cpu_count(),
+        },
+        "data": args.csv or "default test set",
+        "samples": int(len(images)),
+        "peak_rss_mb_at_start": peak_rss_mb(),
+    }
+
+    if not args.skip_preprocessing:
+        if args.images:
+            photos = [image_bytes for _, image_bytes in load_images(args.images)]
+            source = args.images
+        else:
+            photos = synthetic_photos(images[:200], args.synthetic_size)
+            source = f"synthetic {args.synthetic_size}px"
+        print(f"Preprocessing: {len(photos)} images ({source})")
+        report["preprocessing"] = {"source": source, **benchmark_preprocessing(photos, args.preprocess_repeats)}
+
+    runs = []
+    for engine in args.engines:
+        for threads in args.threads:
+            rss_before = peak_rss_mb()
+            try:
+                backend = load_backend(engine, num_threads=threads)
+            except Exception as e:
+                print(f"Skipping {engine} (threads={threads}): {e}")
+                continue
+            for batch_size in args.batch_sizes:
+                run = {"engine": engine, "threads": threads,
+                       **benchmark_inference(backend, images, labels, batch_size, args.repeats)}
+                run["peak_rss_mb"] = peak_rss_mb()
+                run["rss_increase_mb"] = round(run["peak_rss_mb"] - rss_before, 1)
+                rss_before = run["peak_rss_mb"]
+                runs.append(run)
+            del backend
+    report["inference"] = runs
+
+    if "preprocessing" in report:
+        stages = report["preprocessing"]
+        print(f"{'stage':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'img/s':>9}")
+        for name in ("decode", "detect", "resize", "total"):
+            if name in stages:
+                s = stages[name]
+                print(f"{name:>8} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f} {s['images_per_sec']:>9.1f}")
+        print(f"detection rate {stages['detection_rate']:.1%}, peak RSS {stages['peak_rss_mb']} MB")
+
+    print(f"{'engine':>12} {'threads':>7} {'batch':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'img/s':>9} {'acc':>7} {'F1':>7} {'RSS MB':>8}")
+    for r in runs:
+        print(f"{r['engine']:>12} {r['threads']:>7} {r['batch_size']:>5} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+              f"{r['p99_ms']:>8.2f} {r['images_per_sec']:>9.1f} {r['accuracy']:>7.4f} {r['macro_f1']:>7.4f} "
+              f"{r['peak_rss_mb']:>8.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.max_regression)
+        if regressions:
+            print(f"Regressions beyond {args.max_regression:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""
+Benchmark the face preprocessing pipeline on sample photos.
+
+Compares the full-resolution path against reduced-resolution decoding
+(FER_DECODE_SCALE) and downscaled detection (FER_DETECT_SCALE): latency per
+image and whether the detected face box agrees with the full-resolution one.
+
+Run from the api/ folder with a folder of camera photos:
+    python -m fer2013.benchmark_preprocessing --images samples/ --configs 1x1 2x1 4x1 1x2 1x4
+A config is <decode scale>x<detect scale>; 1x1 is the current path and the baseline.
+
+With --sequence the images (sorted by name) or the frames of --video are treated
+as one stream, and full-frame detection on every frame is compared with the
+FaceTracker used by /facial_emotion/stream:
+    python -m fer2013.benchmark_preprocessing --sequence --video clip.mp4
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from .preprocessingImage import (MIN_FACE_SIZE, PreprocessingError, bytes_to_numpy, greyscale,
+                                 locate_face, resize)
+from .tracking import FaceTracker
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# boxes with at least this intersection-over-union count as the same face
+AGREEMENT_IOU = 0.5
+
+
+def parse_config(text: str) -> tuple:
+    decode_scale, detect_scale = text.lower().split("x")
+    return int(decode_scale), float(detect_scale)
+
+
+def load_images(folder: str) -> list:
+    names = sorted(name for name in os.listdir(folder) if name.lower().endswith(IMAGE_EXTENSIONS))
+    images = []
+    for name in names:
+        with open(os.path.join(folder, name), "rb") as f:
+            images.append((name, f.read()))
+    return images
+
+
+def run_pipeline(image_bytes: bytes, decode_scale: int, detect_scale: float, stages: dict = None):
+    """
+    Full preprocessing of one image, returns the face box in full-resolution pixels or None.
+    With stages, the ms spent in decode / detect / resize / total are appended to its lists.
+    """
+    started = time.perf_counter()
+    image = greyscale(bytes_to_numpy(image_bytes, decode_scale))
+    decoded = time.perf_counter()
+    try:
+        box = locate_face(image, detect_scale, MIN_FACE_SIZE // decode_scale)
+    except PreprocessingError:
+        box = None
+    located = time.perf_counter()
+    if box is not None:
+        x, y, w, h = box
+        resize(image[y:y+h, x:x+w])
+    finished = time.perf_counter()
+
+    if stages is not None:
+        stages.setdefault("decode", []).append((decoded - started) * 1000.0)
+        stages.setdefault("detect", []).append((located - decoded) * 1000.0)
+        if box is not None:
+            stages.setdefault("resize", []).append((finished - located) * 1000.0)
+        stages.setdefault("total", []).append((finished - started) * 1000.0)
+    return None if box is None else np.array(box, dtype=np.float64) * decode_scale
+
+
+def iou(a, b) -> float:
+    ax2, ay2 = a[0] + a[2], a[1] + a[3]
+    bx2, by2 = b[0] + b[2], b[1] + b[3]
+    inter_w = max(0.0, min(ax2, bx2) - max(a[0], b[0]))
+    inter_h = max(0.0, min(ay2, by2) - max(a[1], b[1]))
+    inter = inter_w * inter_h
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def benchmark_config(images: list, decode_scale: int, detect_scale: float, repeats: int) -> tuple:
+    timings_ms = []
+    boxes = []
+    for _, image_bytes in images:
+        box = run_pipeline(image_bytes, decode_scale, detect_scale)  # warm-up, also the result
+        boxes.append(box)
+        for _ in range(repeats):
+            started = time.perf_counter()
+            run_pipeline(image_bytes, decode_scale, detect_scale)
+            timings_ms.append((time.perf_counter() - started) * 1000.0)
+    return np.array(timings_ms), boxes
+
+
+def compare_boxes(boxes: list, baseline: list) -> dict:
+    agree = 0
+    ious = []
+    for box, reference in zip(boxes, baseline):
+        if box is None or reference is None:
+            agree += int(box is None and reference is None)
+            continue
+        overlap = iou(box, reference)
+        ious.append(overlap)
+        agree += int(overlap >= AGREEMENT_IOU)
+    return {
+        "agreement": round(agree / len(boxes), 4),
+        "mean_iou": round(float(np.mean(ious)), 4) if ious else None,
+    }
+
+
+def load_sequence(folder: str = None, video: str = None, limit: int = 300) -> list:
+    """Greyscale frames of one stream, from a video file or a folder of numbered images"""
+    frames = []
+    if video:
+        capture = cv2.VideoCapture(video)
+        while len(frames) < limit:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frames.append(greyscale(frame))
+        capture.release()
+    else:
+        for _, image_bytes in load_images(folder)[:limit]:
+            frames.append(greyscale(bytes_to_numpy(image_bytes)))
+    return frames
+
+
+def run_sequence(frames: list, tracker=None) -> tuple:
+    timings_ms = []
+    boxes = []
+    for frame in frames:
+        started = time.perf_counter()
+        try:
+            x, y, w, h = tracker.locate(frame) if tracker else locate_face(frame)
+            resize(frame[y:y+h, x:x+w])
+            box = np.array([x, y, w, h], dtype=np.float64)
+        except PreprocessingError:
+            box = None
+        timings_ms.append((time.perf_counter() - started) * 1000.0)
+        boxes.append(box)
+    return timings_ms, boxes
+
+
+def benchmark_sequence(frames: list, repeats: int) -> list:
+    full_timings, tracked_timings = [], []
+    for _ in range(repeats):
+        timings_ms, full_boxes = run_sequence(frames)
+        full_timings.extend(timings_ms)
+        # a fresh tracker per pass, like a new WebSocket connection
+        tracker = FaceTracker(detect_scale=1.0)
+        timings_ms, tracked_boxes = run_sequence(frames, tracker)
+        tracked_timings.extend(timings_ms)
+
+    full_median = float(np.median(full_timings))
+    tracked_median = float(np.median(tracked_timings))
+    return [
+        {
+            "mode": "full",
+            "median_ms": round(full_median, 3),
+            "p95_ms": round(float(np.percentile(full_timings, 95)), 3),
+            "mean_ms": round(float(np.mean(full_timings)), 3),
+            "speedup": 1.0,
+            "detection_rate": round(sum(box is not None for box in full_boxes) / len(frames), 4),
+            **compare_boxes(full_boxes, full_boxes),
+        },
+        {
+            "mode": "tracked",
+            "median_ms": round(tracked_median, 3),
+            "p95_ms": round(float(np.percentile(tracked_timings, 95)), 3),
+            "mean_ms": round(float(np.mean(tracked_timings)), 3),
+            "speedup": round(float(np.mean(full_timings)) / float(np.mean(tracked_timings)), 2),
+            "detection_rate": round(sum(box is not None for box in tracked_boxes) / len(frames), 4),
+            **compare_boxes(tracked_boxes, full_boxes),
+            # counters of the last pass
+            **tracker.stats(),
+        },
+    ]
+
+
+def main_sequence(args) -> int:
+    frames = load_sequence(args.images, args.video, args.max_frames)
+    if not frames:
+        print("No frames to benchmark")
+        return 1
+
+    results = benchmark_sequence(frames, args.repeats)
+    print(f"{len(frames)} frames, {args.repeats} passes")
+    print(f"{'mode':>8} {'median ms':>10} {'p95 ms':>8} {'mean ms':>8} {'speedup':>8} {'detected':>9} {'agree':>6}")
+    for r in results:
+        print(f"{r['mode']:>8} {r['median_ms']:>10.2f} {r['p95_ms']:>8.2f} {r['mean_ms']:>8.2f} "
+              f"{r['speedup']:>7.2f}x {r['detection_rate']:>9.1%} {r['agreement']:>6.1%}")
+    tracked = results[1]
+    print(f"tracker: {tracked['full_detections']} full detections, {tracked['tracked_frames']} tracked frames, "
+          f"{tracked['lost']} lost")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"frames": len(frames), "repeats": args.repeats, "results": results}, f, indent=2)
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark reduced-resolution face preprocessing")
+    parser.add_argument("--images", help="folder of JPEG/PNG sample photos")
+    parser.add_argument("--configs", nargs="+", default=["1x1", "2x1", "4x1", "1x2", "1x4", "2x2"],
+                        help="<decode scale>x<detect scale> pairs, 1x1 is always run as the baseline")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--sequence", action="store_true",
+                        help="benchmark face tracking over consecutive frames instead of decode/detect scales")
+    parser.add_argument("--video", help="video file used as the frame sequence (with --sequence)")
+    parser.add_argument("--max-frames", type=int, default=300)
+    args = parser.parse_args(argv)
+
+    if args.sequence:
+        if not (args.images or args.video):
+            parser.error("--sequence needs --images or --video")
+        return main_sequence(args)
+    if not args.images:
+        parser.error("--images is required")
+
+    images = load_images(args.images)
+    if not images:
+        print(f"No images found in {args.images}")
+        return 1
+
+    configs = [parse_config(text) for text in args.configs]
+    if (1, 1.0) in configs:
+        configs.remove((1, 1.0))
+    configs.insert(0, (1, 1.0))
+
+    results = []
+    baseline_boxes = None
+    baseline_median = None
+    for decode_scale, detect_scale in configs:
+        timings_ms, boxes = benchmark_config(images, decode_scale, detect_scale, args.repeats)
+        if baseline_boxes is None:
+            baseline_boxes, baseline_median = boxes, float(np.median(timings_ms))
+        median = float(np.median(timings_ms))
+        results.append({
+            "config": f"{decode_scale}x{detect_scale:g}",
+            "decode_scale": decode_scale,
+            "detect_scale": detect_scale,
+            "median_ms": round(median, 3),
+            "p95_ms": round(float(np.percentile(timings_ms, 95)), 3),
+            "speedup": round(baseline_median / median, 2),
+            "detection_rate": round(sum(box is not None for box in boxes) / len(boxes), 4),
+            **compare_boxes(boxes, baseline_boxes),
+        })
+
+    print(f"{len(images)} images, {args.repeats} repeats each")
+    print(f"{'config':>8} {'median ms':>10} {'p95 ms':>8} {'speedup':>8} {'detected':>9} {'agree':>6} {'IoU':>6}")
+    for r in results:
+        mean_iou = f"{r['mean_iou']:.3f}" if r["mean_iou"] is not None else "-"
+        print(f"{r['config']:>8} {r['median_ms']:>10.2f} {r['p95_ms']:>8.2f} {r['speedup']:>7.2f}x "
+              f"{r['detection_rate']:>9.1%} {r['agreement']:>6.1%} {mean_iou:>6}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"images": len(images), "repeats": args.repeats, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
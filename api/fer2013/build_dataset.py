@@ -0,0 +1,162 @@
+"""
+Convert FER2013 to memory-mapped dataset stores.
+
+A store is a folder holding images.npy (uint8, N x 48 x 48), labels.npy and
+index.json. It is about the size of the raw pixels, opens instantly with
+MemmapDataset and replaces the notebook CSVs, which take several times the
+dataset size in RAM to parse.
+
+The source is either the Kaggle image folders (data/train/<emotion>/*.png)
+or a notebook CSV. Images are written straight into the memory-mapped file
+one at a time, so conversion itself also runs in flat memory.
+
+Run from the api/ folder:
+    python -m fer2013.build_dataset                # data/train and data/test, or the CSVs
+    python -m fer2013.build_dataset --source data/test --output data/fer2013_test
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+
+import cv2
+import numpy as np
+
+from .dataset import (DATA_DIR, IMAGE_SIZE, STORE_IMAGES, STORE_INDEX, STORE_LABELS, TEST_CSV_PATH,
+                      TEST_STORE_PATH, TRAIN_CSV_PATH, TRAIN_STORE_PATH)
+from .predict import emotion_labels
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def folder_files(source: str) -> list:
+    """(path, label) of every image under source/<emotion>/, emotion folder names matched case-insensitively"""
+    folders = {name.lower(): os.path.join(source, name) for name in os.listdir(source)
+               if os.path.isdir(os.path.join(source, name))}
+    files = []
+    for label, emotion in enumerate(emotion_labels):
+        folder = folders.get(emotion)
+        if folder is None:
+            print(f"Skipping missing folder: {os.path.join(source, emotion)}")
+            continue
+        files.extend((os.path.join(folder, name), label) for name in sorted(os.listdir(folder))
+                     if name.lower().endswith(IMAGE_EXTENSIONS))
+    return files
+
+
+def read_folder_image(path: str) -> np.ndarray:
+    image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError("could not decode image")
+    if image.shape != (IMAGE_SIZE, IMAGE_SIZE):
+        image = cv2.resize(image, (IMAGE_SIZE, IMAGE_SIZE), interpolation=cv2.INTER_AREA)
+    return image
+
+
+def csv_rows(csv_path: str):
+    with open(csv_path) as f:
+        next(f)  # header
+        for line in f:
+            if line.strip():
+                row = np.array(line.split(","), dtype=np.int64)
+                yield row[:-1].reshape(IMAGE_SIZE, IMAGE_SIZE), int(row[-1])
+
+
+def count_csv_rows(csv_path: str) -> int:
+    with open(csv_path) as f:
+        return sum(1 for line in f if line.strip()) - 1
+
+
+def write_store(output: str, count: int, items, source: str) -> dict:
+    """Write (image, label) items into a new store, replacing output only once it is complete"""
+    partial = output + ".partial"
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+
+    images = np.lib.format.open_memmap(os.path.join(partial, STORE_IMAGES), mode="w+", dtype=np.uint8,
+                                       shape=(count, IMAGE_SIZE, IMAGE_SIZE))
+    labels = np.zeros(count, dtype=np.uint8)
+    written = 0
+    for image, label in items:
+        images[written] = image
+        labels[written] = label
+        written += 1
+    images.flush()
+    del images
+
+    if written < count:
+        # unreadable images were skipped, trim the file to what was written
+        trimmed = np.load(os.path.join(partial, STORE_IMAGES), mmap_mode="r")[:written].copy()
+        np.save(os.path.join(partial, STORE_IMAGES), trimmed)
+        labels = labels[:written]
+    np.save(os.path.join(partial, STORE_LABELS), labels)
+
+    index = {
+        "count": written,
+        "image_size": IMAGE_SIZE,
+        "labels": emotion_labels,
+        "class_counts": {label: int(n) for label, n in zip(emotion_labels, np.bincount(labels, minlength=len(emotion_labels)))},
+        "source": source,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(partial, STORE_INDEX), "w") as f:
+        json.dump(index, f, indent=2)
+
+    shutil.rmtree(output, ignore_errors=True)
+    os.replace(partial, output)
+    return index
+
+
+def build(source: str, output: str) -> dict:
+    if os.path.isdir(source):
+        files = folder_files(source)
+
+        def items():
+            for path, label in files:
+                try:
+                    yield read_folder_image(path), label
+                except Exception as e:
+                    print(f"Failed to process {path}: {e}")
+
+        return write_store(output, len(files), items(), source)
+    return write_store(output, count_csv_rows(source), csv_rows(source), source)
+
+
+def default_jobs() -> list:
+    jobs = []
+    for split, csv_path, output in (("train", TRAIN_CSV_PATH, TRAIN_STORE_PATH), ("test", TEST_CSV_PATH, TEST_STORE_PATH)):
+        folder = os.path.join(DATA_DIR, split)
+        if os.path.isdir(folder):
+            jobs.append((folder, output))
+        elif os.path.exists(csv_path):
+            jobs.append((csv_path, output))
+    return jobs
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Convert FER2013 image folders or CSVs to memory-mapped stores")
+    parser.add_argument("--source", help="data/<split> image folder or notebook CSV (default: both splits)")
+    parser.add_argument("--output", help="store folder to write (required with --source)")
+    args = parser.parse_args(argv)
+
+    if args.source:
+        if not args.output:
+            parser.error("--output is required with --source")
+        jobs = [(args.source, args.output)]
+    else:
+        jobs = default_jobs()
+        if not jobs:
+            print(f"No FER2013 folders or CSVs found in {DATA_DIR}")
+            return 1
+
+    for source, output in jobs:
+        index = build(source, output)
+        size_mb = os.path.getsize(os.path.join(output, STORE_IMAGES)) / (1024 * 1024)
+        print(f"{source} -> {output}: {index['count']} images, {size_mb:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
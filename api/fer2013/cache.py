@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import cv2
+import numpy as np
+
+# Result cache settings, override with environment variables (FER_CACHE_MAX_BYTES=0 disables it)
+CACHE_MAX_BYTES = int(os.getenv("FER_CACHE_MAX_BYTES", str(2 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.getenv("FER_CACHE_TTL_SECONDS", "60"))
+# faces whose hashes differ in at most this many of the 64 bits count as the same face
+CACHE_MAX_DISTANCE = int(os.getenv("FER_CACHE_MAX_DISTANCE", "2"))
+
+# rough per-entry cost on top of the probability vector: dict slot, key int, tuple, ndarray header
+ENTRY_OVERHEAD_BYTES = 250
+
+
+def face_hash(face: np.ndarray) -> int:
+    """
+    64-bit difference hash of a preprocessed (48, 48[, 1]) face: shrink to 9x8 and
+    record whether each pixel is brighter than its right neighbour. Re-sent photos of
+    the same face give the same or a very close hash.
+    """
+    small = cv2.resize(face.reshape(face.shape[0], face.shape[1]), (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class ResultCache:
+    """
+    LRU + TTL cache from face hash to probability vector, bounded by an
+    approximate memory ceiling in bytes. Safe to use from several threads.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, ttl_seconds: float = CACHE_TTL_SECONDS,
+                 max_distance: int = CACHE_MAX_DISTANCE):
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.max_distance = max_distance
+        self._entries = OrderedDict()  # hash -> (probabilities, expires_at)
+        self.bytes = 0
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # model version the entries came from, see reset()
+        self.version = None
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def _entry_bytes(probabilities: np.ndarray) -> int:
+        return probabilities.nbytes + ENTRY_OVERHEAD_BYTES
+
+    def _remove(self, key: int):
+        probabilities, _ = self._entries.pop(key)
+        self.bytes -= self._entry_bytes(probabilities)
+
+    def _nearest(self, key: int) -> Optional[int]:
+        # vectorised Hamming distance against every cached hash
+        keys = np.fromiter(self._entries.keys(), dtype=np.uint64, count=len(self._entries))
+        xor = np.bitwise_xor(keys, np.uint64(key))
+        distances = np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        best = int(np.argmin(distances))
+        return int(keys[best]) if distances[best] <= self.max_distance else None
+
+    def get(self, key: int) -> Optional[np.ndarray]:
+        if not self.enabled:
+            return None
+        with self.lock:
+            near = False
+            if key not in self._entries and self.max_distance > 0 and self._entries:
+                nearest = self._nearest(key)
+                if nearest is not None:
+                    key, near = nearest, True
+
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            probabilities, expires_at = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.near_hits += int(near)
+            return probabilities
+
+    def put(self, key: int, probabilities: np.ndarray, version: Optional[str] = None):
+        """Store a result of the given model version; results of any other version than the current are dropped"""
+        if not self.enabled:
+            return
+        probabilities = np.array(probabilities, dtype=np.float32)
+        with self.lock:
+            if version != self.version:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (probabilities, time.monotonic() + self.ttl)
+            self.bytes += self._entry_bytes(probabilities)
+            # evict least recently used entries until we are back under the ceiling
+            while self.bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """Forget every entry"""
+        with self.lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def reset(self, version: Optional[str]):
+        """Start over when the serving model version changed; no-op while it is the same"""
+        with self.lock:
+            if version != self.version:
+                self._entries.clear()
+                self.bytes = 0
+                self.version = version
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
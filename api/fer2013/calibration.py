@@ -0,0 +1,65 @@
+"""
+Fit the softmax temperature used to calibrate FER probabilities.
+
+Searches for the temperature that minimises the negative log-likelihood of the
+true labels of the FER2013 test set, and reports the expected calibration
+error before and after. Set the printed value as FER_TEMPERATURE.
+
+Run from the api/ folder:
+    python -m fer2013.calibration --samples 3000
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from .backends import load_backend
+from .dataset import load_samples
+from .predict import calibrate
+
+
+def negative_log_likelihood(probabilities: np.ndarray, labels: np.ndarray) -> float:
+    picked = probabilities[np.arange(len(labels)), labels]
+    return float(-np.mean(np.log(np.clip(picked, 1e-12, 1.0))))
+
+
+def expected_calibration_error(probabilities: np.ndarray, labels: np.ndarray, bins: int = 15) -> float:
+    confidence = probabilities.max(axis=1)
+    correct = probabilities.argmax(axis=1) == labels
+    bin_index = np.minimum((confidence * bins).astype(int), bins - 1)
+    error = 0.0
+    for b in range(bins):
+        in_bin = bin_index == b
+        if in_bin.any():
+            error += in_bin.mean() * abs(correct[in_bin].mean() - confidence[in_bin].mean())
+    return float(error)
+
+
+def fit_temperature(probabilities: np.ndarray, labels: np.ndarray) -> float:
+    temperatures = np.linspace(0.5, 5.0, 91)
+    losses = [negative_log_likelihood(calibrate(probabilities, t), labels) for t in temperatures]
+    return float(temperatures[int(np.argmin(losses))])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Fit FER_TEMPERATURE on the FER2013 test CSV")
+    parser.add_argument("--csv", default=None, help="dataset store or notebook CSV (default: data/fer2013_test store if built, else the CSV)")
+    parser.add_argument("--samples", type=int, default=None, help="random subset size (default: all)")
+    parser.add_argument("--engine", default=None, help="inference engine (default: FER_ENGINE)")
+    args = parser.parse_args(argv)
+
+    images, labels = load_samples(args.csv, limit=args.samples, seed=0)
+    backend = load_backend(args.engine) if args.engine else load_backend()
+    probabilities = np.concatenate([backend.predict(images[i:i + 256]) for i in range(0, len(images), 256)])
+
+    temperature = fit_temperature(probabilities, labels)
+    calibrated = calibrate(probabilities, temperature)
+    print(f"images: {len(images)}")
+    print(f"NLL: {negative_log_likelihood(probabilities, labels):.4f} -> {negative_log_likelihood(calibrated, labels):.4f}")
+    print(f"ECE: {expected_calibration_error(probabilities, labels):.4f} -> {expected_calibration_error(calibrated, labels):.4f}")
+    print(f"FER_TEMPERATURE={temperature:g}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
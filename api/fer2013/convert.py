@@ -0,0 +1,103 @@
+"""
+One-time export of the Keras FER model to the lightweight serving engines.
+
+Run from the api/ folder:
+    python -m fer2013.convert --to tflite onnx
+    python -m fer2013.convert --check-only --engines tflite onnx
+
+Exporting needs TensorFlow (and tf2onnx for ONNX). Serving the exported
+models only needs tflite-runtime / ai-edge-litert or onnxruntime.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from .backends import MODEL_PATHS, load_backend
+from .dataset import TEST_CSV_PATH, TEST_STORE_PATH, is_store, load_samples
+
+# Largest allowed difference between an engine's probabilities and the Keras reference
+PARITY_TOLERANCE = 1e-4
+
+
+def load_keras_model(path: str = MODEL_PATHS["keras"]):
+    import tensorflow as tf
+    return tf.keras.models.load_model(path)
+
+
+def export_tflite(model, output_path: str = MODEL_PATHS["tflite"]) -> str:
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+    return output_path
+
+
+def export_onnx(model, output_path: str = MODEL_PATHS["onnx"], opset: int = 13) -> str:
+    import tensorflow as tf
+    import tf2onnx
+    # leave the batch dimension dynamic so the micro-batcher can send any batch size
+    input_signature = [tf.TensorSpec((None, 48, 48, 1), tf.float32, name="input")]
+    tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=opset, output_path=output_path)
+    return output_path
+
+
+EXPORTERS = {
+    "tflite": export_tflite,
+    "onnx": export_onnx,
+}
+
+
+def parity_samples(count: int) -> np.ndarray:
+    # real faces when the test store or CSV is around, random images otherwise
+    if is_store(TEST_STORE_PATH) or os.path.exists(TEST_CSV_PATH):
+        images, _ = load_samples(limit=count, seed=0)
+        return images
+    rng = np.random.default_rng(0)
+    return rng.random((count, 48, 48, 1), dtype=np.float32)
+
+
+def check_parity(engines: list, samples: np.ndarray, tolerance: float = PARITY_TOLERANCE) -> bool:
+    """Compare every engine against the Keras model on the same batch, returns True if all match"""
+    reference = load_backend("keras").predict(samples)
+    reference_labels = np.argmax(reference, axis=1)
+    all_match = True
+
+    for engine in engines:
+        predictions = load_backend(engine).predict(samples)
+        max_diff = float(np.max(np.abs(predictions - reference)))
+        agreement = float(np.mean(np.argmax(predictions, axis=1) == reference_labels))
+        ok = max_diff <= tolerance and agreement == 1.0
+        all_match = all_match and ok
+        print(f"{engine:>6}: max |p - p_keras| = {max_diff:.2e}, "
+              f"label agreement = {agreement:.2%} -> {'OK' if ok else 'MISMATCH'}")
+
+    return all_match
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export the FER Keras model to TFLite / ONNX and check parity")
+    parser.add_argument("--to", nargs="+", choices=sorted(EXPORTERS), default=sorted(EXPORTERS),
+                        help="engines to export")
+    parser.add_argument("--check-only", action="store_true", help="skip exporting, only run the parity check")
+    parser.add_argument("--engines", nargs="+", choices=sorted(EXPORTERS),
+                        help="engines to check (defaults to --to)")
+    parser.add_argument("--samples", type=int, default=256, help="images used for the parity check")
+    parser.add_argument("--tolerance", type=float, default=PARITY_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    if not args.check_only:
+        model = load_keras_model()
+        for engine in args.to:
+            print(f"Exported {engine}: {EXPORTERS[engine](model)}")
+
+    samples = parity_samples(args.samples)
+    print(f"Parity check on {len(samples)} images")
+    if not check_parity(args.engines or args.to, samples, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import json
+import os
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+# CSVs written by fer2013-model.ipynb: 2304 pixel columns followed by an integer 'emotion' column
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+TEST_CSV_PATH = os.path.join(DATA_DIR, "fer2013_test.csv")
+TRAIN_CSV_PATH = os.path.join(DATA_DIR, "fer2013_train.csv")
+# memory-mapped stores written by python -m fer2013.build_dataset
+TEST_STORE_PATH = os.path.join(DATA_DIR, "fer2013_test")
+TRAIN_STORE_PATH = os.path.join(DATA_DIR, "fer2013_train")
+
+IMAGE_SIZE = 48
+
+# files of a dataset store
+STORE_IMAGES = "images.npy"  # uint8 (N, 48, 48), opened with mmap_mode="r"
+STORE_LABELS = "labels.npy"  # uint8 (N,), index into predict.emotion_labels
+STORE_INDEX = "index.json"  # count, labels, per-class counts and the source it was built from
+
+
+def to_model_input(images: np.ndarray) -> np.ndarray:
+    """uint8 (N, 48, 48) faces to the float32 (N, 48, 48, 1) [0,1] input the service feeds the model"""
+    return (np.asarray(images, dtype=np.float32) / 255.0)[..., np.newaxis]
+
+
+def is_store(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, STORE_INDEX))
+
+
+class MemmapDataset:
+    """
+    FER2013 images in a dataset store, read through a memory map.
+
+    Opening is instant and only the rows of the current batch are paged in, so
+    memory use stays flat however large the store is. Labels are small and
+    loaded in full.
+    """
+
+    def __init__(self, path: str = TEST_STORE_PATH):
+        if not is_store(path):
+            raise FileNotFoundError(f"No dataset store at {path}, run python -m fer2013.build_dataset")
+        self.path = path
+        with open(os.path.join(path, STORE_INDEX)) as f:
+            self.index = json.load(f)
+        self.images = np.load(os.path.join(path, STORE_IMAGES), mmap_mode="r")
+        self.labels = np.load(os.path.join(path, STORE_LABELS)).astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def split(self, validation_fraction: float, seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Random (train, validation) row indexes"""
+        order = np.random.default_rng(seed).permutation(len(self))
+        cut = int(round(len(self) * (1.0 - validation_fraction)))
+        return order[:cut], order[cut:]
+
+    def batches(self, batch_size: int = 64, shuffle: bool = True, seed: Optional[int] = None,
+                indexes: Optional[np.ndarray] = None, drop_last: bool = False) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Yield (images, labels) mini-batches in model input format, reshuffled on every call.
+        indexes restricts the pass to those rows (e.g. one side of split()).
+        """
+        order = np.arange(len(self)) if indexes is None else np.asarray(indexes)
+        if shuffle:
+            order = np.random.default_rng(seed).permutation(order)
+        stop = len(order) - len(order) % batch_size if drop_last else len(order)
+        for start in range(0, stop, batch_size):
+            # sorted rows turn the gather into forward reads through the file
+            rows = np.sort(order[start:start + batch_size])
+            yield to_model_input(self.images[rows]), self.labels[rows]
+
+    def sample(self, limit: Optional[int] = None, seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Whole store, or a random subset of limit rows, in model input format"""
+        rows = np.arange(len(self))
+        if limit is not None and limit < len(self):
+            rows = np.sort(np.random.default_rng(seed).choice(len(self), size=limit, replace=False))
+        return to_model_input(self.images[rows]), self.labels[rows]
+
+
+def load_samples(path: Optional[str] = None, limit: Optional[int] = None,
+                 seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Test images and labels from a dataset store or a notebook CSV, whichever path points at.
+    Without a path the test store is used when it has been built, the test CSV otherwise.
+    """
+    if path is None:
+        path = TEST_STORE_PATH if is_store(TEST_STORE_PATH) else TEST_CSV_PATH
+    if is_store(path):
+        return MemmapDataset(path).sample(limit, seed)
+    return load_csv_samples(path, limit, seed)
+
+
+def load_csv_samples(csv_path: str = TEST_CSV_PATH, limit: Optional[int] = None,
+                     seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load FER2013 images and labels from one of the notebook CSVs.
+
+    Returns (images, labels) where images is float32 (N, 48, 48, 1) scaled to [0,1],
+    the same input the service feeds the model. With limit, a random subset of
+    that size is returned (reproducible when seed is set).
+    """
+    data = np.loadtxt(csv_path, delimiter=",", skiprows=1, dtype=np.uint8)
+    if limit is not None and limit < len(data):
+        rng = np.random.default_rng(seed)
+        data = data[np.sort(rng.choice(len(data), size=limit, replace=False))]
+
+    images = data[:, :-1].reshape(-1, IMAGE_SIZE, IMAGE_SIZE, 1).astype(np.float32) / 255.0
+    labels = data[:, -1].astype(np.int64)
+    return images, labels
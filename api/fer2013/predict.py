@@ -1,23 +1,175 @@
+import logging
 import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import List
+
 import numpy as np
-import tensorflow as tf
+
+from startup import startup_timer
+from metrics import fer_stage_seconds
+from .backends import load_backend, InferenceBackend
+from .registry import DEFAULT_VERSION, ModelVersionError, registry
+
+logger = logging.getLogger(__name__)
 
 # Emotion labels (make sure order matches your model)
 emotion_labels = ['angry', 'disgust', 'fear', 'happy', 'neutral', 'sad', 'surprise']
 
-# Use:
-file_path = "fer2013/model/fer_emotion_model.h5"
-print(os.path.exists(file_path))
+# Softmax temperature fitted with python -m fer2013.calibration (1.0 = model output as is)
+FER_TEMPERATURE = float(os.getenv("FER_TEMPERATURE", "1.0"))
+# Number of runner-up emotions returned with a detailed prediction
+FER_TOP_K = int(os.getenv("FER_TOP_K", "3"))
+# How often every worker process checks the registry for a version promoted or rolled back through
+# another worker, in seconds (0 turns it off, for a single worker)
+FER_REGISTRY_POLL_SECONDS = float(os.getenv("FER_REGISTRY_POLL_SECONDS", "5"))
+
+# The model is loaded on first use (or by the startup warm-up): the active registry version if
+# there is one, otherwise the default model of FER_ENGINE
+# model is the serving pointer, swap_model replaces it without stopping requests
+model = None
+model_version = None
+model_lock = threading.Lock()
+# one promotion or rollback at a time
+swap_lock = threading.Lock()
+registry_watcher = None
+watcher_lock = threading.Lock()
+# one observation per forward pass (a whole micro-batch), for GET /metrics
+infer_seconds = fer_stage_seconds.labels("infer")
+
+def get_model() -> InferenceBackend:
+    global model, model_version
+    if model is None:
+        with model_lock:
+            if model is None:
+                with startup_timer.phase("fer model", lazy=True):
+                    version = registry.active
+                    model = registry.load(version) if version else load_backend()
+                    model_version = version or DEFAULT_VERSION
+                logger.info("FER model loaded: %s (%s), version %s", model.name, model.path, model_version)
+    start_registry_watch()
+    return model
+
+def start_registry_watch():
+    """Start following the registry in this worker, once; every path that sets the model calls it"""
+    global registry_watcher
+    if registry_watcher is not None:
+        return
+    with watcher_lock:
+        if registry_watcher is None and FER_REGISTRY_POLL_SECONDS > 0:
+            registry_watcher = threading.Thread(target=watch_registry, name="fer-registry-watch", daemon=True)
+            registry_watcher.start()
+
+def watch_registry():
+    """Follow promotions and rollbacks made through any worker, so every process serves the active version"""
+    modified = registry.modified()
+    while True:
+        time.sleep(FER_REGISTRY_POLL_SECONDS)
+        try:
+            current = registry.modified()
+            if current != modified:
+                modified = current
+                sync_with_registry()
+        except Exception:
+            logger.exception("Could not sync the FER model with the registry")
+
+def sync_with_registry() -> bool:
+    """Swap to the registry's active version if it is not the one serving, returns whether it swapped"""
+    global model, model_version
+    with swap_lock:
+        version = registry.active
+        if not version or version == model_version:
+            return False
+        # loaded and warmed up off the serving path, requests keep using the current model meanwhile
+        backend = registry.load(version)
+        with model_lock:
+            model, model_version = backend, version
+    start_registry_watch()
+    logger.info("FER model synced with the registry: %s (%s), version %s", backend.name, backend.path, version)
+    return True
+
+def swap_model(version: str = None, rollback: bool = False) -> str:
+    """
+    Load and warm up version (or, with rollback, the version the active one replaced), then
+    point serving at it and return its name. Blocks while loading, so call it off the event
+    loop. Batches already running keep the backend they started with and finish on the old
+    version, the old model is freed once the last of them is done.
+    """
+    global model, model_version
+    with swap_lock:
+        if rollback:
+            version = registry.previous()
+            if version is None:
+                raise ModelVersionError("No earlier model version to roll back to")
+        backend = registry.load(version)
+        with model_lock:
+            model, model_version = backend, version
+        registry.set_active(version, rollback)
+    # a worker whose first model came from a swap never went through get_model's loading branch
+    start_registry_watch()
+    logger.info("FER model swapped: %s (%s), version %s", backend.name, backend.path, version)
+    return version
+
+@dataclass
+class EmotionPrediction:
+    label: str
+    confidence: float
+    probabilities: np.ndarray  # one calibrated probability per entry of emotion_labels
+    top_k: List[tuple]  # (label, probability), most likely first
+    inference_ms: float
+
+    def to_dict(self) -> dict:
+        return {
+            "prediction": self.label,
+            "confidence": round(self.confidence, 5),
+            "probabilities": {label: round(float(p), 5) for label, p in zip(emotion_labels, self.probabilities)},
+            "top_k": [{"emotion": label, "probability": round(p, 5)} for label, p in self.top_k],
+            "inference_ms": round(self.inference_ms, 3),
+        }
+
+def calibrate(probabilities: np.ndarray, temperature: float = FER_TEMPERATURE) -> np.ndarray:
+    # temperature scaling on the softmax output: softmax(logits / T) == p ** (1 / T), renormalised
+    if temperature == 1.0:
+        return probabilities
+    scaled = np.power(np.clip(probabilities, 1e-12, 1.0), 1.0 / temperature)
+    return scaled / scaled.sum(axis=1, keepdims=True)
+
+def predict_batch(input_batch: np.ndarray) -> np.ndarray:
+    # input_batch shape: (N, 48, 48, 1), normalized to [0,1]
+    # returns the calibrated softmax output, shape (N, 7)
+    backend = get_model()
+    with infer_seconds.time():
+        return calibrate(backend.predict(input_batch))
+
+def to_predictions(probabilities: np.ndarray, inference_ms: float, top_k: int = FER_TOP_K) -> List[EmotionPrediction]:
+    """Build the structured results for a whole (N, 7) batch of probabilities at once"""
+    probabilities = np.asarray(probabilities, dtype=np.float32).reshape(-1, len(emotion_labels))
+    # one argsort for the whole batch gives both the label and the top-k
+    ranked = np.argsort(-probabilities, axis=1)[:, :max(1, top_k)]
+    ranked_p = np.take_along_axis(probabilities, ranked, axis=1)
+    return [
+        EmotionPrediction(
+            label=emotion_labels[indexes[0]],
+            confidence=float(scores[0]),
+            probabilities=row,
+            top_k=[(emotion_labels[i], float(p)) for i, p in zip(indexes, scores)],
+            inference_ms=inference_ms,
+        )
+        for row, indexes, scores in zip(probabilities, ranked, ranked_p)
+    ]
 
-# Load the model once at module level
-model = tf.keras.models.load_model(file_path)
+def predict_emotions(input_batch: np.ndarray, top_k: int = FER_TOP_K) -> List[EmotionPrediction]:
+    """Structured prediction (probabilities, top-k, timing) for every image in the batch"""
+    started = time.perf_counter()
+    probabilities = predict_batch(input_batch)
+    return to_predictions(probabilities, (time.perf_counter() - started) * 1000.0, top_k)
 
 def load_model_and_predict(input_batch: np.ndarray) -> str:
+    # label-only result kept for existing callers
     try:
         # input_batch shape: (1, 48, 48, 1), normalized to [0,1]
-        prediction = model.predict(input_batch, verbose=0)
-        predicted_label = emotion_labels[np.argmax(prediction)]
-        return predicted_label
+        return predict_emotions(input_batch, top_k=1)[0].label
     except Exception as e:
-        print(f"Error during prediction: {e}")
+        logger.error("Error during prediction: %s", e)
         return "error"
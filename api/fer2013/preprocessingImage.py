@@ -1,6 +1,14 @@
+import logging
+import os
+import threading
 import cv2
 import numpy as np
 import base64
+from typing import Optional
+
+from metrics import fer_stage_seconds
+
+logger = logging.getLogger(__name__)
 
 # exception handler for preprocessing errors
 class PreprocessingError(Exception):
@@ -11,17 +19,60 @@ class PreprocessingError(Exception):
         
 generic_user_message = "An error occurred while processing the image. Please try again."
 
+# stage timings for GET /metrics
+decode_seconds = fer_stage_seconds.labels("decode")
+detect_seconds = fer_stage_seconds.labels("detect")
+resize_seconds = fer_stage_seconds.labels("resize")
+
+# haarcascade used for face detection, override with FER_HAAR_CASCADE_PATH
+HAAR_CASCADE_PATH = os.getenv(
+    "FER_HAAR_CASCADE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "haarcascade_frontalface_default.xml"),
+)
+
+# CascadeClassifier is not safe to share between threads, so each thread keeps its own
+_detectors = threading.local()
+
+# Reduced-resolution mode for large camera photos, both default to the full-resolution path
+# decode straight to greyscale at 1/FER_DECODE_SCALE of the size (1, 2, 4 or 8)
+DECODE_SCALE = int(os.getenv("FER_DECODE_SCALE", "1"))
+# run face detection on a frame downscaled by FER_DETECT_SCALE and map the box back
+DETECT_SCALE = float(os.getenv("FER_DETECT_SCALE", "1"))
+
+REDUCED_GRAYSCALE_FLAGS = {
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+# fail at startup on an unsupported FER_DECODE_SCALE, not with an error on every request
+if DECODE_SCALE != 1 and DECODE_SCALE not in REDUCED_GRAYSCALE_FLAGS:
+    raise ValueError(f"FER_DECODE_SCALE must be 1, 2, 4 or 8, got {DECODE_SCALE}")
+
+# smallest face accepted, in full-resolution pixels
+MIN_FACE_SIZE = 60
+# the frontal face cascade is trained on 24x24 windows, nothing smaller can be detected
+HAAR_WINDOW_SIZE = 24
+# most faces scored from one image in all-faces mode, the largest ones are kept
+MAX_FACES = int(os.getenv("FER_MAX_FACES", "10"))
+
+def decode_flags(decode_scale: int) -> int:
+    if decode_scale == 1:
+        return cv2.IMREAD_COLOR
+    if decode_scale not in REDUCED_GRAYSCALE_FLAGS:
+        raise ValueError(f"decode scale must be 1, 2, 4 or 8, got {decode_scale}")
+    return REDUCED_GRAYSCALE_FLAGS[decode_scale]
+
 # Preprocess the image by greyscaling, detecting face, cropping to bounding box, and resizing
 # Note: do not normalise the pixel values as the first stage of the model does this
 
-def b64_to_numpy(base_64_image: str) -> np.ndarray:
+def b64_to_numpy(base_64_image: str, decode_scale: int = 1) -> np.ndarray:
     try:
         # decode the base64 image
         decoded_image = base64.b64decode(base_64_image)
         # convert the image to numpy array
         np_image = np.frombuffer(decoded_image, dtype=np.uint8)
         # decode the numpy array to image formay that opencv can read
-        cv2_image = cv2.imdecode(np_image, cv2.IMREAD_COLOR)
+        cv2_image = cv2.imdecode(np_image, decode_flags(decode_scale))
 
         if cv2_image is None:
             raise PreprocessingError(generic_user_message, "Error in decoding base64 image: cv2 image is None")
@@ -30,8 +81,25 @@ def b64_to_numpy(base_64_image: str) -> np.ndarray:
     except Exception as e:
         raise PreprocessingError(generic_user_message, f"Error in decoding base64 image: {e}")
 
+# decode raw JPEG/PNG bytes straight from the request buffer
+# np.frombuffer wraps the buffer without copying it, imdecode reads it in place
+def bytes_to_numpy(image_bytes, decode_scale: int = 1) -> np.ndarray:
+    try:
+        np_image = np.frombuffer(image_bytes, dtype=np.uint8)
+        cv2_image = cv2.imdecode(np_image, decode_flags(decode_scale))
+    except Exception as e:
+        raise PreprocessingError(generic_user_message, f"Error in decoding image bytes: {e}")
+
+    if cv2_image is None:
+        raise PreprocessingError(generic_user_message, "Error in decoding image bytes: cv2 image is None")
+
+    return cv2_image
+
 # greyscale the image
 def greyscale(image: np.ndarray) -> np.ndarray:
+    # reduced decoding already returns a greyscale image
+    if image.ndim == 2:
+        return image
     try:
         return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     except Exception as e:
@@ -39,40 +107,104 @@ def greyscale(image: np.ndarray) -> np.ndarray:
 
 # find the largest face in the image - 
 # haarcascadae often mistakenly detects multiple faces - the largest is usually the correct one
-def find_largest_face(faces: list) -> tuple:
-    largest_face = None
-    max_area = 0
-    
-    for x, y, w, h in faces:
-        area = w * h
-        if area > max_area:
-            max_area = area
-            largest_face = (x, y, w, h)
-            
-    return largest_face
-
-def detect_and_crop_to_face(image: np.ndarray) -> np.ndarray:
-    try:
-        # load the haarcascade for face detection
-        haar_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')    
-        
-        # check if haarcascade was loaded
-        if haar_cascade.empty():
-            raise PreprocessingError(generic_user_message, "Failed to load haarcascade")
+def find_largest_face(faces) -> tuple:
+    faces = np.asarray(faces).reshape(-1, 4)
+    if len(faces) == 0:
+        return None
+    areas = faces[:, 2].astype(np.int64) * faces[:, 3]
+    return tuple(int(v) for v in faces[int(np.argmax(areas))])
 
-        
-        # detect faces in the image
-        face = haar_cascade.detectMultiScale(image, scaleFactor=1.1, minNeighbors=5, minSize=(60, 60))
-        
-        # throw error if no face is detected
-        if len(face) == 0:
-            raise PreprocessingError("No face detected, please ensure you are facing the camera and face is unobstructed", "No face detected")
-        
-        # get the largest face in case multiple faces are detected
-        if len(face) > 1:
-            x, y, w, h = find_largest_face(face)
+# every detected face as an (N, 4) array, largest first, at most max_faces of them
+def sort_faces_by_area(faces, max_faces: int = MAX_FACES) -> np.ndarray:
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 4)
+    areas = faces[:, 2] * faces[:, 3]
+    # stable sort so equal areas keep the detector's order
+    order = np.argsort(-areas, kind="stable")[:max_faces]
+    return faces[order]
+
+# load the haarcascade for this thread once and reuse it for every image
+# worker pools call this as their thread initializer so scans never pay the load cost
+def load_face_detector() -> cv2.CascadeClassifier:
+    haar_cascade = getattr(_detectors, "haar_cascade", None)
+    if haar_cascade is not None:
+        return haar_cascade
+
+    path = HAAR_CASCADE_PATH
+    if not os.path.exists(path):
+        if "FER_HAAR_CASCADE_PATH" in os.environ:
+            # a path set on purpose that isn't there is a misconfiguration, don't hide it
+            raise PreprocessingError(generic_user_message, f"FER_HAAR_CASCADE_PATH {path} does not exist")
+        # fall back to the copy bundled with opencv
+        bundled = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        logger.warning("No haarcascade at %s, using the one bundled with OpenCV at %s", path, bundled)
+        path = bundled
+    haar_cascade = cv2.CascadeClassifier(path)
+
+    # check if haarcascade was loaded
+    if haar_cascade.empty():
+        raise PreprocessingError(generic_user_message, f"Failed to load haarcascade from {path}")
+
+    _detectors.haar_cascade = haar_cascade
+    return haar_cascade
+
+# detect faces, optionally on a copy downscaled by detect_scale, and return their boxes in image coordinates
+# max_face_size (optional) skips the larger scales, trackers use it to search only around the previous size
+def detect_faces(image: np.ndarray, detect_scale: float = 1.0, min_face_size: int = MIN_FACE_SIZE,
+                 max_face_size: Optional[int] = None) -> np.ndarray:
+    haar_cascade = load_face_detector()
+
+    if detect_scale > 1:
+        small_image = cv2.resize(image, None, fx=1 / detect_scale, fy=1 / detect_scale, interpolation=cv2.INTER_AREA)
+        min_side = max(HAAR_WINDOW_SIZE, int(round(min_face_size / detect_scale)))
+        max_size = (0, 0) if max_face_size is None else (int(max_face_size / detect_scale),) * 2
+        faces = haar_cascade.detectMultiScale(small_image, scaleFactor=1.1, minNeighbors=5,
+                                              minSize=(min_side, min_side), maxSize=max_size)
+        if len(faces) == 0:
+            return faces
+        # map the boxes back to the full frame
+        faces = np.round(np.asarray(faces, dtype=np.float64) * detect_scale).astype(np.int32)
+        height, width = image.shape[:2]
+        faces[:, 2] = np.minimum(faces[:, 2], width - faces[:, 0])
+        faces[:, 3] = np.minimum(faces[:, 3], height - faces[:, 1])
+        return faces
+
+    min_side = max(HAAR_WINDOW_SIZE, min_face_size)
+    max_size = (0, 0) if max_face_size is None else (max_face_size, max_face_size)
+    return haar_cascade.detectMultiScale(image, scaleFactor=1.1, minNeighbors=5,
+                                         minSize=(min_side, min_side), maxSize=max_size)
+
+# bounding box (x, y, w, h) of the face to use
+def locate_face(image: np.ndarray, detect_scale: float = 1.0, min_face_size: int = MIN_FACE_SIZE) -> tuple:
+    # detect faces in the image
+    face = detect_faces(image, detect_scale, min_face_size)
+
+    # throw error if no face is detected
+    if len(face) == 0:
+        raise PreprocessingError("No face detected, please ensure you are facing the camera and face is unobstructed", "No face detected")
+
+    # get the largest face in case multiple faces are detected
+    if len(face) > 1:
+        return find_largest_face(face)
+    return tuple(int(v) for v in face[0])
+
+# bounding boxes of every face, largest first, for multi-person frames
+def locate_all_faces(image: np.ndarray, detect_scale: float = 1.0, min_face_size: int = MIN_FACE_SIZE,
+                     max_faces: int = MAX_FACES) -> np.ndarray:
+    faces = detect_faces(image, detect_scale, min_face_size)
+
+    if len(faces) == 0:
+        raise PreprocessingError("No face detected, please ensure you are facing the camera and face is unobstructed", "No face detected")
+
+    return sort_faces_by_area(faces, max_faces)
+
+# a tracker (fer2013.tracking.FaceTracker) replaces the full-frame search for multi-frame streams
+def detect_and_crop_to_face(image: np.ndarray, detect_scale: float = 1.0, min_face_size: int = MIN_FACE_SIZE,
+                            tracker=None) -> np.ndarray:
+    try:
+        if tracker is not None:
+            x, y, w, h = tracker.locate(image)
         else:
-            x, y, w, h = face[0]
+            x, y, w, h = locate_face(image, detect_scale, min_face_size)
 
         # crop the image to the detected face
         cropped_face = image[y:y+h, x:x+w]
@@ -89,16 +221,67 @@ def resize(image: np.ndarray) -> np.ndarray:
     try:
         return cv2.resize(image, (48, 48), interpolation=cv2.INTER_AREA)
     except Exception as e:
-        print("Error in resizing image:", e)
+        logger.warning("Error in resizing image: %s", e)
         raise PreprocessingError(generic_user_message, f"Error in resizing image: {e}")
     
-# preprocessing pipeline
-def preprocess(base64_image: str) -> np.ndarray:
+# preprocessing pipeline for a base64 encoded image
+def preprocess(base64_image: str, decode_scale: int = DECODE_SCALE, detect_scale: float = DETECT_SCALE,
+               tracker=None) -> np.ndarray:
+    with decode_seconds.time():
+        np_image = b64_to_numpy(base64_image, decode_scale)
+    return preprocess_image(np_image, detect_scale, MIN_FACE_SIZE // decode_scale, tracker)
+
+# preprocessing pipeline for raw JPEG/PNG bytes
+def preprocess_bytes(image_bytes, decode_scale: int = DECODE_SCALE, detect_scale: float = DETECT_SCALE,
+                     tracker=None) -> np.ndarray:
+    with decode_seconds.time():
+        np_image = bytes_to_numpy(image_bytes, decode_scale)
+    return preprocess_image(np_image, detect_scale, MIN_FACE_SIZE // decode_scale, tracker)
+
+# all-faces pipeline for a base64 encoded image
+# returns the (N, 48, 48, 1) faces and their (N, 4) boxes in pixels of the original image
+def preprocess_all_faces(base64_image: str, decode_scale: int = DECODE_SCALE,
+                         detect_scale: float = DETECT_SCALE) -> tuple:
+    with decode_seconds.time():
+        np_image = b64_to_numpy(base64_image, decode_scale)
+    faces, boxes = preprocess_image_all_faces(np_image, detect_scale, MIN_FACE_SIZE // decode_scale)
+    return faces, boxes * decode_scale
+
+# all-faces pipeline for raw JPEG/PNG bytes
+def preprocess_bytes_all_faces(image_bytes, decode_scale: int = DECODE_SCALE,
+                               detect_scale: float = DETECT_SCALE) -> tuple:
+    with decode_seconds.time():
+        np_image = bytes_to_numpy(image_bytes, decode_scale)
+    faces, boxes = preprocess_image_all_faces(np_image, detect_scale, MIN_FACE_SIZE // decode_scale)
+    return faces, boxes * decode_scale
+
+# crop and resize every detected face into one stack, ready to go through the model as a single batch
+def preprocess_image_all_faces(np_image: np.ndarray, detect_scale: float = 1.0,
+                               min_face_size: int = MIN_FACE_SIZE, max_faces: int = MAX_FACES) -> tuple:
+    try:
+        with detect_seconds.time():
+            greyscale_image = greyscale(np_image)
+            boxes = locate_all_faces(greyscale_image, detect_scale, min_face_size, max_faces)
+        with resize_seconds.time():
+            faces = np.empty((len(boxes), 48, 48, 1), dtype=np.uint8)
+            for i, (x, y, w, h) in enumerate(boxes):
+                faces[i, :, :, 0] = resize(greyscale_image[y:y+h, x:x+w])
+        return faces, boxes
+    except PreprocessingError as e:
+        raise e
+    except Exception as e:
+        raise PreprocessingError(generic_user_message, f"Error in preprocessing image: {e}")
+
+# shared pipeline once the image is decoded
+# min_face_size is in pixels of np_image, so it shrinks with reduced decoding
+def preprocess_image(np_image: np.ndarray, detect_scale: float = 1.0, min_face_size: int = MIN_FACE_SIZE,
+                     tracker=None) -> np.ndarray:
     try: 
-        np_image = b64_to_numpy(base64_image)
-        greyscale_image = greyscale(np_image)
-        cropped_face = detect_and_crop_to_face(greyscale_image)
-        resized_image = resize(cropped_face)
+        with detect_seconds.time():
+            greyscale_image = greyscale(np_image)
+            cropped_face = detect_and_crop_to_face(greyscale_image, detect_scale, min_face_size, tracker)
+        with resize_seconds.time():
+            resized_image = resize(cropped_face)
         # add the channel dimension to match the model input shape
         preprocessed_image = np.expand_dims(resized_image, axis=-1)
         return preprocessed_image
@@ -0,0 +1,131 @@
+"""
+Post-training int8 quantization of the FER CNN.
+
+Calibrates on a sample of data/fer2013_test.csv, writes
+model/fer_emotion_model_int8.tflite and a JSON report next to it with the
+accuracy delta and speed-up against the float model. The service only loads
+the int8 model (FER_ENGINE=tflite_int8) when that report is within
+FER_INT8_MAX_ACCURACY_DROP.
+
+Run from the api/ folder:
+    python -m fer2013.quantize --calibration-samples 500
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from .backends import (FER_INT8_MAX_ACCURACY_DROP, MODEL_PATHS, KerasBackend, TFLiteBackend,
+                       quantization_report_path)
+from .dataset import load_samples
+
+
+def quantize_int8(keras_path: str, calibration_images: np.ndarray, output_path: str) -> str:
+    import tensorflow as tf
+    model = tf.keras.models.load_model(keras_path)
+
+    def representative_dataset():
+        for image in calibration_images:
+            yield [image[np.newaxis]]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    # integer-only kernels; input/output stay float so the serving code needs no changes
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+    return output_path
+
+
+def evaluate(predict, images: np.ndarray, labels: np.ndarray, batch_size: int = 64) -> float:
+    correct = 0
+    for start in range(0, len(images), batch_size):
+        probabilities = predict(images[start:start + batch_size])
+        correct += int(np.sum(np.argmax(probabilities, axis=1) == labels[start:start + batch_size]))
+    return correct / len(images)
+
+
+def measure_speed(predict, images: np.ndarray, batch_size: int, repeats: int = 20) -> dict:
+    batch = images[:batch_size]
+    predict(batch)  # warm-up, first call allocates tensors
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        predict(batch)
+        timings.append(time.perf_counter() - started)
+    latency = float(np.median(timings))
+    return {
+        "batch_size": len(batch),
+        "latency_ms": round(latency * 1000.0, 3),
+        "images_per_sec": round(len(batch) / latency, 1),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Quantize the FER model to int8 and report the accuracy delta")
+    parser.add_argument("--csv", default=None, help="dataset store or notebook CSV (default: data/fer2013_test store if built, else the CSV)")
+    parser.add_argument("--calibration-samples", type=int, default=500)
+    parser.add_argument("--eval-samples", type=int, default=None,
+                        help="images used for accuracy (default: every image not used for calibration)")
+    parser.add_argument("--output", default=MODEL_PATHS["tflite_int8"])
+    parser.add_argument("--max-accuracy-drop", type=float, default=FER_INT8_MAX_ACCURACY_DROP)
+    args = parser.parse_args(argv)
+
+    images, labels = load_samples(args.csv)
+    order = np.random.default_rng(0).permutation(len(images))
+    calibration_idx = order[:args.calibration_samples]
+    eval_idx = order[args.calibration_samples:]
+    if args.eval_samples is not None:
+        eval_idx = eval_idx[:args.eval_samples]
+    eval_images, eval_labels = images[eval_idx], labels[eval_idx]
+
+    print(f"Calibrating on {len(calibration_idx)} images...")
+    quantize_int8(MODEL_PATHS["keras"], images[calibration_idx], args.output)
+
+    float_model = KerasBackend(MODEL_PATHS["keras"])
+    int8_model = TFLiteBackend(args.output)
+
+    print(f"Evaluating on {len(eval_images)} images...")
+    float_accuracy = evaluate(float_model.predict, eval_images, eval_labels)
+    int8_accuracy = evaluate(int8_model.predict, eval_images, eval_labels)
+
+    speed = {}
+    for batch_size in (1, 64):
+        float_speed = measure_speed(float_model.predict, eval_images, batch_size)
+        int8_speed = measure_speed(int8_model.predict, eval_images, batch_size)
+        speed[f"batch_{batch_size}"] = {
+            "float": float_speed,
+            "int8": int8_speed,
+            "speedup": round(float_speed["latency_ms"] / int8_speed["latency_ms"], 2),
+        }
+
+    report = {
+        "model": args.output,
+        "calibration_samples": int(len(calibration_idx)),
+        "eval_samples": int(len(eval_images)),
+        "float_accuracy": round(float_accuracy, 5),
+        "int8_accuracy": round(int8_accuracy, 5),
+        # positive means the int8 model is less accurate
+        "accuracy_delta": round(float_accuracy - int8_accuracy, 5),
+        "speed": speed,
+    }
+    report_path = quantization_report_path(args.output)
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(report, indent=2))
+    print(f"Report written to {report_path}")
+
+    if report["accuracy_delta"] > args.max_accuracy_drop:
+        print(f"int8 accuracy drop {report['accuracy_delta']:.2%} exceeds {args.max_accuracy_drop:.2%}, "
+              "the service will refuse to load this model")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
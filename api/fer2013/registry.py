@@ -0,0 +1,180 @@
+"""
+Versioned store of FER models.
+
+Every version is a folder under FER_MODEL_REGISTRY holding the model file
+and a version.json (engine, file, created, notes). registry.json records the
+active version and the versions it replaced, most recent last, which is what
+rollback walks back through. When no version is active the service keeps
+loading the default model of FER_ENGINE, recorded in the history as the
+version "default" so the first promotion can be rolled back to it.
+
+Register a model from the api/ folder:
+    python -m fer2013.registry register fer2013/model/fer_emotion_model.h5 --engine keras --version 2024-06-01
+    python -m fer2013.registry list
+Promotion and rollback go through POST /admin/models/promote and /admin/models/rollback.
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+from typing import Optional
+
+import numpy as np
+
+from .backends import BACKENDS, MODEL_DIR, InferenceBackend, load_backend, quantization_report_path
+
+REGISTRY_DIR = os.getenv("FER_MODEL_REGISTRY", os.path.join(MODEL_DIR, "registry"))
+REGISTRY_FILE = "registry.json"
+VERSION_FILE = "version.json"
+# versions become folder names
+VERSION_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$")
+# the default model of FER_ENGINE, outside the registry; no registered version can take this name
+DEFAULT_VERSION = "default"
+
+
+class ModelVersionError(ValueError):
+    """Unknown or invalid model version"""
+
+
+def write_json(path: str, data: dict):
+    # write then rename, so a crash never leaves a half-written file behind
+    partial = path + ".partial"
+    with open(partial, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(partial, path)
+
+
+class ModelRegistry:
+    def __init__(self, root: str = REGISTRY_DIR):
+        self.root = root
+        self.lock = threading.Lock()
+
+    def _state(self) -> dict:
+        path = os.path.join(self.root, REGISTRY_FILE)
+        if not os.path.exists(path):
+            return {"active": None, "history": []}
+        with open(path) as f:
+            return json.load(f)
+
+    @property
+    def active(self) -> Optional[str]:
+        return self._state()["active"]
+
+    def modified(self) -> Optional[float]:
+        """mtime of registry.json, changes with every promotion or rollback"""
+        path = os.path.join(self.root, REGISTRY_FILE)
+        return os.path.getmtime(path) if os.path.exists(path) else None
+
+    def get(self, version: str) -> dict:
+        if not VERSION_PATTERN.match(version or ""):
+            raise ModelVersionError(f"Invalid model version '{version}'")
+        path = os.path.join(self.root, version, VERSION_FILE)
+        if not os.path.exists(path):
+            raise ModelVersionError(f"Unknown model version '{version}'")
+        with open(path) as f:
+            return json.load(f)
+
+    def versions(self) -> list:
+        if not os.path.isdir(self.root):
+            return []
+        state = self._state()
+        found = []
+        for name in sorted(os.listdir(self.root)):
+            if os.path.exists(os.path.join(self.root, name, VERSION_FILE)):
+                found.append({**self.get(name), "active": name == state["active"]})
+        return sorted(found, key=lambda meta: meta["created"])
+
+    def register(self, source_path: str, engine: str, version: Optional[str] = None, notes: str = "") -> dict:
+        """Copy a model file into the registry as a new, inactive version"""
+        if engine not in BACKENDS:
+            raise ModelVersionError(f"Unknown FER engine '{engine}', expected one of {sorted(BACKENDS)}")
+        if not os.path.exists(source_path):
+            raise FileNotFoundError(f"No model file at {source_path}")
+        created = datetime.datetime.now(datetime.timezone.utc)
+        version = version or created.strftime("%Y%m%d-%H%M%S")
+        if not VERSION_PATTERN.match(version) or version == DEFAULT_VERSION:
+            raise ModelVersionError(f"Invalid model version '{version}'")
+
+        folder = os.path.join(self.root, version)
+        with self.lock:
+            if os.path.exists(folder):
+                raise ModelVersionError(f"Model version '{version}' already exists")
+            os.makedirs(folder)
+            file_name = os.path.basename(source_path)
+            shutil.copy2(source_path, os.path.join(folder, file_name))
+            # the int8 engine only loads next to its quantization report
+            report = quantization_report_path(source_path)
+            if os.path.exists(report):
+                shutil.copy2(report, quantization_report_path(os.path.join(folder, file_name)))
+            meta = {
+                "version": version,
+                "engine": engine,
+                "file": file_name,
+                "created": created.isoformat(timespec="seconds"),
+                "notes": notes,
+            }
+            write_json(os.path.join(folder, VERSION_FILE), meta)
+        return meta
+
+    def load(self, version: str) -> InferenceBackend:
+        """Load a version and run one forward pass, so it is ready to serve the moment it is swapped in"""
+        if version == DEFAULT_VERSION:
+            backend = load_backend()
+        else:
+            meta = self.get(version)
+            backend = load_backend(meta["engine"], os.path.join(self.root, version, meta["file"]))
+        backend.predict(np.zeros((1, 48, 48, 1), dtype=np.float32))
+        return backend
+
+    def set_active(self, version: str, rollback: bool = False):
+        """Record version as active; a promotion remembers the one it replaced, a rollback forgets it"""
+        with self.lock:
+            state = self._state()
+            if rollback:
+                state["history"] = state["history"][:-1]
+            elif (state["active"] or DEFAULT_VERSION) != version:
+                state["history"].append(state["active"] or DEFAULT_VERSION)
+            state["active"] = version
+            os.makedirs(self.root, exist_ok=True)
+            write_json(os.path.join(self.root, REGISTRY_FILE), state)
+
+    def previous(self) -> Optional[str]:
+        history = self._state()["history"]
+        return history[-1] if history else None
+
+
+registry = ModelRegistry()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Manage versions in the FER model registry")
+    commands = parser.add_subparsers(dest="command", required=True)
+    register = commands.add_parser("register", help="add a model file as a new version")
+    register.add_argument("path")
+    register.add_argument("--engine", required=True, choices=sorted(BACKENDS))
+    register.add_argument("--version", help="version name (default: UTC timestamp)")
+    register.add_argument("--notes", default="")
+    commands.add_parser("list", help="show every version, * marks the active one")
+    args = parser.parse_args(argv)
+
+    if args.command == "register":
+        try:
+            meta = registry.register(args.path, args.engine, args.version, args.notes)
+        except (ModelVersionError, FileNotFoundError) as e:
+            print(e)
+            return 1
+        print(f"Registered {meta['version']} ({meta['engine']}), promote it with POST /admin/models/promote")
+        return 0
+
+    for meta in registry.versions():
+        marker = "*" if meta["active"] else " "
+        print(f"{marker} {meta['version']:<24} {meta['engine']:<12} {meta['created']}  {meta['notes']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
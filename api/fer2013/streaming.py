@@ -0,0 +1,95 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+import numpy as np
+
+from .predict import emotion_labels
+from .preprocessingImage import DECODE_SCALE, MIN_FACE_SIZE
+from .tracking import FaceTracker
+
+# Weight of the newest frame in the exponentially smoothed emotion (0 < alpha <= 1)
+STREAM_SMOOTHING = float(os.getenv("FER_STREAM_SMOOTHING", "0.3"))
+
+
+class StreamClosed(Exception):
+    """Raised by LatestFrameSlot.get once the client has gone and no frame is left"""
+
+
+class LatestFrameSlot:
+    """
+    Holds only the newest frame a client sent. If inference falls behind, a new
+    frame replaces the one still waiting, so the server always works on the most
+    recent picture and latency stays bounded instead of growing with a queue.
+    """
+
+    def __init__(self):
+        self._frame = None
+        self._event = asyncio.Event()
+        self.closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, payload):
+        self.received += 1
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = (self.received, payload, time.perf_counter())
+        self._event.set()
+
+    def close(self):
+        self.closed = True
+        self._event.set()
+
+    async def get(self) -> tuple:
+        """Wait for the next frame, returns (frame number, payload, perf_counter when received)"""
+        while self._frame is None:
+            if self.closed:
+                raise StreamClosed()
+            self._event.clear()
+            await self._event.wait()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+class EmotionSmoother:
+    """Exponential moving average of the per-frame probability vectors"""
+
+    def __init__(self, alpha: float = STREAM_SMOOTHING):
+        self.alpha = min(max(alpha, 0.01), 1.0)
+        self.probabilities: Optional[np.ndarray] = None
+
+    def update(self, probabilities: np.ndarray) -> np.ndarray:
+        if self.probabilities is None:
+            self.probabilities = np.asarray(probabilities, dtype=np.float64).copy()
+        else:
+            self.probabilities += self.alpha * (probabilities - self.probabilities)
+        return self.probabilities
+
+    def to_dict(self) -> dict:
+        return {
+            "emotion": emotion_labels[int(np.argmax(self.probabilities))],
+            "probabilities": {label: round(float(p), 5) for label, p in zip(emotion_labels, self.probabilities)},
+        }
+
+
+class FrameStream:
+    """Per-connection state of /facial_emotion/stream, reused for every frame of that connection"""
+
+    def __init__(self, alpha: float = STREAM_SMOOTHING):
+        self.frames = LatestFrameSlot()
+        self.smoother = EmotionSmoother(alpha)
+        # frames are preprocessed one at a time per connection, so the tracker is never shared
+        self.tracker = FaceTracker(min_face_size=MIN_FACE_SIZE // DECODE_SCALE)
+        self.processed = 0
+        self.failed = 0
+
+    def stats(self) -> dict:
+        return {
+            "received": self.frames.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.frames.dropped,
+            **self.tracker.stats(),
+        }
@@ -0,0 +1,115 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+from .preprocessingImage import MIN_FACE_SIZE, DETECT_SCALE, detect_faces, locate_face
+
+# Tracker settings for multi-frame modes, override with environment variables
+# force a full-frame detection at least this often (in frames)
+TRACK_REDETECT_EVERY = int(os.getenv("FER_TRACK_REDETECT_EVERY", "15"))
+# the ROI is the previous box grown by this fraction of its size on every side
+TRACK_PADDING = float(os.getenv("FER_TRACK_PADDING", "0.5"))
+# below this overlap with the previous box the track is considered lost
+TRACK_MIN_IOU = float(os.getenv("FER_TRACK_MIN_IOU", "0.3"))
+# the face may shrink / grow this much between frames
+TRACK_SCALE_RANGE = (0.7, 1.4)
+
+
+def box_iou(boxes: np.ndarray, box: np.ndarray) -> np.ndarray:
+    """Intersection over union of every (x, y, w, h) row of boxes with one box"""
+    x1 = np.maximum(boxes[:, 0], box[0])
+    y1 = np.maximum(boxes[:, 1], box[1])
+    x2 = np.minimum(boxes[:, 0] + boxes[:, 2], box[0] + box[2])
+    y2 = np.minimum(boxes[:, 1] + boxes[:, 3], box[1] + box[3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    union = boxes[:, 2] * boxes[:, 3] + box[2] * box[3] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1), 0.0)
+
+
+class FaceTracker:
+    """
+    Follows one face across consecutive frames of a stream.
+
+    After a full-frame detection, the next frames only run the cascade on a padded
+    region around the previous box and only at scales close to the previous size.
+    It falls back to a full-frame detection when the face isn't found there, when
+    the new box overlaps the old one less than min_iou (tracking confidence), and
+    every redetect_every frames. One tracker belongs to one stream and is not
+    meant to be shared between threads.
+    """
+
+    def __init__(self, redetect_every: int = TRACK_REDETECT_EVERY, padding: float = TRACK_PADDING,
+                 min_iou: float = TRACK_MIN_IOU, detect_scale: float = DETECT_SCALE,
+                 min_face_size: int = MIN_FACE_SIZE):
+        self.redetect_every = max(1, redetect_every)
+        self.padding = padding
+        self.min_iou = min_iou
+        self.detect_scale = detect_scale
+        self.min_face_size = min_face_size
+        self.box: Optional[np.ndarray] = None
+        self.frames_since_detection = 0
+        self.full_detections = 0
+        self.tracked_frames = 0
+        self.lost = 0
+
+    def reset(self):
+        self.box = None
+        self.frames_since_detection = 0
+
+    def _full_detection(self, image: np.ndarray) -> tuple:
+        self.full_detections += 1
+        self.frames_since_detection = 0
+        try:
+            box = locate_face(image, self.detect_scale, self.min_face_size)
+        except Exception:
+            self.box = None
+            raise
+        self.box = np.asarray(box, dtype=np.int64)
+        return tuple(int(v) for v in self.box)
+
+    def _track(self, image: np.ndarray) -> Optional[np.ndarray]:
+        x, y, w, h = self.box
+        height, width = image.shape[:2]
+        pad_x, pad_y = int(w * self.padding), int(h * self.padding)
+        x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+        x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+
+        side = max(w, h)
+        min_side = int(side * TRACK_SCALE_RANGE[0])
+        max_side = min(int(side * TRACK_SCALE_RANGE[1]), x1 - x0, y1 - y0)
+        if max_side < min_side:
+            return None
+        faces = detect_faces(image[y0:y1, x0:x1], 1.0, min_side, max_side)
+        if len(faces) == 0:
+            return None
+
+        # back to frame coordinates, keep the candidate that best continues the track
+        faces = np.asarray(faces, dtype=np.int64) + np.array([x0, y0, 0, 0])
+        overlaps = box_iou(faces, self.box)
+        best = int(np.argmax(overlaps))
+        if overlaps[best] < self.min_iou:
+            return None
+        return faces[best]
+
+    def locate(self, image: np.ndarray) -> tuple:
+        """Face box (x, y, w, h) in this frame, raises PreprocessingError if no face is found"""
+        if self.box is None or self.frames_since_detection >= self.redetect_every:
+            return self._full_detection(image)
+
+        box = self._track(image)
+        if box is None:
+            self.lost += 1
+            return self._full_detection(image)
+
+        self.box = box
+        self.frames_since_detection += 1
+        self.tracked_frames += 1
+        return tuple(int(v) for v in box)
+
+    def stats(self) -> dict:
+        return {
+            "full_detections": self.full_detections,
+            "tracked_frames": self.tracked_frames,
+            "lost": self.lost,
+        }
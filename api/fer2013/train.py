@@ -0,0 +1,169 @@
+"""
+Train the FER CNN from the FER2013 image folders with a tf.data pipeline.
+
+Replaces the notebook's training cells, which build float64 NumPy arrays of
+the whole dataset in memory before model.fit. Here the PNGs under
+data/train/<emotion>/ are decoded in parallel, cached as uint8 after the
+first epoch, shuffled, batched, augmented on the fly and prefetched, so the
+GPU/CPU never waits on input and memory stays around the size of the raw
+pixels. The architecture and the saved .h5 are the ones fer2013/predict.py
+loads (input (48, 48, 1) in [0,1], 7-way softmax in emotion_labels order).
+
+Run from the api/ folder:
+    python -m fer2013.train --epochs 60 --output fer2013/model/fer_emotion_model.h5
+--no-augment trains on the images as they are, like the notebook did.
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+
+from .backends import MODEL_PATHS
+from .build_dataset import folder_files
+from .dataset import DATA_DIR, IMAGE_SIZE
+from .predict import emotion_labels
+
+
+def list_images(folder: str) -> tuple:
+    """Paths and label indexes of every image under folder/<emotion>/"""
+    files = folder_files(folder)
+    return [path for path, _ in files], [label for _, label in files]
+
+
+def build_augmentation():
+    import tensorflow as tf
+    return tf.keras.Sequential([
+        tf.keras.layers.RandomFlip("horizontal"),
+        tf.keras.layers.RandomRotation(0.05),
+        tf.keras.layers.RandomTranslation(0.1, 0.1),
+        tf.keras.layers.RandomZoom(0.1),
+    ], name="augmentation")
+
+
+def make_dataset(paths: list, labels: list, batch_size: int, training: bool, augment: bool, seed: int,
+                 cache: str = ""):
+    """
+    tf.data pipeline: parallel decode -> cache (uint8) -> shuffle -> batch -> normalise -> augment -> prefetch.
+    cache="" keeps the decoded images in memory, a file path caches them on disk instead.
+    """
+    import tensorflow as tf
+    autotune = tf.data.AUTOTUNE
+
+    def decode(path, label):
+        image = tf.io.decode_image(tf.io.read_file(path), channels=1, expand_animations=False)
+        image = tf.image.resize(image, (IMAGE_SIZE, IMAGE_SIZE), method="area")
+        return tf.cast(tf.round(image), tf.uint8), label
+
+    dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+    dataset = dataset.map(decode, num_parallel_calls=autotune, deterministic=not training)
+    dataset = dataset.cache(cache)
+    if training:
+        dataset = dataset.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+
+    # the same scaling the service applies before predict
+    dataset = dataset.map(lambda images, y: (tf.cast(images, tf.float32) / 255.0, y), num_parallel_calls=autotune)
+    if training and augment:
+        augmentation = build_augmentation()
+        dataset = dataset.map(lambda images, y: (augmentation(images, training=True), y),
+                              num_parallel_calls=autotune)
+    return dataset.prefetch(autotune)
+
+
+def build_model():
+    """The CNN from fer2013-model.ipynb"""
+    import tensorflow as tf
+    layers = tf.keras.layers
+    model = tf.keras.Sequential([
+        tf.keras.Input(shape=(IMAGE_SIZE, IMAGE_SIZE, 1)),
+        layers.Conv2D(64, (3, 3), activation="relu"),
+        layers.MaxPooling2D((2, 2)),
+        layers.Conv2D(128, (3, 3), activation="relu"),
+        layers.MaxPooling2D((2, 2)),
+        layers.Conv2D(256, (3, 3), activation="relu"),
+        layers.MaxPooling2D((2, 2)),
+        layers.Flatten(),
+        layers.Dense(512, activation="relu"),
+        layers.Dropout(0.5),
+        layers.Dense(len(emotion_labels), activation="softmax"),
+    ])
+    model.compile(optimizer="adam", loss="sparse_categorical_crossentropy", metrics=["accuracy"])
+    return model
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0), 1)
+
+
+def epoch_timer():
+    import tensorflow as tf
+
+    class EpochTimer(tf.keras.callbacks.Callback):
+        def on_epoch_begin(self, epoch, logs=None):
+            self.started = time.perf_counter()
+
+        def on_epoch_end(self, epoch, logs=None):
+            print(f"epoch {epoch + 1}: {time.perf_counter() - self.started:.1f}s, peak RSS {peak_rss_mb():.0f} MB")
+
+    return EpochTimer()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Train the FER model with a tf.data input pipeline")
+    parser.add_argument("--train-dir", default=os.path.join(DATA_DIR, "train"))
+    parser.add_argument("--test-dir", default=os.path.join(DATA_DIR, "test"),
+                        help="evaluated after training when it exists")
+    parser.add_argument("--output", default=MODEL_PATHS["keras"])
+    parser.add_argument("--epochs", type=int, default=60)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--validation-split", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-augment", action="store_true", help="train without on-the-fly augmentation")
+    parser.add_argument("--cache-file", default="", help="cache decoded images on disk instead of in memory")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.train_dir):
+        print(f"No training images at {args.train_dir}, download FER2013 as in fer2013-model.ipynb")
+        return 1
+
+    import numpy as np
+    import tensorflow as tf
+    # same seed, same split, same shuffles and augmentations
+    tf.keras.utils.set_random_seed(args.seed)
+
+    paths, labels = list_images(args.train_dir)
+    order = np.random.default_rng(args.seed).permutation(len(paths))
+    cut = int(round(len(paths) * (1.0 - args.validation_split)))
+    train_idx, val_idx = order[:cut], order[cut:]
+
+    train_cache = args.cache_file + ".train" if args.cache_file else ""
+    val_cache = args.cache_file + ".val" if args.cache_file else ""
+    train_data = make_dataset([paths[i] for i in train_idx], [labels[i] for i in train_idx], args.batch_size,
+                              training=True, augment=not args.no_augment, seed=args.seed, cache=train_cache)
+    val_data = make_dataset([paths[i] for i in val_idx], [labels[i] for i in val_idx], args.batch_size,
+                            training=False, augment=False, seed=args.seed, cache=val_cache)
+    print(f"{len(train_idx)} training images, {len(val_idx)} validation images")
+
+    model = build_model()
+    started = time.perf_counter()
+    model.fit(train_data, validation_data=val_data, epochs=args.epochs, callbacks=[epoch_timer()], verbose=2)
+    print(f"Trained in {time.perf_counter() - started:.0f}s, peak RSS {peak_rss_mb():.0f} MB")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    model.save(args.output)
+    print(f"Saved {args.output}")
+
+    if os.path.isdir(args.test_dir):
+        test_paths, test_labels = list_images(args.test_dir)
+        test_data = make_dataset(test_paths, test_labels, args.batch_size, training=False, augment=False,
+                                 seed=args.seed)
+        loss, accuracy = model.evaluate(test_data, verbose=0)
+        print(f"Test loss {loss:.5f}, test accuracy {accuracy:.2%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+# Worker pool settings, override with environment variables
+# cv2 and TensorFlow release the GIL, so threads give real parallelism here
+FER_WORKERS = int(os.getenv("FER_WORKERS", str(min(4, os.cpu_count() or 1))))
+# requests allowed in the pipeline at once (running + waiting), extra ones get a 503
+FER_MAX_INFLIGHT = int(os.getenv("FER_MAX_INFLIGHT", "32"))
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturatedError(Exception):
+    """Raised when the worker pool has no room for another request"""
+
+
+class WorkerPool:
+    """
+    Bounded thread pool for the CPU-bound FER stages.
+
+    admit() reserves a slot for the whole lifetime of a request and fails fast
+    once max_inflight requests are already in the pipeline, so work never
+    queues without limit. It must be used from the event loop thread only.
+    """
+
+    def __init__(self, max_workers: int = FER_WORKERS, max_inflight: int = FER_MAX_INFLIGHT,
+                 initializer: Optional[Callable] = None):
+        self.max_workers = max(1, max_workers)
+        self.max_inflight = max(1, max_inflight)
+        self.initializer = initializer
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                           thread_name_prefix="fer-worker",
+                                           initializer=self._init_thread)
+        self.inflight = 0
+        self.rejected = 0
+
+    def _init_thread(self):
+        # an exception here would mark the whole executor as broken, so only report it;
+        # the task itself will hit the same error and surface it to the caller
+        if self.initializer is None:
+            return
+        try:
+            self.initializer()
+        except Exception as e:
+            logger.error("Worker initializer failed: %s", e)
+
+    @contextmanager
+    def admit(self, slots: int = 1):
+        """Reserve one slot per image the request will put on the pool"""
+        # a request larger than the whole limit is admitted only when the pipeline is empty
+        slots = min(max(1, slots), self.max_inflight)
+        if self.inflight + slots > self.max_inflight:
+            self.rejected += 1
+            raise PoolSaturatedError(f"{self.inflight} requests already in flight")
+        self.inflight += slots
+        try:
+            yield
+        finally:
+            self.inflight -= slots
+
+    async def run(self, fn: Callable, *args):
+        """Run fn(*args) on a worker thread without blocking the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def warm_up(self, timeout: float = 10.0):
+        """Start every worker thread now so per-thread initializers run at startup, not on a scan"""
+        barrier = threading.Barrier(self.max_workers)
+
+        def wait():
+            try:
+                barrier.wait(timeout)
+            except threading.BrokenBarrierError:
+                pass
+
+        # each task blocks until all are running, which forces the executor to spawn every thread
+        for future in [self.executor.submit(wait) for _ in range(self.max_workers)]:
+            future.result()
+
+    def snapshot(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "max_inflight": self.max_inflight,
+            "inflight": self.inflight,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,134 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+# Structured logging for the API. Records are handed to a bounded queue and written to stdout by a
+# background thread, so a log call never waits on the terminal. Modules log with
+# logging.getLogger(__name__) and %-style arguments: a record below the logger's level is dropped by
+# the level check before anything is formatted.
+
+# root level, e.g. LOG_LEVEL=DEBUG
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# per-module levels, e.g. LOG_LEVELS=eegsensor=WARNING,sqlalchemy.engine=INFO
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# json (one object per line) or text
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# keep 1 in N records of high-rate loggers, e.g. LOG_SAMPLING=eegsensor.stream=100
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "eegsensor.stream=100")
+# records waiting to be written; when the writer falls behind further records are dropped, not waited on
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# attributes every LogRecord has, anything else came in through extra= and is a structured field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def parse_pairs(text: str) -> dict:
+    pairs = {}
+    for item in text.split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            pairs[name.strip()] = value.strip()
+    return pairs
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through the first record and then one in every `every`"""
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(1, every)
+        self.seen = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        with self.lock:
+            keep = self.seen % self.every == 0
+            self.seen += 1
+        if keep and self.every > 1:
+            record.sampled_every = self.every
+        return keep
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record and counts it"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # only merge the arguments here, the formatting to JSON / text happens on the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging():
+    """Install the queue handler on the root logger, safe to call more than once"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        if LOG_FORMAT == "json":
+            stream_handler.setFormatter(JsonFormatter())
+        else:
+            stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        root = logging.getLogger()
+        root.handlers = [DroppingQueueHandler(log_queue)]
+        root.setLevel(LOG_LEVEL)
+
+        for name, level in parse_pairs(LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level.upper())
+        for name, every in parse_pairs(LOG_SAMPLING).items():
+            logging.getLogger(name).addFilter(SamplingFilter(int(every)))
+
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+        _listener.start()
+        # flush what is still queued on shutdown
+        atexit.register(_listener.stop)
+
+
+def dropped_records() -> int:
+    handlers = [h for h in logging.getLogger().handlers if isinstance(h, DroppingQueueHandler)]
+    return sum(h.dropped for h in handlers)
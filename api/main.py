@@ -1,14 +1,59 @@
 #main.py
+import logging
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routes import users, moods, facial, chatbot
-from eegsensor import eegEmotiv
+from fastapi.responses import Response
+import metrics
+from startup import startup_timer
+from logsetup import setup_logging
+
+# Time each import so slow modules show up in the startup breakdown
+with startup_timer.phase("import routes.users"):
+    from routes import users
+with startup_timer.phase("import routes.moods"):
+    from routes import moods
+with startup_timer.phase("import routes.facial"):
+    from routes import facial
+with startup_timer.phase("import routes.chatbot"):
+    from routes import chatbot
+with startup_timer.phase("import routes.admin"):
+    from routes import admin
+with startup_timer.phase("import eegsensor"):
+    from eegsensor import eegEmotiv
 from db.database import Base, engine
 
-# Initialize the database
-Base.metadata.create_all(bind=engine)
+# before the app is created, so everything it logs goes through the log queue
+setup_logging()
+logger = logging.getLogger("main")
+
+# Heavy components load on first use. List them here to load them before serving instead,
+# e.g. WARM_UP=fer,eeg,chatbot
+WARM_UP = {name.strip() for name in os.getenv("WARM_UP", "").split(",") if name.strip()}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Initialize the database
+    with startup_timer.phase("create tables"):
+        Base.metadata.create_all(bind=engine)
+    # load the face detector on every FER worker thread before serving
+    with startup_timer.phase("fer warm-up"):
+        facial.warm_up(load_model="fer" in WARM_UP)
+    if "eeg" in WARM_UP:
+        with startup_timer.phase("eeg warm-up"):
+            eegEmotiv.get_eeg_subscriber()
+    if "chatbot" in WARM_UP:
+        with startup_timer.phase("chatbot warm-up"):
+            chatbot.get_gemini_model()
+    startup_timer.finish()
+    logger.info(startup_timer.summary(), extra={"startup": startup_timer.report()})
+    yield
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# per-route latency, in-flight requests and SQL usage for GET /metrics
+app.add_middleware(metrics.MetricsMiddleware, main_app=app)
 
 # CORS setup
 app.add_middleware(
@@ -24,7 +69,18 @@ app.include_router(eegEmotiv.router, prefix="/eeg", tags=["eeg"])
 app.include_router(chatbot.router, prefix="/chatbot", tags=["chatbot"])
 app.include_router(users.router, prefix="/users", tags=["users"])
 app.include_router(moods.router, prefix="/moods", tags=["moods"])
+app.include_router(admin.router, prefix="/admin", tags=["admin"])
 
 @app.get("/")
 def root():
     return {"message": "Unified Emotion API is running"}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus text format: HTTP, FER stages, EEG messages, Gemini and DB metrics"""
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/startup")
+def startup_breakdown():
+    """Where boot time went: import/startup phases and lazily initialised components"""
+    return startup_timer.report()
@@ -0,0 +1,302 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Prometheus-style metrics for every router, rendered in the text exposition format by GET /metrics.
+# Kept dependency-free: counters, gauges and histograms with labels, safe to update from any thread.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds, tuned for request and stage latencies from sub-millisecond to a slow Gemini reply
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(v) for v in values)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self) -> list:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _samples(self) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+                for key, child in list(self.children.items())]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def _samples(self) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+                for key, child in list(self.children.items())]
+
+
+class _HistogramValue:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self) -> list:
+        lines = []
+        for key, child in list(self.children.items()):
+            with child.lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="{}"'.format(_format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self.lock:
+            # modules imported twice (e.g. by a reloader) get the existing metric back
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+# HTTP, filled in by MetricsMiddleware
+http_requests = registry.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_request_seconds = registry.histogram("http_request_duration_seconds", "HTTP request latency",
+                                          ("method", "route"))
+http_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being handled", ("method", "route"))
+websocket_connections = registry.gauge("websocket_connections", "Open WebSocket connections", ("route",))
+
+# FER pipeline stages: decode, detect, resize, infer
+fer_stage_seconds = registry.histogram("fer_stage_duration_seconds", "Time spent in each FER pipeline stage",
+                                       ("stage",))
+
+# EEG, counted by AsyncCortex through its message_hook
+eeg_messages = registry.counter("eeg_messages_total", "Messages received from Cortex", ("kind",))
+eeg_stream_dropped = registry.counter("eeg_stream_dropped_frames_total",
+                                    "Band power frames dropped for /eeg/stream clients that fell behind")
+
+# Gemini
+gemini_seconds = registry.histogram("gemini_request_duration_seconds", "Gemini generate_content latency",
+                                    ("outcome",))
+
+# Database, from SQLAlchemy cursor events
+db_queries = registry.counter("db_queries_total", "SQL statements executed")
+db_query_seconds = registry.histogram("db_query_duration_seconds", "SQL statement latency")
+db_queries_per_request = registry.histogram("http_request_db_queries", "SQL statements per HTTP request",
+                                            ("route",), buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+db_seconds_per_request = registry.histogram("http_request_db_seconds", "Time spent in SQL per HTTP request",
+                                            ("route",))
+
+# [count, seconds] of the SQL run for the current request; the middleware sets a fresh list per request
+# and threadpool endpoints see the same list, since starlette copies the context into the worker thread
+_request_db_usage = contextvars.ContextVar("request_db_usage", default=None)
+
+
+def record_db_query(seconds: float):
+    db_queries.inc()
+    db_query_seconds.observe(seconds)
+    usage = _request_db_usage.get()
+    if usage is not None:
+        usage[0] += 1
+        usage[1] += seconds
+
+
+def instrument_engine(engine):
+    """Time every statement the SQLAlchemy engine runs"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        record_db_query(time.perf_counter() - started)
+
+
+def route_template(app, scope) -> str:
+    """Path template of the route that will handle scope, e.g. /users/{user_id}"""
+    from starlette.routing import Match
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    # unmatched paths are not labelled one by one, that would grow the series without bound
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight requests and SQL usage per route"""
+
+    def __init__(self, app, main_app=None):
+        self.app = app
+        self.main_app = main_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "websocket":
+            route = route_template(self.main_app, scope)
+            gauge = websocket_connections.labels(route)
+            gauge.inc()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                gauge.dec()
+            return
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(self.main_app, scope)
+        in_flight = http_in_flight.labels(method, route)
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        usage = [0, 0.0]
+        token = _request_db_usage.set(usage)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight.dec()
+            _request_db_usage.reset(token)
+            http_request_seconds.labels(method, route).observe(elapsed)
+            http_requests.labels(method, route, status["code"]).inc()
+            db_queries_per_request.labels(route).observe(usage[0])
+            db_seconds_per_request.labels(route).observe(usage[1])
@@ -0,0 +1,70 @@
+import asyncio
+import hmac
+import logging
+import os
+from typing import Optional
+from fastapi import APIRouter, Header
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from fer2013 import predict
+from fer2013.registry import registry, ModelVersionError
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# admin endpoints are disabled unless a token is configured, callers send it as X-Admin-Token
+ADMIN_TOKEN = os.getenv("FER_ADMIN_TOKEN")
+
+class PromoteRequest(BaseModel):
+    version: str
+
+def check_token(token: Optional[str]) -> Optional[JSONResponse]:
+    if not ADMIN_TOKEN:
+        return JSONResponse(status_code=403, content={"error": "Model admin is disabled, set FER_ADMIN_TOKEN."})
+    # constant time, str compare_digest only takes ASCII
+    if not hmac.compare_digest((token or "").encode(), ADMIN_TOKEN.encode()):
+        return JSONResponse(status_code=401, content={"error": "Invalid admin token."})
+    return None
+
+async def swap(version: Optional[str] = None, rollback: bool = False):
+    try:
+        # loading and warming up the new version runs in a thread, requests keep being served meanwhile
+        version = await asyncio.get_running_loop().run_in_executor(None, predict.swap_model, version, rollback)
+    except ModelVersionError as e:
+        return JSONResponse(status_code=404 if not rollback else 409, content={"error": str(e)})
+    except Exception as e:
+        logger.exception("Error swapping FER model")
+        return JSONResponse(status_code=500, content={"error": f"Could not load model version: {e}"})
+
+    # the result cache starts over by itself once facial requests see the new version
+    return {"active": version, "previous": registry.previous()}
+
+@router.get("/models")
+def list_models(x_admin_token: Optional[str] = Header(None)):
+    """Registered FER model versions and the one currently serving"""
+    denied = check_token(x_admin_token)
+    if denied:
+        return denied
+    return {
+        "serving": predict.model_version,
+        "active": registry.active,
+        "previous": registry.previous(),
+        "versions": registry.versions(),
+    }
+
+@router.post("/models/promote")
+async def promote_model(request: PromoteRequest, x_admin_token: Optional[str] = Header(None)):
+    """Load and warm up a registered version in the background, then swap it in atomically"""
+    denied = check_token(x_admin_token)
+    if denied:
+        return denied
+    return await swap(request.version)
+
+@router.post("/models/rollback")
+async def rollback_model(x_admin_token: Optional[str] = Header(None)):
+    """Swap back to the version the active one replaced"""
+    denied = check_token(x_admin_token)
+    if denied:
+        return denied
+    return await swap(rollback=True)
@@ -1,7 +1,9 @@
+import logging
 from fastapi import APIRouter, HTTPException, Request, Depends
 from pydantic import BaseModel
 from typing import Optional, List
-import google.generativeai as genai
+import threading
+import time
 from sqlalchemy.orm import Session
 from routes.moods import COMBINED_MOOD_TAG, EEG_EMOTIONAL_STATE_MAPPING
 from db.database import get_db
@@ -9,11 +11,26 @@ from db.models import ChatMessage, SenderEnum, User
 from db import schemas
 from datetime import datetime,timezone
 from dotenv import load_dotenv
+from startup import startup_timer
+from metrics import gemini_seconds
 
 load_dotenv()
 
-genai.configure(api_key="YOUR_GEMINI_API_KEY")
-model = genai.GenerativeModel("models/gemini-1.5-flash")
+logger = logging.getLogger(__name__)
+
+# Gemini is configured on the first chat message (or by the startup warm-up)
+model = None
+model_lock = threading.Lock()
+
+def get_gemini_model():
+    global model
+    with model_lock:
+        if model is None:
+            with startup_timer.phase("gemini client", lazy=True):
+                import google.generativeai as genai
+                genai.configure(api_key="YOUR_GEMINI_API_KEY")
+                model = genai.GenerativeModel("models/gemini-1.5-flash")
+    return model
 
 router = APIRouter()
 
@@ -41,7 +58,8 @@ session_history = {}
 @router.post("/send", response_model=schemas.ChatbotMessageResponse)
 async def chatbot_send(input: schemas.ChatbotInput, db: Session = Depends(get_db)):
     try:
-        print("✅ Received from frontend:", input.dict())
+        # message text stays out of the logs
+        logger.debug("Chat message received", extra={"user": input.user_id, "length": len(input.message)})
         
         # ✅ Convert username to user ID
         user = db.query(User).filter(User.username == input.user_id).first()
@@ -71,7 +89,13 @@ async def chatbot_send(input: schemas.ChatbotInput, db: Session = Depends(get_db
         full_prompt += f"user: {message}\nbot:"
 
         # Get response from Gemini
-        response = model.generate_content(full_prompt)
+        started = time.perf_counter()
+        try:
+            response = get_gemini_model().generate_content(full_prompt)
+        except Exception:
+            gemini_seconds.labels("error").observe(time.perf_counter() - started)
+            raise
+        gemini_seconds.labels("ok").observe(time.perf_counter() - started)
         reply = response.text.strip()
 
         # Add to in-memory session
@@ -99,7 +123,7 @@ async def chatbot_send(input: schemas.ChatbotInput, db: Session = Depends(get_db
             db.commit()
             db.refresh(bot_entry)
             
-            print("✅ Successfully committed to DB for user:", input.user_id)
+            logger.debug("Chat messages saved", extra={"user": input.user_id})
             
             return schemas.ChatbotMessageResponse(
                 reply=reply,
@@ -109,7 +133,7 @@ async def chatbot_send(input: schemas.ChatbotInput, db: Session = Depends(get_db
             
         except Exception as db_error:
             db.rollback()
-            print("❌ Database error:", str(db_error))
+            logger.error("Database error saving chat messages: %s", db_error)
             return schemas.ChatbotMessageResponse(
                 reply=reply,
                 message_id=None,
@@ -117,7 +141,7 @@ async def chatbot_send(input: schemas.ChatbotInput, db: Session = Depends(get_db
             )
 
     except Exception as e:
-        print("❌ Error:", str(e))
+        logger.exception("Chatbot error")
         raise HTTPException(status_code=500, detail=f"Chatbot error: {str(e)}")
 
 # ✅ Updated endpoint: /chatbot/resume (CHATBOT_RESUME)
@@ -168,7 +192,7 @@ async def chatbot_new(input: schemas.NewSessionInput, db: Session = Depends(get_
         
         return {"message": "New conversation started.", "success": True}
     except Exception as e:
-        print("❌ Error starting new session:", str(e))
+        logger.error("Error starting new session: %s", e)
         return {"message": "New conversation started (in memory only).", "success": True}
 
 # ✅ New endpoint: /chatbot/messages (CHAT_MESSAGES)
@@ -222,7 +246,7 @@ def get_chatbot_history(user_id: str, db: Session = Depends(get_db)):
             for m in messages
         ]
     except Exception as e:
-        print("❌ Error getting chat history:", str(e))
+        logger.error("Error getting chat history: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to get chat history: {str(e)}")
 
 
@@ -234,18 +258,17 @@ async def create_mood_chat_message(
     """Save a mood-based chat message to database"""
     try:
         # Debug logging
-        print(f"Creating mood chat message for user_id: {message_data.user_id}")
+        logger.debug("Creating mood chat message for user_id %s", message_data.user_id)
         
         # Validate user exists
         user = db.query(schemas.User).filter(schemas.User.id == message_data.user_id).first()
         if not user:
-            print(f"User with ID {message_data.user_id} not found")
+            logger.info("User with ID %s not found", message_data.user_id)
             raise HTTPException(
                 status_code=404, 
                 detail=f"User with ID {message_data.user_id} not found"
             )
         
-        print(f"User found: {user.username}")
         
         # Create new chat message - sender is fixed as 'bot'
         new_message = schemas.ChatMessageMood(
@@ -258,7 +281,7 @@ async def create_mood_chat_message(
         db.commit()
         db.refresh(new_message)
         
-        print(f"Mood chat message created successfully with ID: {new_message.id}")
+        logger.debug("Mood chat message created with ID %s", new_message.id)
         return new_message
         
     except HTTPException as he:
@@ -268,7 +291,7 @@ async def create_mood_chat_message(
     except Exception as e:
         # Handle unexpected errors
         db.rollback()
-        print(f"Unexpected error saving mood chat message: {str(e)}")
+        logger.exception("Unexpected error saving mood chat message")
         raise HTTPException(
             status_code=500, 
             detail=f"Internal server error: Unable to save mood chat message"
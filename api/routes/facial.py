@@ -1,12 +1,56 @@
-from fastapi import APIRouter
+import asyncio
+import functools
+import json
+import logging
+import os
+import time
+from typing import List
+from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import numpy as np
 
-from fer2013.predict import load_model_and_predict
-from fer2013.preprocessingImage import preprocess, PreprocessingError
+from fer2013 import predict
+from fer2013.predict import get_model, predict_batch, to_predictions
+from fer2013.preprocessingImage import (preprocess, preprocess_bytes, preprocess_all_faces, preprocess_bytes_all_faces,
+                                        load_face_detector, PreprocessingError)
+from fer2013.batching import BatchScheduler
+from fer2013.workers import WorkerPool, PoolSaturatedError
+from fer2013.streaming import FrameStream, StreamClosed, STREAM_SMOOTHING
+from fer2013.cache import ResultCache, face_hash
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# largest raw image accepted by /upload
+MAX_UPLOAD_BYTES = int(os.getenv("FER_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# most images accepted by one /batch request
+MAX_BATCH_IMAGES = int(os.getenv("FER_MAX_BATCH_IMAGES", "64"))
+
+# concurrent requests share one forward pass through the model
+batch_scheduler = BatchScheduler(predict_batch)
+# decode, face detection and resize run here instead of on the event loop
+# every worker thread loads its own haarcascade once when it starts
+worker_pool = WorkerPool(initializer=load_face_detector)
+# retries and double taps resend the same face, their results come from here
+result_cache = ResultCache()
+
+def warm_up(load_model: bool = False):
+    """Load the haarcascade on every worker thread before the first scan arrives"""
+    # fail loudly at startup if the configured cascade can't be loaded
+    load_face_detector()
+    worker_pool.warm_up()
+    if load_model:
+        # the first forward pass builds the graph / allocates tensors, do it before serving
+        get_model()
+        predict_batch(np.zeros((1, 48, 48, 1), dtype=np.float32))
+
+def busy_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"error": "The server is busy, please try again in a moment."},
+        headers={"Retry-After": "1"},
+    )
 
 @router.get("/")
 def root():
@@ -15,18 +59,281 @@ def root():
 class ImageRequest(BaseModel):
     image: str  # base64 encoded string
 
-@router.post("/")
-async def predict_emotion(request: ImageRequest):
+class BatchImageRequest(BaseModel):
+    images: List[str]  # base64 encoded strings
+
+def cache_version():
+    # cached results are only valid for the model that produced them: the cache starts over when
+    # this worker serves another version, and a result computed across a swap is not stored
+    version = predict.model_version
+    result_cache.reset(version)
+    return version
+
+# cache lookup for every face, then one forward pass over the misses
+# returns a list of (EmotionPrediction, cached) in the order of faces
+async def score_faces(faces: list) -> list:
+    version = cache_version()
+    scored = [None] * len(faces)
+    misses = []
+    miss_keys = []
+    for index, face in enumerate(faces):
+        face_key = face_hash(face) if result_cache.enabled else None
+        probabilities = result_cache.get(face_key) if face_key is not None else None
+        if probabilities is not None:
+            scored[index] = (to_predictions(probabilities, 0.0)[0], True)
+        else:
+            misses.append(index)
+            miss_keys.append(face_key)
+
+    if misses:
+        input_batch = np.stack([faces[index] for index in misses]).astype('float32') / 255.0
+        probabilities, inference_ms = await batch_scheduler.run_batch(input_batch)
+        for index, face_key, prediction in zip(misses, miss_keys, to_predictions(probabilities, inference_ms)):
+            if face_key is not None:
+                result_cache.put(face_key, prediction.probabilities, version)
+            scored[index] = (prediction, False)
+    return scored
+
+# all-faces mode: every face in the image is cropped and scored in the same forward pass
+async def run_all_faces_prediction(preprocess_fn, payload, detail: bool = False):
     try:
-        preprocessed_image = preprocess(request.image)
-        input_batch = np.expand_dims(preprocessed_image, axis=0).astype('float32') / 255.0
-        emotion = load_model_and_predict(input_batch)
+        with worker_pool.admit():
+            faces, boxes = await worker_pool.run(preprocess_fn, payload)
+            try:
+                scored = await score_faces(list(faces))
+            except Exception as e:
+                logger.error("Error during prediction: %s", e)
+                return JSONResponse(status_code=500, content={"error": "Prediction failed."})
 
-        if emotion == "error":
-            return JSONResponse(status_code=500, content={"error": "Prediction failed."})
+        results = []
+        for (x, y, w, h), (prediction, cached) in zip(boxes.tolist(), scored):
+            result = {"box": {"x": x, "y": y, "w": w, "h": h}}
+            if detail:
+                result.update(prediction.to_dict(), cached=cached)
+            else:
+                result["prediction"] = prediction.label
+            results.append(result)
+        return {"faces": results}
+    except PoolSaturatedError:
+        return busy_response()
+    except PreprocessingError as e:
+        return JSONResponse(status_code=400, content={"error": e.user_message})
+    except Exception:
+        logger.exception("Server error during prediction")
+        return JSONResponse(status_code=500, content={"error": "Server error during prediction"})
+
+# shared by every image endpoint: preprocess on the worker pool, then the micro-batched model
+# detail=True returns the full EmotionPrediction, otherwise the original {"prediction": label}
+async def run_prediction(preprocess_fn, payload, detail: bool = False):
+    try:
+        with worker_pool.admit():
+            preprocessed_image = await worker_pool.run(preprocess_fn, payload)
+            version = cache_version()
+            face_key = face_hash(preprocessed_image) if result_cache.enabled else None
+            probabilities = result_cache.get(face_key) if face_key is not None else None
+            cached = probabilities is not None
+            inference_ms = 0.0
+
+            if not cached:
+                input_image = preprocessed_image.astype('float32') / 255.0
+                try:
+                    probabilities, inference_ms = await batch_scheduler.submit(input_image)
+                except Exception as e:
+                    logger.error("Error during prediction: %s", e)
+                    return JSONResponse(status_code=500, content={"error": "Prediction failed."})
+                if face_key is not None:
+                    result_cache.put(face_key, probabilities, version)
 
-        return {"prediction": emotion}
+        prediction = to_predictions(probabilities, inference_ms)[0]
+        if detail:
+            return {**prediction.to_dict(), "cached": cached}
+        return {"prediction": prediction.label}
+    except PoolSaturatedError:
+        return busy_response()
     except PreprocessingError as e:
         return JSONResponse(status_code=400, content={"error": e.user_message})
-    except Exception as e:
+    except Exception:
+        logger.exception("Server error during prediction")
+        return JSONResponse(status_code=500, content={"error": "Server error during prediction"})
+
+@router.post("/")
+async def predict_emotion(request: ImageRequest, detail: bool = False, all_faces: bool = False):
+    """
+    Emotion of the largest face in the image. With ?all_faces=true every detected face
+    (largest first, up to FER_MAX_FACES) is scored and returned with its bounding box.
+    """
+    if all_faces:
+        return await run_all_faces_prediction(preprocess_all_faces, request.image, detail)
+    return await run_prediction(preprocess, request.image, detail)
+
+@router.post("/upload")
+async def predict_emotion_upload(request: Request, detail: bool = False, all_faces: bool = False):
+    """
+    Same as POST / but takes the raw JPEG/PNG instead of base64 JSON, either as the
+    request body (application/octet-stream, image/jpeg, image/png) or as the
+    'image' field of a multipart form.
+    """
+    # reject oversized bodies before reading them
+    try:
+        content_length = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "Invalid Content-Length header."})
+    if content_length > MAX_UPLOAD_BYTES:
+        return JSONResponse(status_code=413, content={"error": "Image is too large."})
+
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        try:
+            form = await request.form()
+        except AssertionError:
+            # starlette needs python-multipart to parse forms
+            return JSONResponse(status_code=415, content={"error": "Multipart uploads are not supported, send the raw image bytes."})
+        upload = form.get("image")
+        if upload is None or isinstance(upload, str):
+            return JSONResponse(status_code=400, content={"error": "Missing 'image' file field."})
+        image_bytes = await upload.read()
+    else:
+        image_bytes = await request.body()
+
+    if not image_bytes:
+        return JSONResponse(status_code=400, content={"error": "Empty image."})
+    if len(image_bytes) > MAX_UPLOAD_BYTES:
+        return JSONResponse(status_code=413, content={"error": "Image is too large."})
+
+    if all_faces:
+        return await run_all_faces_prediction(preprocess_bytes_all_faces, image_bytes, detail)
+    return await run_prediction(preprocess_bytes, image_bytes, detail)
+
+@router.post("/batch")
+async def predict_emotion_batch(request: BatchImageRequest):
+    """
+    Score many images in one call. Images are preprocessed in parallel and every
+    face goes through a single forward pass. Each result carries the full
+    probability vector, or the error for that image if preprocessing failed.
+    """
+    if not request.images:
+        return JSONResponse(status_code=400, content={"error": "No images given."})
+    if len(request.images) > MAX_BATCH_IMAGES:
+        return JSONResponse(status_code=413, content={"error": f"At most {MAX_BATCH_IMAGES} images per batch."})
+
+    try:
+        # one slot per image, so a batch counts against the in-flight limit like that many requests
+        with worker_pool.admit(len(request.images)):
+            preprocessed = await asyncio.gather(
+                *(worker_pool.run(preprocess, image) for image in request.images),
+                return_exceptions=True,
+            )
+
+            results = [None] * len(preprocessed)
+            faces = []
+            face_indexes = []
+            for index, item in enumerate(preprocessed):
+                if isinstance(item, PreprocessingError):
+                    results[index] = {"index": index, "error": item.user_message}
+                elif isinstance(item, Exception):
+                    results[index] = {"index": index, "error": "Server error during preprocessing"}
+                else:
+                    faces.append(item)
+                    face_indexes.append(index)
+
+            try:
+                scored = await score_faces(faces)
+            except Exception as e:
+                logger.error("Error during prediction: %s", e)
+                return JSONResponse(status_code=500, content={"error": "Prediction failed."})
+
+            for index, (prediction, cached) in zip(face_indexes, scored):
+                results[index] = {"index": index, **prediction.to_dict(), "cached": cached}
+
+        return {"results": results}
+    except PoolSaturatedError:
+        return busy_response()
+    except Exception:
+        logger.exception("Server error during batch prediction")
         return JSONResponse(status_code=500, content={"error": "Server error during prediction"})
+
+async def receive_frames(websocket: WebSocket, stream: FrameStream):
+    # binary messages are raw JPEG/PNG, text messages are base64 or {"image": base64}
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                stream.frames.put((preprocess_bytes, message["bytes"]))
+            elif message.get("text"):
+                text = message["text"]
+                if text.lstrip().startswith("{"):
+                    try:
+                        text = json.loads(text).get("image", "")
+                    except (ValueError, AttributeError):
+                        # a malformed frame is counted and skipped, the stream stays open
+                        stream.failed += 1
+                        continue
+                stream.frames.put((preprocess, text))
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: starlette refuses to receive once the socket is closed
+        pass
+    finally:
+        stream.frames.close()
+
+@router.websocket("/stream")
+async def stream_emotion(websocket: WebSocket, alpha: float = STREAM_SMOOTHING):
+    """
+    Live facial emotion over a stream of frames. Each processed frame gets its own
+    probabilities plus an exponentially smoothed emotion (alpha = weight of the newest
+    frame). Frames that arrive while the previous one is still being scored replace
+    each other, so the server always answers the most recent frame.
+    """
+    await websocket.accept()
+    stream = FrameStream(alpha)
+    receiver = asyncio.create_task(receive_frames(websocket, stream))
+
+    try:
+        while True:
+            frame_id, (preprocess_fn, payload), received_at = await stream.frames.get()
+            result = {"frame": frame_id}
+            try:
+                with worker_pool.admit():
+                    # the connection's tracker skips the full-frame face search on most frames
+                    preprocess_tracked = functools.partial(preprocess_fn, tracker=stream.tracker)
+                    preprocessed_image = await worker_pool.run(preprocess_tracked, payload)
+                    input_image = preprocessed_image.astype('float32') / 255.0
+                    probabilities, inference_ms = await batch_scheduler.submit(input_image)
+
+                prediction = to_predictions(probabilities, inference_ms)[0]
+                stream.smoother.update(prediction.probabilities)
+                stream.processed += 1
+                result.update(prediction.to_dict())
+                result["smoothed"] = stream.smoother.to_dict()
+            except PoolSaturatedError:
+                stream.failed += 1
+                result["error"] = "The server is busy, frame skipped."
+            except PreprocessingError as e:
+                stream.failed += 1
+                result["error"] = e.user_message
+            except Exception as e:
+                logger.error("Error during stream prediction: %s", e)
+                stream.failed += 1
+                result["error"] = "Server error during prediction"
+
+            result["latency_ms"] = round((time.perf_counter() - received_at) * 1000.0, 3)
+            result["stats"] = stream.stats()
+            await websocket.send_json(result)
+    except (StreamClosed, WebSocketDisconnect, RuntimeError):
+        # RuntimeError: starlette refuses to send once the socket is closed
+        pass
+    finally:
+        receiver.cancel()
+
+@router.get("/metrics")
+def batching_metrics():
+    """Micro-batching statistics, worker pool load and result cache hits"""
+    return {
+        "model_version": predict.model_version,
+        "window_ms": batch_scheduler.window * 1000.0,
+        "max_batch_size": batch_scheduler.max_batch_size,
+        **batch_scheduler.metrics.snapshot(),
+        "worker_pool": worker_pool.snapshot(),
+        "result_cache": result_cache.snapshot(),
+    }
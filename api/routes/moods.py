@@ -1,3 +1,4 @@
+import logging
 import uuid
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from pydantic import ValidationError
@@ -10,6 +11,7 @@ from db import models, schemas
 from db.database import get_db
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # Mood metadata - Updated to match your MoodEnum
 MOOD_DATA = {
@@ -707,21 +709,14 @@ async def analyze_mood(request: schemas.MoodAnalysisRequest):
 def add_mood_analysis(mood_data: schemas.MoodAnalysisCreate, db: Session = Depends(get_db)):  # ✅ Use MoodAnalysisCreate
     """Create a new mood analysis entry from scan results"""
     try:
-        # Debug: Print received data
-        print("=== RECEIVED REQUEST DEBUG ===")
-        print(f"Raw mood_data: {mood_data}")
-        print(f"user_id: {mood_data.user_id} (type: {type(mood_data.user_id)})")
-        print(f"mood_date: {mood_data.mood_date} (type: {type(mood_data.mood_date)})")
-        print("================================")
+        logger.debug("Mood result received", extra={"user": mood_data.user_id, "mood_date": mood_data.mood_date})
         
         # Validate that user exists
         user = db.query(models.User).filter(models.User.username == mood_data.user_id).first()
         if not user:
-            print(f"User '{mood_data.user_id}' not found in database")
+            logger.info("User '%s' not found in database", mood_data.user_id)
             raise HTTPException(status_code=404, detail=f"User '{mood_data.user_id}' not found")
         
-        print(f"User found: {user.username}")
-        
         # Check if entry already exists for this user and date
         existing_entry = db.query(models.MoodAnalysis).filter(
             and_(
@@ -731,7 +726,7 @@ def add_mood_analysis(mood_data: schemas.MoodAnalysisCreate, db: Session = Depen
         ).first()
         
         if existing_entry:
-            print(f"Updating existing entry with ID: {existing_entry.id}")
+            logger.debug("Updating existing entry with ID %s", existing_entry.id)
             # Update existing entry instead of creating duplicate
             existing_entry.mood = mood_data.mood
             existing_entry.combined_mood = mood_data.combined_mood
@@ -740,10 +735,8 @@ def add_mood_analysis(mood_data: schemas.MoodAnalysisCreate, db: Session = Depen
             
             db.commit()
             db.refresh(existing_entry)
-            print(f"Successfully updated entry: {existing_entry.id}")
             return existing_entry
         else:
-            print("Creating new mood analysis entry")
             # Create new entry
             new_mood = models.MoodAnalysis(
                 user_id=mood_data.user_id,
@@ -757,15 +750,13 @@ def add_mood_analysis(mood_data: schemas.MoodAnalysisCreate, db: Session = Depen
             db.add(new_mood)
             db.commit()
             db.refresh(new_mood)
-            print(f"Successfully created new entry: {new_mood.id}")
+            logger.debug("Created mood analysis entry %s", new_mood.id)
             return new_mood
         
     except HTTPException as he:
-        print(f"HTTP Exception: {he.detail}")
         db.rollback()
         raise he
     except Exception as e:
-        print(f"Database error: {str(e)}")
-        print(f"Error type: {type(e)}")
+        logger.exception("Database error creating mood analysis")
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error creating mood analysis: {str(e)}")
@@ -1,13 +1,16 @@
+import logging
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from db.database import get_db
 from db import models, schemas
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 @router.post("/signup", status_code=status.HTTP_201_CREATED)
 def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    print(user.dict())
+    # never log the whole payload, it carries the password
+    logger.debug("Signup request for %s", user.username)
     # Check if email or username already registered
     if db.query(models.User).filter(models.User.email == user.email).first():
         raise HTTPException(status_code=400, detail="Email already registered")
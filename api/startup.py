@@ -0,0 +1,46 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Records where API boot time goes: import and startup phases, plus components
+# that are initialised lazily on first use (FER model, Cortex client, Gemini).
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ready_after = None
+        self.phases = []
+        self.lazy = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str, lazy: bool = False):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = {"name": name, "seconds": round(time.perf_counter() - started, 4)}
+            with self.lock:
+                (self.lazy if lazy else self.phases).append(entry)
+
+    def finish(self):
+        """Mark the app as ready to serve"""
+        self.ready_after = round(time.perf_counter() - self.started, 4)
+
+    def report(self) -> dict:
+        with self.lock:
+            return {
+                "ready_after_seconds": self.ready_after,
+                "phases": list(self.phases),
+                "lazy_init": list(self.lazy),
+            }
+
+    def summary(self) -> str:
+        lines = [f"Startup finished in {self.ready_after}s"]
+        for entry in self.report()["phases"]:
+            lines.append(f"  {entry['name']:<28} {entry['seconds']:.4f}s")
+        return "\n".join(lines)
+
+
+startup_timer = StartupTimer()
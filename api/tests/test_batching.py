@@ -0,0 +1,86 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from fer2013.batching import BatchScheduler
+
+
+def image(value: float) -> np.ndarray:
+    return np.full((48, 48, 1), value, dtype=np.float32)
+
+
+class FakeModel:
+    """Returns the mean of every image as its 'prediction' and remembers the batch sizes"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.batch_sizes = []
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        self.batch_sizes.append(len(batch))
+        if self.fail:
+            raise RuntimeError("model failed")
+        return batch.reshape(len(batch), -1).mean(axis=1, keepdims=True)
+
+
+def test_concurrent_submits_share_one_batch():
+    model = FakeModel()
+    scheduler = BatchScheduler(model, window_ms=50, max_batch_size=8)
+
+    async def main():
+        return await asyncio.gather(*(scheduler.submit(image(i)) for i in range(5)))
+
+    results = asyncio.run(main())
+    assert model.batch_sizes == [5]
+    # every request gets its own row back
+    assert [float(prediction[0]) for prediction, _ in results] == [0, 1, 2, 3, 4]
+    snapshot = scheduler.metrics.snapshot()
+    assert snapshot["batches"] == 1 and snapshot["items"] == 5
+
+
+def test_batches_are_capped_at_max_batch_size():
+    model = FakeModel()
+    scheduler = BatchScheduler(model, window_ms=50, max_batch_size=4)
+
+    async def main():
+        return await asyncio.gather(*(scheduler.submit(image(i)) for i in range(10)))
+
+    asyncio.run(main())
+    assert model.batch_sizes == [4, 4, 2]
+
+
+def test_failed_batch_fails_every_request_and_keeps_serving():
+    model = FakeModel(fail=True)
+    scheduler = BatchScheduler(model, window_ms=20, max_batch_size=8)
+
+    async def main():
+        results = await asyncio.gather(*(scheduler.submit(image(i)) for i in range(3)), return_exceptions=True)
+        model.fail = False
+        # the worker survives the failure
+        recovered = await scheduler.submit(image(7))
+        return results, recovered
+
+    results, recovered = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert float(recovered[0][0]) == 7
+    assert scheduler.metrics.errors == 1
+
+
+def test_run_batch_records_no_queue_waits():
+    model = FakeModel()
+    scheduler = BatchScheduler(model)
+
+    predictions, _ = asyncio.run(scheduler.run_batch(np.stack([image(1), image(2)])))
+    assert predictions.ravel().tolist() == [1, 2]
+    snapshot = scheduler.metrics.snapshot()
+    assert snapshot["items"] == 2
+    assert snapshot["queue_wait_ms"]["max"] == 0.0
+    assert len(scheduler.metrics.queue_waits_ms) == 0
+
+
+def test_run_batch_counts_errors():
+    scheduler = BatchScheduler(FakeModel(fail=True))
+    with pytest.raises(RuntimeError):
+        asyncio.run(scheduler.run_batch(np.stack([image(1)])))
+    assert scheduler.metrics.errors == 1
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from eegsensor import broadcast
+from eegsensor.broadcast import Broadcaster, StreamClosed, Subscriber
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(broadcast.time, "monotonic", clock)
+    return clock
+
+
+def offer_every(subscriber: Subscriber, clock: Clock, frames: list, step: float):
+    for frame in frames:
+        subscriber.offer(frame)
+        clock.now += step
+
+
+def test_full_queue_drops_the_oldest_frame(clock):
+    subscriber = Subscriber(None, rate=10, queue_size=2)
+    offer_every(subscriber, clock, [1, 2, 3, 4], step=0.5)
+    assert list(subscriber.frames) == [3, 4]
+    assert subscriber.dropped == 2
+    assert subscriber.skipped == 0
+
+
+def test_frames_faster_than_the_rate_are_skipped(clock):
+    subscriber = Subscriber(None, rate=2, queue_size=16)
+    # 8 Hz frames to a 2 frames/s client: one in four gets through
+    offer_every(subscriber, clock, list(range(8)), step=0.125)
+    assert list(subscriber.frames) == [0, 4]
+    assert subscriber.skipped == 6
+
+
+def test_get_returns_frames_in_order_then_raises_once_closed(clock):
+    subscriber = Subscriber(None, rate=10, queue_size=4)
+    offer_every(subscriber, clock, ["a", "b"], step=1)
+    subscriber.close()
+
+    async def drain():
+        frames = [await subscriber.get(), await subscriber.get()]
+        with pytest.raises(StreamClosed):
+            await subscriber.get()
+        return frames
+
+    assert asyncio.run(drain()) == ["a", "b"]
+
+
+def test_publish_fans_out_to_every_subscriber():
+    broadcaster = Broadcaster()
+
+    async def main():
+        first = broadcaster.subscribe(rate=100)
+        second = broadcaster.subscribe(rate=100)
+        assert len(broadcaster) == 2
+        broadcaster.publish({"time": 1})
+        frames = await asyncio.wait_for(asyncio.gather(first.get(), second.get()), 1)
+        broadcaster.unsubscribe(first)
+        return frames, first
+
+    frames, first = asyncio.run(main())
+    assert frames == [{"time": 1}, {"time": 1}]
+    assert len(broadcaster) == 1
+    assert first.closed
+
+
+def test_publish_from_another_thread():
+    broadcaster = Broadcaster()
+
+    async def main():
+        subscriber = broadcaster.subscribe(rate=100)
+        await asyncio.get_running_loop().run_in_executor(None, broadcaster.publish, {"time": 2})
+        return await asyncio.wait_for(subscriber.get(), 1)
+
+    assert asyncio.run(main()) == {"time": 2}
+
+
+def test_subscribers_of_a_closed_loop_are_dropped():
+    broadcaster = Broadcaster()
+
+    async def main():
+        return broadcaster.subscribe(rate=100)
+
+    asyncio.run(main())
+    broadcaster.publish({"time": 3})
+    assert len(broadcaster) == 0
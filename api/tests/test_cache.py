@@ -0,0 +1,83 @@
+import numpy as np
+
+from fer2013 import cache
+from fer2013.cache import ENTRY_OVERHEAD_BYTES, ResultCache, face_hash
+
+PROBABILITIES = np.full(7, 1 / 7, dtype=np.float32)
+# bytes one entry of PROBABILITIES takes
+ENTRY_BYTES = PROBABILITIES.nbytes + ENTRY_OVERHEAD_BYTES
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    results = ResultCache(max_bytes=10 * ENTRY_BYTES, ttl_seconds=60, max_distance=0)
+    results.put(1, PROBABILITIES)
+
+    clock.now += 59
+    assert results.get(1) is not None
+    clock.now += 2
+    assert results.get(1) is None
+    assert results.snapshot()["entries"] == 0
+    assert results.bytes == 0
+
+
+def test_least_recently_used_is_evicted_over_max_bytes():
+    results = ResultCache(max_bytes=2 * ENTRY_BYTES, ttl_seconds=60, max_distance=0)
+    results.put(1, PROBABILITIES)
+    results.put(2, PROBABILITIES)
+    # reading 1 makes 2 the least recently used
+    assert results.get(1) is not None
+    results.put(3, PROBABILITIES)
+
+    assert results.get(2) is None
+    assert results.get(1) is not None and results.get(3) is not None
+    assert results.evictions == 1
+    assert results.bytes == 2 * ENTRY_BYTES
+
+
+def test_near_match_within_max_distance():
+    results = ResultCache(max_bytes=10 * ENTRY_BYTES, ttl_seconds=60, max_distance=2)
+    results.put(0b1111_0000, PROBABILITIES)
+
+    assert results.get(0b1111_0011) is not None
+    assert results.get(0b1111_0111) is None
+    snapshot = results.snapshot()
+    assert snapshot["hits"] == 1 and snapshot["near_hits"] == 1 and snapshot["misses"] == 1
+
+
+def test_results_of_another_model_version_are_dropped():
+    results = ResultCache(max_bytes=10 * ENTRY_BYTES, ttl_seconds=60, max_distance=0)
+    results.reset("v1")
+    results.put(1, PROBABILITIES, "v1")
+
+    results.reset("v2")
+    assert results.get(1) is None
+    # a batch that ran on v1 finishes after the swap
+    results.put(1, PROBABILITIES, "v1")
+    assert results.get(1) is None
+    results.put(1, PROBABILITIES, "v2")
+    assert results.get(1) is not None
+
+
+def test_disabled_cache_stores_nothing():
+    results = ResultCache(max_bytes=0)
+    results.put(1, PROBABILITIES)
+    assert results.get(1) is None
+    assert results.snapshot()["entries"] == 0
+
+
+def test_face_hash_is_stable_and_close_for_similar_faces():
+    rng = np.random.default_rng(0)
+    face = rng.random((48, 48, 1)).astype(np.float32)
+    assert face_hash(face) == face_hash(face.copy())
+    noisy = face + rng.normal(0, 0.001, face.shape).astype(np.float32)
+    assert bin(face_hash(face) ^ face_hash(noisy)).count("1") <= 4
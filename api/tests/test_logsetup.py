@@ -0,0 +1,59 @@
+import json
+import logging
+import queue
+import sys
+
+from logsetup import DroppingQueueHandler, JsonFormatter, SamplingFilter, parse_pairs
+
+
+def record(msg: str = "message %s", args: tuple = ("x",), **extra) -> logging.LogRecord:
+    log_record = logging.LogRecord("eegsensor.stream", logging.INFO, __file__, 1, msg, args, None)
+    log_record.__dict__.update(extra)
+    return log_record
+
+
+def test_sampling_keeps_the_first_and_one_in_every_n():
+    sampling = SamplingFilter(3)
+    kept = [index for index in range(7) if sampling.filter(record())]
+    assert kept == [0, 3, 6]
+
+
+def test_sampled_records_say_how_they_were_sampled():
+    log_record = record()
+    assert SamplingFilter(100).filter(log_record)
+    assert log_record.sampled_every == 100
+    unsampled = record()
+    assert SamplingFilter(1).filter(unsampled)
+    assert not hasattr(unsampled, "sampled_every")
+
+
+def test_full_queue_drops_and_counts_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+    for _ in range(5):
+        handler.handle(record())
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_records_are_queued_with_the_message_merged():
+    handler = DroppingQueueHandler(queue.Queue())
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        failing = record(exc_info=sys.exc_info())
+    handler.handle(failing)
+    queued = handler.queue.get_nowait()
+    assert queued.msg == "message x" and queued.args is None
+    assert "ValueError: boom" in queued.exc_text and queued.exc_info is None
+
+
+def test_json_formatter_keeps_extra_fields():
+    entry = json.loads(JsonFormatter().format(record(user_id="alice")))
+    assert entry["msg"] == "message x"
+    assert entry["logger"] == "eegsensor.stream"
+    assert entry["user_id"] == "alice"
+
+
+def test_parse_pairs():
+    assert parse_pairs("eegsensor=WARNING, sqlalchemy.engine=INFO,,bad") == {
+        "eegsensor": "WARNING", "sqlalchemy.engine": "INFO"}
@@ -0,0 +1,73 @@
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+
+import metrics
+from metrics import http_in_flight, http_requests, websocket_connections
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware, main_app=app)
+    seen = {}
+
+    @app.get("/test-items/{item_id}")
+    def get_item(item_id: int):
+        return {"item_id": item_id}
+
+    @app.get("/test-in-flight")
+    def in_flight_now():
+        seen["during"] = http_in_flight.labels("GET", "/test-in-flight").value
+        return {}
+
+    @app.websocket("/test-ws/{name}")
+    async def echo(websocket: WebSocket, name: str):
+        await websocket.accept()
+        seen["websocket"] = websocket_connections.labels("/test-ws/{name}").value
+        await websocket.send_text(name)
+        await websocket.close()
+
+    app.state.seen = seen
+    return app
+
+
+def count(method: str, route: str, status: int) -> float:
+    return http_requests.labels(method, route, status).value
+
+
+def test_requests_are_labelled_by_route_template():
+    client = TestClient(create_app())
+    before = count("GET", "/test-items/{item_id}", 200)
+    client.get("/test-items/1")
+    client.get("/test-items/2")
+    assert count("GET", "/test-items/{item_id}", 200) == before + 2
+    # one series per template, not per path
+    assert ("GET", "/test-items/1", "200") not in http_requests.children
+
+
+def test_unknown_paths_share_one_label():
+    client = TestClient(create_app())
+    before = count("GET", "unmatched", 404)
+    client.get("/no-such-path/1")
+    client.get("/no-such-path/2")
+    assert count("GET", "unmatched", 404) == before + 2
+
+
+def test_in_flight_counts_the_running_request():
+    app = create_app()
+    TestClient(app).get("/test-in-flight")
+    assert app.state.seen["during"] == 1
+    assert http_in_flight.labels("GET", "/test-in-flight").value == 0
+
+
+def test_websocket_connections_are_counted_while_open():
+    app = create_app()
+    with TestClient(app).websocket_connect("/test-ws/x") as websocket:
+        assert websocket.receive_text() == "x"
+    assert app.state.seen["websocket"] == 1
+    assert websocket_connections.labels("/test-ws/{name}").value == 0
+
+
+def test_render_includes_the_request_series():
+    TestClient(create_app()).get("/test-items/3")
+    text = metrics.registry.render()
+    assert 'http_requests_total{method="GET",route="/test-items/{item_id}",status="200"}' in text
@@ -0,0 +1,100 @@
+import pytest
+
+from fer2013 import predict
+from fer2013.registry import DEFAULT_VERSION, ModelRegistry, ModelVersionError
+
+
+class FakeBackend:
+    def __init__(self, version: str):
+        self.name = "fake"
+        self.path = version
+
+
+@pytest.fixture
+def registry(tmp_path):
+    model_file = tmp_path / "model.onnx"
+    model_file.write_bytes(b"model")
+    store = ModelRegistry(str(tmp_path / "registry"))
+    for version in ("v1", "v2", "v3"):
+        store.register(str(model_file), "onnx", version)
+    return store
+
+
+@pytest.fixture
+def serving(registry, monkeypatch):
+    """predict serving from the test registry, loading fake backends"""
+    monkeypatch.setattr(registry, "load", FakeBackend)
+    monkeypatch.setattr(predict, "registry", registry)
+    monkeypatch.setattr(predict, "model", None)
+    monkeypatch.setattr(predict, "model_version", None)
+    # a watcher that never wakes up during the test
+    monkeypatch.setattr(predict, "registry_watcher", None)
+    monkeypatch.setattr(predict, "FER_REGISTRY_POLL_SECONDS", 3600)
+    return registry
+
+
+def test_register_copies_the_model(registry):
+    meta = registry.get("v1")
+    assert meta["engine"] == "onnx" and meta["file"] == "model.onnx"
+    assert [meta["version"] for meta in registry.versions()] == ["v1", "v2", "v3"]
+    assert registry.active is None
+
+
+def test_register_rejects_duplicate_and_invalid_versions(registry, tmp_path):
+    with pytest.raises(ModelVersionError):
+        registry.register(str(tmp_path / "model.onnx"), "onnx", "v1")
+    with pytest.raises(ModelVersionError):
+        registry.register(str(tmp_path / "model.onnx"), "onnx", "../v4")
+    with pytest.raises(ModelVersionError):
+        registry.get("v4")
+    with pytest.raises(ModelVersionError):
+        registry.register(str(tmp_path / "model.onnx"), "onnx", DEFAULT_VERSION)
+
+
+def test_rollback_walks_back_through_promotions(registry):
+    for version in ("v1", "v2", "v3"):
+        registry.set_active(version)
+    assert registry.active == "v3"
+    assert registry.previous() == "v2"
+
+    registry.set_active(registry.previous(), rollback=True)
+    assert registry.active == "v2"
+    assert registry.previous() == "v1"
+    registry.set_active(registry.previous(), rollback=True)
+    assert registry.active == "v1"
+    # the first promotion replaced the default model
+    assert registry.previous() == DEFAULT_VERSION
+    registry.set_active(registry.previous(), rollback=True)
+    assert registry.active == DEFAULT_VERSION
+    assert registry.previous() is None
+
+
+def test_swap_model_promotes_and_rolls_back(serving):
+    assert predict.swap_model("v1") == "v1"
+    assert predict.swap_model("v2") == "v2"
+    assert (serving.active, predict.model_version, predict.model.path) == ("v2", "v2", "v2")
+
+    assert predict.swap_model(rollback=True) == "v1"
+    assert (serving.active, predict.model_version) == ("v1", "v1")
+    assert predict.swap_model(rollback=True) == DEFAULT_VERSION
+    assert (serving.active, predict.model_version) == (DEFAULT_VERSION, DEFAULT_VERSION)
+    with pytest.raises(ModelVersionError):
+        predict.swap_model(rollback=True)
+    # a failed rollback leaves serving alone
+    assert predict.model_version == DEFAULT_VERSION
+
+
+def test_swap_before_first_inference_starts_the_watcher(serving):
+    predict.swap_model("v1")
+    assert predict.registry_watcher is not None and predict.registry_watcher.is_alive()
+    assert predict.get_model().path == "v1"
+
+
+def test_worker_follows_a_swap_made_by_another_worker(serving):
+    predict.swap_model("v1")
+    # another process promotes v2 through its own registry instance
+    ModelRegistry(serving.root).set_active("v2")
+
+    assert predict.sync_with_registry()
+    assert predict.model_version == "v2"
+    assert not predict.sync_with_registry()
@@ -0,0 +1,78 @@
+import numpy as np
+
+from eegsensor.bandpower import BANDS, BandPowerBuffer
+from eegsensor.ringbuffer import RingBuffer, StreamBuffers
+
+
+def filled(count: int, capacity: int = 4) -> RingBuffer:
+    buffer = RingBuffer(["a", "b"], capacity)
+    for i in range(count):
+        buffer.append([i, -i], timestamp=float(i))
+    return buffer
+
+
+def test_empty_buffer():
+    buffer = filled(0)
+    times, values = buffer.latest()
+    assert len(buffer) == 0
+    assert times.shape == (0,) and values.shape == (0, 2)
+
+
+def test_latest_before_wraparound():
+    times, values = filled(3).latest()
+    assert times.tolist() == [0, 1, 2]
+    assert values[:, 0].tolist() == [0, 1, 2]
+
+
+def test_latest_after_wraparound_is_contiguous_and_ordered():
+    buffer = filled(10)
+    times, values = buffer.latest()
+    assert len(buffer) == 4
+    assert times.tolist() == [6, 7, 8, 9]
+    assert values.tolist() == [[6, -6], [7, -7], [8, -8], [9, -9]]
+    assert buffer.latest(2)[0].tolist() == [8, 9]
+    # views into the storage, not copies
+    assert np.shares_memory(values, buffer.values)
+
+
+def test_window_selects_the_last_seconds():
+    buffer = filled(10)
+    times, _ = buffer.window(2.5, now=9.0)
+    assert times.tolist() == [7, 8, 9]
+    # never more than the buffer holds
+    assert buffer.window(100, now=9.0)[0].tolist() == [6, 7, 8, 9]
+    assert len(buffer.window(1, now=100.0)[0]) == 0
+
+
+def test_stream_buffers_size_by_rate_and_drop_unknown_streams():
+    buffers = StreamBuffers(seconds=2)
+    assert buffers.create("pow", ["x"]).capacity == 16
+    buffers.append("pow", [1.0], 1.0)
+    buffers.append("met", [1.0], 1.0)
+    assert len(buffers.get("pow")) == 1
+    assert buffers.get("met") is None
+
+
+def test_band_power_stats_over_window():
+    band_power = BandPowerBuffer(capacity=8)
+    band_power.set_columns([f"AF3/{band}" for band in ("theta", "alpha", "betaL", "betaH", "gamma")])
+    band_power.append_pow([1, 1, 1, 1, 1], timestamp=1.0)
+    band_power.append_pow([4, 0, 0, 0, 0], timestamp=2.0)
+
+    stats = band_power.stats(10, now=2.0)
+    assert stats["frames"] == 2
+    assert list(stats["bands"]) == list(BANDS)
+    assert stats["bands"]["theta"]["mean"] == 60.0
+    assert stats["bands"]["alpha"]["median"] == 10.0
+
+
+def test_band_power_window_never_mixes_sources():
+    band_power = BandPowerBuffer(capacity=8)
+    band_power.append_bands({"theta": 1.0}, timestamp=1.0)
+    band_power.append_bands({"theta": 1.0}, timestamp=2.0)
+    assert band_power.stats(10, now=2.0)["source"] == "simulated"
+
+    band_power.append_pow([1, 1, 1, 1, 1], timestamp=3.0)
+    stats = band_power.stats(10, now=3.0)
+    assert stats["source"] == "headset"
+    assert stats["frames"] == 1
@@ -0,0 +1,112 @@
+import asyncio
+import functools
+
+import pytest
+
+from eegsensor.aiocortex import Sample
+from eegsensor.sessions import COLLECTING, CONNECTED, SessionError, SessionManager
+
+
+@pytest.fixture
+def manager():
+    return SessionManager("client", "secret", max_sessions=2, reserved=("default",))
+
+
+def test_sessions_are_created_once_per_user(manager):
+    assert manager.session("alice") is manager.session("alice")
+    assert manager.get("bob") is None
+
+
+def test_max_sessions(manager):
+    manager.session("alice")
+    manager.session("bob")
+    with pytest.raises(SessionError):
+        manager.session("carol")
+    # existing users still get theirs
+    assert manager.session("alice").user_id == "alice"
+
+
+def test_reserved_users_are_outside_the_limit(manager):
+    manager.session("alice")
+    manager.session("bob")
+    assert manager.session("default").user_id == "default"
+
+    reserved_first = SessionManager("client", "secret", max_sessions=1, reserved=("default",))
+    reserved_first.session("default")
+    reserved_first.session("alice")
+    with pytest.raises(SessionError):
+        reserved_first.session("bob")
+
+
+def test_headset_claims(manager):
+    alice, bob = manager.session("alice"), manager.session("bob")
+
+    async def main():
+        assert await manager.claim_headset(alice, "INSIGHT-1") == "INSIGHT-1"
+        # claiming again is fine for the holder, not for anyone else
+        assert await manager.claim_headset(alice, "INSIGHT-1") == "INSIGHT-1"
+        with pytest.raises(SessionError):
+            await manager.claim_headset(bob, "INSIGHT-1")
+        manager.release_headset(alice)
+        return await manager.claim_headset(bob, "INSIGHT-1")
+
+    assert asyncio.run(main()) == "INSIGHT-1"
+    assert manager.claims == {"INSIGHT-1": bob}
+
+
+def test_remove_frees_the_user_and_the_headset(manager):
+    alice = manager.session("alice")
+
+    async def main():
+        await manager.claim_headset(alice, "INSIGHT-1")
+        await manager.remove("alice")
+
+    asyncio.run(main())
+    assert manager.get("alice") is None
+    assert manager.claims == {}
+
+
+def test_start_only_accepts_numeric_streams(manager):
+    alice = manager.session("alice")
+    alice.state = CONNECTED
+    with pytest.raises(ValueError):
+        asyncio.run(alice.start(("pow", "com")))
+    assert alice.pumps == {}
+
+
+def test_start_needs_a_connected_session(manager):
+    with pytest.raises(SessionError):
+        asyncio.run(manager.session("alice").start())
+
+
+class TextSamples:
+    """A stream whose samples are not numbers, like com or fac"""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return Sample(1.0, ["push", 0.5])
+
+
+def test_failed_pump_is_logged_and_dropped(manager, caplog):
+    alice = manager.session("alice")
+    alice.state = COLLECTING
+    alice.buffers.create("met", ["action", "power"])
+
+    async def main():
+        task = alice.pumps["met"] = asyncio.create_task(alice._pump("met", TextSamples()))
+        task.add_done_callback(functools.partial(alice._pump_done, "met"))
+        alice.streams = ["met"]
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert alice.pumps == {} and alice.streams == []
+    assert "Stream met of user alice stopped" in caplog.text
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from fer2013 import tracking
+from fer2013.tracking import FaceTracker, box_iou
+
+FRAME = np.zeros((480, 640), dtype=np.uint8)
+
+
+class FakeDetector:
+    """Stands in for the cascade: full-frame detections return full_box, ROI detections return roi_faces"""
+
+    def __init__(self, full_box: tuple, roi_faces: list):
+        self.full_box = full_box
+        self.roi_faces = roi_faces
+        self.full_calls = 0
+        self.roi_calls = []
+
+    def locate_face(self, image, detect_scale, min_face_size):
+        self.full_calls += 1
+        return self.full_box
+
+    def detect_faces(self, image, detect_scale, min_face_size, max_face_size):
+        self.roi_calls.append(image.shape)
+        return np.array(self.roi_faces, dtype=np.int64).reshape(-1, 4)
+
+
+@pytest.fixture
+def detector(monkeypatch):
+    fake = FakeDetector((200, 100, 100, 100), [])
+    monkeypatch.setattr(tracking, "locate_face", fake.locate_face)
+    monkeypatch.setattr(tracking, "detect_faces", fake.detect_faces)
+    return fake
+
+
+def test_box_iou():
+    boxes = np.array([[0, 0, 10, 10], [5, 0, 10, 10], [20, 20, 5, 5]])
+    overlaps = box_iou(boxes, np.array([0, 0, 10, 10]))
+    assert overlaps[0] == pytest.approx(1.0)
+    assert overlaps[1] == pytest.approx(50 / 150)
+    assert overlaps[2] == 0.0
+
+
+def test_tracks_in_the_roi_and_redetects_every_n_frames(detector):
+    tracker = FaceTracker(redetect_every=3, padding=0.5, min_iou=0.3)
+    # the ROI around (200, 100, 100, 100) padded by 50 starts at (150, 50)
+    detector.roi_faces = [(55, 52, 100, 100)]
+
+    assert tracker.locate(FRAME) == (200, 100, 100, 100)
+    assert detector.full_calls == 1
+    # back in frame coordinates
+    assert tracker.locate(FRAME) == (205, 102, 100, 100)
+    # the ROI is the previous box padded by half its size on every side
+    assert detector.roi_calls[0] == (200, 200)
+    tracker.locate(FRAME)
+    tracker.locate(FRAME)
+    assert detector.full_calls == 1
+
+    tracker.locate(FRAME)
+    assert detector.full_calls == 2
+    assert tracker.stats() == {"full_detections": 2, "tracked_frames": 3, "lost": 0}
+
+
+def test_low_overlap_falls_back_to_full_detection(detector):
+    tracker = FaceTracker(redetect_every=10, min_iou=0.5)
+    tracker.locate(FRAME)
+    # a face in the ROI but far from the previous box
+    detector.roi_faces = [(90, 90, 100, 100)]
+
+    assert tracker.locate(FRAME) == (200, 100, 100, 100)
+    assert detector.full_calls == 2
+    assert tracker.lost == 1
+
+
+def test_no_face_in_roi_falls_back_to_full_detection(detector):
+    tracker = FaceTracker(redetect_every=10)
+    tracker.locate(FRAME)
+    detector.roi_faces = []
+
+    tracker.locate(FRAME)
+    assert detector.full_calls == 2
+    assert tracker.lost == 1
+    assert tracker.tracked_frames == 0
+
+
+def test_failed_full_detection_drops_the_track(detector, monkeypatch):
+    tracker = FaceTracker()
+    tracker.locate(FRAME)
+
+    def no_face(*args):
+        raise RuntimeError("No face detected")
+
+    monkeypatch.setattr(tracking, "locate_face", no_face)
+    tracker.frames_since_detection = tracker.redetect_every
+    with pytest.raises(RuntimeError):
+        tracker.locate(FRAME)
+    assert tracker.box is None
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from fer2013.workers import PoolSaturatedError, WorkerPool
+from routes import facial
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(max_workers=1, max_inflight=2)
+    yield pool
+    pool.shutdown()
+
+
+def test_admit_rejects_beyond_max_inflight(pool):
+    with pool.admit():
+        with pool.admit():
+            assert pool.inflight == 2
+            with pytest.raises(PoolSaturatedError):
+                with pool.admit():
+                    pass
+    assert pool.inflight == 0
+    assert pool.rejected == 1
+
+
+def test_admit_reserves_one_slot_per_image(pool):
+    with pool.admit():
+        with pytest.raises(PoolSaturatedError):
+            with pool.admit(2):
+                pass
+
+
+def test_request_larger_than_the_limit_is_clamped(pool):
+    # admitted once the pipeline is empty, instead of never
+    with pool.admit(10):
+        assert pool.inflight == 2
+    assert pool.inflight == 0
+    with pool.admit():
+        with pytest.raises(PoolSaturatedError):
+            with pool.admit(10):
+                pass
+
+
+def test_slots_are_released_when_the_request_fails(pool):
+    with pytest.raises(ValueError):
+        with pool.admit(2):
+            raise ValueError("preprocessing failed")
+    assert pool.inflight == 0
+
+
+def test_run_executes_on_a_worker_thread(pool):
+    assert asyncio.run(pool.run(sum, [1, 2, 3])) == 6
+
+
+@pytest.fixture
+def client(pool, monkeypatch):
+    monkeypatch.setattr(facial, "worker_pool", pool)
+    app = FastAPI()
+    app.include_router(facial.router)
+    return TestClient(app)
+
+
+def test_saturated_pool_answers_503(pool, client):
+    with pool.admit(2):
+        response = client.post("/", json={"image": "aGVsbG8="})
+        batch_response = client.post("/batch", json={"images": ["aGVsbG8="]})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert batch_response.status_code == 503
+    assert pool.rejected == 2
+
+
+def test_batch_larger_than_the_limit_is_served_when_idle(pool, client):
+    # not images, every one fails preprocessing, but the request gets through admission
+    response = client.post("/batch", json={"images": ["aGVsbG8="] * 5})
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 5
+    assert pool.rejected == 0
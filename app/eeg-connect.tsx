@@ -1,4 +1,4 @@
-import { getApiUrl } from '@/config/local';
+import { API_ENDPOINTS, getApiUrl } from '@/config/local';
 import AsyncStorage from '@react-native-async-storage/async-storage';
 import { useRouter } from 'expo-router';
 import React, { useState } from 'react';
@@ -76,7 +76,6 @@ export default function EEGBandPowerVisualization() {
       // Start data collection
       await fetch(getApiUrl('/eeg/start-collection'), { method: 'POST' });
       
-      const collectedData: EEGBandData[][] = [];
       const duration = 10;
       let remaining = duration;
 
@@ -87,21 +86,13 @@ export default function EEGBandPowerVisualization() {
         if (remaining <= 0) clearInterval(timer);
       }, 1000);
 
-      // Collect data every second
-      for (let i = 0; i < duration; i++) {
-        try {
-          const response = await fetch(getApiUrl('/eeg/bandpower'));
-          if (response.ok) {
-            const data = await response.json();
-            collectedData.push(data);
-          } else {
-            console.warn("Non-OK response at step", i);
-          }
-        } catch (error) {
-          console.warn("Fetch failed at step", i, error);
-        }
-        await new Promise(resolve => setTimeout(resolve, 1000));
+      // The server keeps every band power frame, wait for the window to fill then fetch its averages once
+      await new Promise(resolve => setTimeout(resolve, duration * 1000));
+      const response = await fetch(getApiUrl(`${API_ENDPOINTS.EEG_BANDPOWER_WINDOW}?seconds=${duration}`));
+      if (!response.ok) {
+        throw new Error(`Band power window request failed: ${response.status}`);
       }
+      const windowData = await response.json();
 
       // Stop data collection after 10 seconds
       await fetch(getApiUrl('/eeg/stop-collection'), { method: 'POST' });
@@ -111,8 +102,12 @@ export default function EEGBandPowerVisualization() {
       setCountdown(0);
       setStatus('EEG analysis complete! Ready for facial scan.');
       
-      // Calculate and store data but don't display it
-      const averaged = calculateAverages(collectedData);
+      // Store data but don't display it
+      const averaged: EEGBandData[] = windowData.bands.map((entry: EEGBandData) => ({
+        band: entry.band,
+        percentage: entry.percentage,
+        description: entry.description || bandDescriptions[entry.band as keyof typeof bandDescriptions] || "No description",
+      }));
       setAveragedData(averaged);
       setAnalysisComplete(true);
       
@@ -128,32 +123,6 @@ export default function EEGBandPowerVisualization() {
     }
   };
 
-  // Calculate averages function (keep for data processing)
-  const calculateAverages = (dataList: EEGBandData[][]): EEGBandData[] => {
-    const bandSums: { [key: string]: number } = {};
-    const bandCounts: { [key: string]: number } = {};
-
-    for (const snapshot of dataList) {
-      for (const entry of snapshot) {
-        const band = entry.band;
-        const value = entry.percentage;
-        bandSums[band] = (bandSums[band] || 0) + value;
-        bandCounts[band] = (bandCounts[band] || 0) + 1;
-      }
-    }
-
-    const averaged: EEGBandData[] = [];
-    for (const band in bandSums) {
-      averaged.push({
-        band: band,
-        percentage: +(bandSums[band] / bandCounts[band]).toFixed(2),
-        description: bandDescriptions[band as keyof typeof bandDescriptions] || "No description"
-      });
-    }
-
-    return averaged;
-  };
-
   const proceedToFacialScan = () => {
     if (averagedData.length === 0) {
       Alert.alert('No Data', 'Please complete EEG analysis first');
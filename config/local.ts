@@ -31,6 +31,7 @@ export const API_ENDPOINTS = {
   // EEG connection
   EEG_CONNECT: '/eeg/connect',
   EEG_BANDPOWER: '/eeg/bandpower',
+  EEG_BANDPOWER_WINDOW: '/eeg/bandpower/window',
   EEG_STATUS: '/eeg/status',
   EEG_AVAILABLE:'/eeg/available', //check availability of headset
   EEG_STARTDATA: '/eeg/start-collection',